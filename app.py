@@ -1,25 +1,87 @@
 # app.py (Definitive Final Version)
 
-import os, re, json, pandas as pd, zipfile, tempfile, shutil, uuid, threading, requests
-from flask import Flask, request, render_template, flash, redirect, url_for, send_from_directory, session, jsonify
+import os, re, json, shutil, uuid, threading, traceback, functools
+from flask import Flask, Request, request, has_request_context, render_template, flash, redirect, url_for, send_from_directory, send_file, session, jsonify
 
-from werkzeug.utils import secure_filename
+from werkzeug.utils import secure_filename, safe_join
 
-from excel_processor import process_excel_file
-from longines_processor import process_longines_file
-from google_drive_finder import authenticate_google_drive, find_image_links_for_df, update_google_sheet, read_sheet_data
-from slice_processor import process_slice_folder
-from text_processor import parse_pasted_data, process_local_data
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+import drive_watcher
+import job_registry
+import storage_manager
+import upload_guard
+from upload_guard import UploadRejected
+import task_control
+import task_metrics
+from task_metrics import timed_stage, timed_call
+
+from processor_registry import get_processor
+from sheet_fanout import parse_targets
+
+# 注意：pandas / googleapiclient / Pillow 等重量级依赖都在任务函数内部按需导入，
+# 这样首页可以在不加载它们的情况下立即渲染，第一次执行对应类型的任务时才付出导入成本。
 
 # --- App Initialization and Config ---
+class StreamingRequest(Request):
+    # 让 Werkzeug 把上传内容直接流式写入 uploads/ 目录，保存时只需重命名，不再二次拷贝
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return upload_guard.spool_file(app.config['UPLOAD_FOLDER'])
+
 app = Flask(__name__)
+app.request_class = StreamingRequest
 # --- 核心修改：在这里增加一行 SERVER_NAME 配置 ---
 app.config.update(
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'),
     OUTPUT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outputs'),
     SECRET_KEY='your_very_secret_and_unique_key_12345',
     TEMPLATES_AUTO_RELOAD=True,
-    SERVER_NAME='127.0.0.1:5000' # 明确告知服务器地址
+    SERVER_NAME='127.0.0.1:5000', # 明确告知服务器地址
+    # --- 产物生命周期：超过 TTL 的上传/输出文件会被后台线程清理，目录总大小受配额限制 ---
+    STORAGE_TTL_SECONDS=24 * 3600,
+    STORAGE_QUOTA_BYTES=5 * 1024 ** 3,
+    STORAGE_SWEEP_INTERVAL=10 * 60,
+    # --- 上传限制：超过 MAX_CONTENT_LENGTH 的请求会被 Werkzeug 直接以 413 拒绝 ---
+    MAX_CONTENT_LENGTH=2 * 1024 ** 3,
+    MAX_EXCEL_UPLOAD_BYTES=50 * 1024 ** 2,
+    MAX_ZIP_UPLOAD_BYTES=2 * 1024 ** 3,
+    ZIP_MAX_ENTRIES=5000,
+    ZIP_MAX_UNCOMPRESSED_BYTES=8 * 1024 ** 3,
+    ZIP_MAX_COMPRESSION_RATIO=200,
+    # --- Image Bank 下载器：并行的无头浏览器会话数 ---
+    IMAGEBANK_WORKERS=3,
+    IMAGEBANK_HEADLESS=True,
+    # auto: 优先用登录 Cookie 直连下载，失败的 SKU 再回退到浏览器；也可设为 http / selenium
+    IMAGEBANK_BACKEND='auto',
+    # 下载后生成的网页尺寸 (宽度 px) 与单张大小上限
+    IMAGEBANK_RENDITION_WIDTHS=(1500, 750),
+    IMAGEBANK_RENDITION_MAX_BYTES=300 * 1024,
+    # --- 切图：勾选"切分长图"时，缩放后高于 3000px 的长图按约此高度切块 ---
+    SLICE_TILE_HEIGHT=1500,
+    # --- Mode A 增量同步：每个表格上次同步的行指纹与 Drive 文件列表版本 ---
+    SYNC_STATE_FOLDER=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sync_state'),
+    # --- Drive 监听：轮询 Drive 变更，已同步过的表格在有新图片时自动增量同步；出错时指数退避 ---
+    WATCH_DRIVE=False,
+    WATCH_INTERVAL_SECONDS=120,
+    WATCH_MAX_BACKOFF_SECONDS=30 * 60,
+    # --- 性能剖析：为 True 时每个任务都剖析；否则只剖析提交时带 profile=1 参数的任务，结果保存到 outputs/ ---
+    PROFILE_TASKS=False,
+    # --- 任务去重：相同输入与设置的任务只执行一次，已完成任务的产物在此时间内直接复用 (应小于 STORAGE_TTL_SECONDS) ---
+    JOB_REUSE_SECONDS=2 * 3600,
+    # --- 链接校验：生成链接后并发请求一遍，报告无法公开访问的图片 (项目配置 "verify_links": true 可单独开启) ---
+    VERIFY_LINKS=False,
+    LINK_VERIFY_WORKERS=16,
+    LINK_VERIFY_TIMEOUT=10,
+    # --- 阶段时限 (秒)：阶段运行超过时限的任务在下一个安全点被终止；'total' 为整个任务的时限 ---
+    STAGE_DEADLINES={
+        'total': 2 * 3600,
+        'drive_listing': 15 * 60,
+        'sheet_read': 10 * 60,
+        'sheet_update': 20 * 60,
+        'image_sync': 30 * 60,
+        'slice_processing': 30 * 60,
+        'link_verification': 10 * 60,
+    },
 )
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
@@ -28,81 +90,212 @@ try:
     with open('config.json', 'r', encoding='utf-8') as f: CONFIG = json.load(f)
 except FileNotFoundError: CONFIG = {}
 
-PROCESSORS = {"longines_processor": process_longines_file, "excel_processor": process_excel_file}
 tasks = {}
 
+def create_task(task_id, status):
+    """登记一个新任务。请求带 profile=1 (或开启了 PROFILE_TASKS) 时，该任务在后台执行时会被性能剖析。"""
+    profile = app.config['PROFILE_TASKS'] or (has_request_context() and request.values.get('profile') == '1')
+    tasks[task_id] = {'status': status, 'progress': 0, 'profile': profile}
+    task_control.register(task_id)
+    return tasks[task_id]
+
+def launch_task(job_key, status, runner, *args, task_id=None, upload_dir=None):
+    """
+    登记任务并在后台线程中启动，返回 (task_id, 是否为重复提交)。
+    输入与设置完全相同的任务正在执行 (或在 JOB_REUSE_SECONDS 内已完成且产物还在) 时不再启动新线程，
+    直接返回已有任务的 task_id，并删除本次上传的目录。
+    """
+    task_id = task_id or str(uuid.uuid4())
+    # 先登记任务再认领任务键：几乎同时到达的重复提交 (双击) 认领失败时，拿到的 task_id 一定已经在 tasks 中
+    create_task(task_id, status)['job_key'] = job_key
+    existing = job_registry.claim(job_key, task_id, app.config['JOB_REUSE_SECONDS'])
+    if existing is not None:
+        del tasks[task_id]
+        task_control.release(task_id)
+        if upload_dir:
+            storage_manager.remove_path(upload_dir)
+        counters = tasks[existing].setdefault('counters', {})
+        counters['duplicate_submissions'] = counters.get('duplicate_submissions', 0) + 1
+        print(f"♻️ 重复提交，复用任务 {existing}")
+        return existing, True
+    if upload_dir:
+        storage_manager.mark_active(upload_dir)
+    threading.Thread(target=runner, args=(task_id, *args)).start()
+    return task_id, False
+
+def task_response(task_id, deduplicated):
+    return jsonify({'task_id': task_id, 'deduplicated': deduplicated})
+
+def background_task(kind):
+    """
+    后台任务装饰器：进入应用上下文，把任务状态绑定为计数器的上下文 (incr() 记到该任务上)，
+    记录总耗时，并在需要时对任务做性能剖析。同时绑定取消令牌与各阶段时限 (见 task_control)。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(task_id, *args, **kwargs):
+            task = task_metrics.bind(tasks[task_id], kind)
+            token = task_control.bind(task_id, task, app.config['STAGE_DEADLINES'])
+            try:
+                with app.app_context():
+                    with task_metrics.profile_task(task, app.config['OUTPUT_FOLDER'], f"{kind}_{task_id[:8]}"), \
+                            timed_stage(task, 'total'):
+                        func(task_id, *args, **kwargs)
+                    if task.get('profile_file'):
+                        task['profile_url'] = url_for('download_processed_zip', filename=task['profile_file'])
+            finally:
+                task_control.release(task_id)
+                # 任务函数把 TaskCancelled 当作普通错误处理，这里改写为取消 / 超时的状态
+                if token['event'].is_set() and task.get('result') != 'success':
+                    if token['timed_out']:
+                        task.update({'status': f"任务超时: {token['reason']}", 'progress': 100, 'result': 'error'})
+                    else:
+                        task.update({'status': '任务已取消。', 'progress': 100, 'result': 'cancelled'})
+                # 成功且产物在 outputs/ 中的任务留给重复提交复用；其余任务结束后不再合并新的提交
+                artifacts = []
+                if task.get('result') == 'success' and task.get('output_file'):
+                    artifacts.append(os.path.join(app.config['OUTPUT_FOLDER'], task['output_file']))
+                job_registry.finish(task.get('job_key'), task_id, artifacts)
+        return wrapper
+    return decorator
+
+def verify_task_links(task, df, project_config):
+    """可选的链接校验阶段：报告写入 task['link_check']，有失效链接时追加警告 (不影响任务结果)。"""
+    if not (app.config['VERIFY_LINKS'] or project_config.get('verify_links')):
+        return
+    from google_drive_finder import link_columns
+    from link_verifier import verify_frame_links
+
+    task.update({'status': '正在校验图片链接是否可以公开访问...'})
+    report = timed_call(task, 'link_verification', verify_frame_links, df, link_columns(project_config),
+                        app.config['LINK_VERIFY_WORKERS'], app.config['LINK_VERIFY_TIMEOUT'])
+    task['link_check'] = report
+    if report['failed']:
+        message = f"{report['failed']} / {report['checked']} 个图片链接无法访问 (可能未公开共享)，详见 link_check。"
+        task['warning'] = f"{task['warning']} {message}" if task.get('warning') else message
+
 # --- Background Task Runners ---
+@background_task('data')
 def run_data_task(task_id, input_path, project_type, spreadsheet_id):
     # --- 核心修改1：为后台任务包裹上应用上下文 ---
     with app.app_context():
         try:
-            project_config = CONFIG[project_type]
-            tasks[task_id] = {'status': '正在初步处理Excel文件...', 'progress': 10}
-            processor_function = PROCESSORS.get(project_config['processor'])
-            processed_df = processor_function(input_path)
-            if processed_df is None or processed_df.empty:
-                raise ValueError("处理Excel文件时出错，或未生成有效数据。")
-
-            tasks[task_id]['status'] = '正在连接Google并获取授权...'
-            tasks[task_id]['progress'] = 30
-            creds = authenticate_google_drive()
+            from google_drive_finder import authenticate_google_drive, build_image_index, apply_image_links, project_link_format, update_google_sheet
 
-            tasks[task_id]['status'] = '正在查找Google Drive图片链接...'
-            tasks[task_id]['progress'] = 50
-            final_df = find_image_links_for_df(processed_df.copy(), project_config, creds)
-            if final_df is None:
-                raise ValueError("查找Google Drive图片时发生错误。")
-            
-            tasks[task_id]['status'] = '正在更新Google Sheet (此步可能较慢)...'
-            tasks[task_id]['progress'] = 80
-            success = update_google_sheet(spreadsheet_id, final_df, creds)
-            if not success:
-                raise ValueError("更新Google Sheet失败。")
+            project_config = CONFIG[project_type]
+            task = tasks[task_id]
+            task.update({'status': '正在处理Excel文件，同时连接Google并读取Drive文件列表...', 'progress': 10})
+            processor_function = get_processor(project_config['processor'])
+
+            # 授权和 Drive 文件列表不依赖 Excel 的结果，与 Excel 解析并行执行，最后按 SKU 汇合
+            def load_drive_index():
+                creds = timed_call(task, 'google_auth', authenticate_google_drive)
+                image_index = timed_call(task, 'drive_listing', build_image_index, project_config, creds)
+                return creds, image_index
+
+            pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f'data-{task_id[:8]}')
+            excel_future = task_metrics.submit(pool, timed_call, task, 'excel_processing', processor_function, input_path)
+            try:
+                drive_future = task_metrics.submit(pool, load_drive_index)
+
+                processed_df = task_control.result(excel_future)
+                if processed_df is None or processed_df.empty:
+                    raise ValueError("处理Excel文件时出错，或未生成有效数据。")
+                task.update({'status': 'Excel处理完成，正在等待Google Drive文件列表...', 'progress': 40})
+
+                try:
+                    creds, image_index = task_control.result(drive_future)
+                    if image_index is None:
+                        # 与原流程保持一致：找不到文件夹时仍然回写数据，只是不带图片链接
+                        task['warning'] = '在Google Drive中找不到项目文件夹或其 产品图/场景图 子文件夹，未填充图片链接。'
+                except task_control.TaskCancelled:
+                    raise
+                except Exception as e:
+                    # 授权或读取文件列表出错时同样只回写数据；回写前需要凭证，下面会重新授权一次
+                    print("连接Google Drive或读取文件列表时发生严重错误:")
+                    traceback.print_exc()
+                    creds, image_index = None, None
+                    task['warning'] = f'读取Google Drive文件列表失败 ({e})，未填充图片链接。'
+
+                task.update({'status': '正在匹配图片链接...', 'progress': 60})
+                with timed_stage(task, 'link_matching'):
+                    final_df = apply_image_links(processed_df, image_index, project_link_format(project_config))
+                if image_index is not None:
+                    verify_task_links(task, final_df, project_config)
+
+                task.update({'status': '正在更新Google Sheet (此步可能较慢)...', 'progress': 80})
+                if creds is None:
+                    creds = timed_call(task, 'google_auth', authenticate_google_drive)
+                with timed_stage(task, 'sheet_update'):
+                    success = update_google_sheet(spreadsheet_id, final_df, creds)
+                if not success:
+                    raise ValueError("更新Google Sheet失败。")
+            finally:
+                # 不必等待 Drive 列表线程结束；但 Excel 线程还在读取上传的文件，必须等它结束后才能删除任务目录
+                pool.shutdown(wait=False, cancel_futures=True)
+                wait_futures([excel_future])
 
             tasks[task_id].update({'status': '任务完成！', 'progress': 100, 'result': 'success'})
         except Exception as e:
             tasks[task_id].update({'status': f'任务失败: {str(e)}', 'progress': 100, 'result': 'error'})
+        finally:
+            # 上传的 Excel 只是中间文件，任务结束后连同任务目录一起删除
+            storage_manager.release(os.path.dirname(input_path), delete=True)
 
-def run_slice_task(task_id, zip_path):
+@background_task('slice')
+def run_slice_task(task_id, zip_path, multi_rendition=False, tile_long_images=False):
     # --- 核心修改2：为切图任务也包裹上应用上下文 ---
     with app.app_context():
         try:
-            tasks[task_id] = {'status': '正在解压文件...', 'progress': 10}
+            from slice_processor import process_slice_folder, DEFAULT_RENDITIONS
+
+            tasks[task_id].update({'status': '正在解压文件...', 'progress': 10})
             extract_dir = os.path.join(os.path.dirname(zip_path), 'extracted_slices')
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
+            with timed_stage(tasks[task_id], 'extract'):
+                upload_guard.safe_extract(zip_path, extract_dir, app.config['ZIP_MAX_UNCOMPRESSED_BYTES'])
 
             image_folder = extract_dir
             unzipped_items = os.listdir(extract_dir)
             if len(unzipped_items) == 1 and os.path.isdir(os.path.join(extract_dir, unzipped_items[0])):
                 image_folder = os.path.join(extract_dir, unzipped_items[0])
 
-            tasks[task_id] = {'status': '正在重命名和压缩图片...', 'progress': 40}
-            process_slice_folder(image_folder)
+            tasks[task_id].update({'status': '正在重命名和压缩图片...', 'progress': 40})
+            renditions = app.config.get('SLICE_RENDITIONS', DEFAULT_RENDITIONS) if multi_rendition else None
+            tile_height = app.config['SLICE_TILE_HEIGHT'] if tile_long_images else None
+            with timed_stage(tasks[task_id], 'slice_processing'):
+                process_slice_folder(image_folder, renditions, tile_height)
 
-            tasks[task_id] = {'status': '正在重新打包为ZIP...', 'progress': 90}
-            output_zip_name = f"processed_{os.path.splitext(os.path.basename(zip_path))[0]}"
+            tasks[task_id].update({'status': '正在重新打包为ZIP...', 'progress': 90})
+            output_zip_name = storage_manager.unique_output_name('processed', os.path.basename(zip_path), '', task_id)
             output_zip_path_base = os.path.join(app.config['OUTPUT_FOLDER'], output_zip_name)
-            shutil.make_archive(output_zip_path_base, 'zip', image_folder)
+            with timed_stage(tasks[task_id], 'archive'):
+                archive_path = shutil.make_archive(output_zip_path_base, 'zip', image_folder)
+            task_metrics.incr('bytes_written', os.path.getsize(archive_path))
 
             tasks[task_id].update({
                 'status': '任务完成！准备下载...', 'progress': 100, 'result': 'success',
-                'download_url': url_for('download_processed_zip', filename=f"{output_zip_name}.zip")
+                'download_url': url_for('download_processed_zip', filename=f"{output_zip_name}.zip"),
+                'output_file': f"{output_zip_name}.zip",
             })
         except Exception as e:
             tasks[task_id].update({'status': f'任务失败: {str(e)}', 'progress': 100, 'result': 'error'})
         finally:
-            if os.path.exists(zip_path): os.remove(zip_path)
-            if 'extract_dir' in locals() and os.path.exists(extract_dir): shutil.rmtree(extract_dir)
+            # 任务目录中包含上传的 ZIP 和解压出的切图，一并删除
+            storage_manager.release(os.path.dirname(zip_path), delete=True)
 
 # --- NEW: Cloud Sync Task Runner (Mode A) ---
-def run_cloud_sync_task(task_id, spreadsheet_id, project_type):
+@background_task('cloud_sync')
+def run_cloud_sync_task(task_id, spreadsheet_id, project_type, full_sync=False):
     with app.app_context():
         try:
+            from google_drive_finder import authenticate_google_drive, read_sheet_data
+            from sync_state import sync_image_links
+
             print(f"[{task_id}] 开始云端同步任务...", flush=True)
             project_config = CONFIG[project_type]
-            tasks[task_id] = {'status': '正在连接Google并获取授权...', 'progress': 10}
-            creds = authenticate_google_drive()
+            task = tasks[task_id]
+            task.update({'status': '正在连接Google并获取授权...', 'progress': 10})
+            creds = timed_call(task, 'google_auth', authenticate_google_drive)
             
             tasks[task_id]['status'] = '正在读取 Google Sheet 数据...'
             tasks[task_id]['progress'] = 30
@@ -111,7 +304,7 @@ def run_cloud_sync_task(task_id, spreadsheet_id, project_type):
             # 这里简化处理，读取默认 Sheet1，或者我们可以让 update_google_sheet 自动处理
             # 为了稳健性，先读取数据到 DF
             # 注意：read_sheet_data 现在会自动探测 Sheet 名称
-            current_df = read_sheet_data(spreadsheet_id, creds)
+            current_df = timed_call(task, 'sheet_read', read_sheet_data, spreadsheet_id, creds)
             
             if current_df is None or current_df.empty:
                  print(f"[{task_id}] read_sheet_data 返回空 DataFrame", flush=True)
@@ -139,21 +332,23 @@ def run_cloud_sync_task(task_id, spreadsheet_id, project_type):
                  print(f"[{task_id}] 列名匹配失败。现有列: {current_df.columns.tolist()}", flush=True)
                  raise ValueError("表格中找不到关键列 'SKU' 或 'model_sku'，无法匹配图片。")
 
-            final_df = find_image_links_for_df(current_df, project_config, creds)
-            
-            # 如果我们重命名了列，写入前最好改回来，或者就保留 standard name，
-            # 鉴于 Mode A 是“回写”，最好保留用户习惯。
-            # 但 update_google_sheet 是全覆写，所以这里改了列名会写回去。
-            # 暂时保持 'model_sku'，因为系统后续流程可能都认这个。
-            
-            tasks[task_id]['status'] = '正在回写数据到 Google Sheet...'
-            tasks[task_id]['progress'] = 90
-            success = update_google_sheet(spreadsheet_id, final_df, creds)
-            
-            if not success:
-                raise ValueError("回写数据失败。")
-
-            tasks[task_id].update({'status': '同步完成！图片链接已更新。', 'progress': 100, 'result': 'success'})
+            # 有上次同步的状态时只重新查找新增/改动/缺图的行，并只回写变化的单元格；
+            # 第一次同步 (或勾选了完整同步) 时整表覆写，此时重命名后的 'model_sku' 列名会写回表格。
+            tasks[task_id]['status'] = '正在查找图片链接并回写变化的数据...'
+            tasks[task_id]['progress'] = 70
+            summary = timed_call(task, 'image_sync', sync_image_links, spreadsheet_id, current_df, project_config, creds,
+                                 app.config['SYNC_STATE_FOLDER'], full_sync)
+            task['sync'] = summary
+            if summary.get('warning'):
+                task['warning'] = summary['warning']
+            elif summary['mode'] != 'skipped':
+                drive_watcher.register_sheet(app.config['SYNC_STATE_FOLDER'], spreadsheet_id, project_type)
+
+            if summary['mode'] == 'incremental':
+                message = f"同步完成！重新匹配 {summary['refreshed']} 行，跳过 {summary['skipped']} 行，更新 {summary['cells_written']} 个单元格。"
+            else:
+                message = '同步完成！图片链接已更新。'
+            tasks[task_id].update({'status': message, 'progress': 100, 'result': 'success'})
             print(f"[{task_id}] 任务成功完成", flush=True)
             
         except Exception as e:
@@ -161,50 +356,161 @@ def run_cloud_sync_task(task_id, spreadsheet_id, project_type):
             traceback.print_exc()
             tasks[task_id].update({'status': f'同步失败: {str(e)}', 'progress': 100, 'result': 'error'})
 
+@background_task('cloud_fanout')
+def run_cloud_fanout_task(task_id, targets, project_type):
+    """Mode A 的多表格 / 多工作表版本：所有目标一起读取、统一匹配一次、每个表格一次批量回写。"""
+    task = tasks[task_id]
+    try:
+        from google_drive_finder import authenticate_google_drive
+        from sheet_fanout import sync_many
+
+        project_config = CONFIG[project_type]
+        task.update({'status': '正在连接Google并获取授权...', 'progress': 10})
+        creds = timed_call(task, 'google_auth', authenticate_google_drive)
+        if creds is None:
+            raise ValueError("Google 授权失败。")
+
+        task.update({'status': f'正在读取 {len({t["spreadsheet_id"] for t in targets})} 个表格并匹配图片链接...', 'progress': 40})
+        summary = timed_call(task, 'image_sync', sync_many, targets, project_config, creds)
+        task['sync'] = summary
+        if summary.get('warning'):
+            task['warning'] = summary['warning']
+        elif summary['skipped_tabs']:
+            task['warning'] = '以下工作表没有 SKU 列，已跳过: ' + ', '.join(tab['title'] for tab in summary['skipped_tabs'])
+
+        message = (f"同步完成！{summary['spreadsheets']} 个表格、{len(summary['tabs'])} 个工作表，"
+                   f"{summary['unique_skus']} 个不同SKU，更新 {summary['cells_written']} 个单元格。")
+        task.update({'status': message, 'progress': 100, 'result': 'success'})
+    except Exception as e:
+        print(f"[{task_id}] 任务执行出错:", flush=True)
+        traceback.print_exc()
+        task.update({'status': f'同步失败: {str(e)}', 'progress': 100, 'result': 'error'})
+
 # --- NEW: Local Paste Task Runner (Mode B) ---
-def run_local_paste_task(task_id, pasted_text, project_type):
+@background_task('local_paste')
+def run_local_paste_task(task_id, pasted_text, project_type, output_format='xlsx'):
     with app.app_context():
         try:
+            from google_drive_finder import authenticate_google_drive, find_image_links_for_df, link_columns
+            from text_processor import parse_pasted_data, process_local_data
+            from result_writer import write_result_file
+
             project_config = CONFIG[project_type]
-            tasks[task_id] = {'status': '正在解析粘贴的数据...', 'progress': 10}
+            task = tasks[task_id]
+            task.update({'status': '正在解析粘贴的数据...', 'progress': 10})
             
-            raw_df = parse_pasted_data(pasted_text)
-            if raw_df.empty:
-                raise ValueError("解析数据失败，请确保粘贴了有效的Excel数据。")
-                
-            processed_df = process_local_data(raw_df)
+            with timed_stage(task, 'parse'):
+                raw_df = parse_pasted_data(pasted_text)
+                if raw_df.empty:
+                    raise ValueError("解析数据失败，请确保粘贴了有效的Excel数据。")
+                    
+                processed_df = process_local_data(raw_df)
             
             tasks[task_id]['status'] = '正在连接Google并获取授权...'
             tasks[task_id]['progress'] = 30
-            creds = authenticate_google_drive()
+            creds = timed_call(task, 'google_auth', authenticate_google_drive)
             
             tasks[task_id]['status'] = '正在查找图片链接...'
             tasks[task_id]['progress'] = 60
-            final_df = find_image_links_for_df(processed_df, project_config, creds)
+            final_df = timed_call(task, 'image_lookup', find_image_links_for_df, processed_df, project_config, creds)
+            verify_task_links(task, final_df, project_config)
             
-            tasks[task_id]['status'] = '正在生成Excel文件...'
+            tasks[task_id]['status'] = f'正在生成{output_format.upper()}文件...'
             tasks[task_id]['progress'] = 90
             
-            output_filename = f"processed_paste_{uuid.uuid4().hex[:8]}.xlsx"
-            output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
-            final_df.to_excel(output_path, index=False)
+            output_name = storage_manager.unique_output_name('processed_paste', '', '', task_id)
+            output_path = timed_call(task, 'export', write_result_file, final_df, os.path.join(app.config['OUTPUT_FOLDER'], output_name),
+                                     output_format, link_columns(project_config))
+            output_filename = os.path.basename(output_path)
             
             tasks[task_id].update({
                 'status': '处理完成！准备下载...', 
                 'progress': 100, 
                 'result': 'success',
-                'download_url': url_for('download_processed_zip', filename=output_filename) # 复用路由，只要是文件都在 output 目录
+                'download_url': url_for('download_processed_zip', filename=output_filename), # 复用路由，只要是文件都在 output 目录
+                'output_file': output_filename,
             })
             
         except Exception as e:
-            import traceback
             traceback.print_exc()
             tasks[task_id].update({'status': f'处理失败: {str(e)}', 'progress': 100, 'result': 'error'})
 
+# --- Image Bank Download Task Runner ---
+@background_task('image_download')
+def run_image_download_task(task_id, skus, zip_filename, make_renditions=True):
+    with app.app_context():
+        task_dir = storage_manager.task_upload_dir(app.config['UPLOAD_FOLDER'], task_id)
+        storage_manager.mark_active(task_dir)
+        try:
+            from image_downloader import download_batch
+
+            task = tasks[task_id]
+            task.update({'status': f'正在启动浏览器并登录 Image Bank (共 {len(skus)} 个SKU)...', 'progress': 5})
+
+            def on_progress(done, total, sku, result):
+                state = '✅' if result['ok'] else f"❌ {result['error']}"
+                task.update({'status': f'[{done}/{total}] {sku} {state}', 'progress': 5 + int(85 * done / total)})
+
+            with timed_stage(task, 'imagebank_download'):
+                results = download_batch(
+                    skus, os.path.join(task_dir, 'downloads'),
+                    workers=app.config['IMAGEBANK_WORKERS'], headless=app.config['IMAGEBANK_HEADLESS'],
+                    progress_callback=on_progress, backend=app.config['IMAGEBANK_BACKEND']
+                )
+            task['results'] = {sku: {k: v for k, v in r.items() if k != 'path'} for sku, r in results.items()}
+            succeeded = [r['path'] for r in results.values() if r['ok']]
+            task_metrics.incr('skus_downloaded', len(succeeded))
+            if not succeeded:
+                raise ValueError("所有SKU都下载失败，请检查型号或网络。")
+
+            if make_renditions:
+                from asset_pipeline import process_asset_zip
+
+                task.update({'status': '正在转换并生成网页尺寸图片...', 'progress': 90})
+                asset_timings = []
+                with timed_stage(task, 'asset_renditions'):
+                    for sku, r in results.items():
+                        if not r['ok']:
+                            continue
+                        asset_results = process_asset_zip(
+                            r['path'], os.path.join(task_dir, 'downloads', 'web', sku), sku,
+                            app.config['IMAGEBANK_RENDITION_WIDTHS'], app.config['IMAGEBANK_RENDITION_MAX_BYTES']
+                        )
+                        asset_timings.extend({k: v for k, v in a.items() if k != 'outputs'} for a in asset_results)
+                        # 图片在子进程中编码，计数器按返回结果在这里累加
+                        for a in asset_results:
+                            task_metrics.incr('images_encoded', len(a['outputs']))
+                            task_metrics.incr('bytes_written', sum(o['bytes'] for o in a['outputs']))
+                task['asset_timings'] = asset_timings
+
+            task.update({'status': '正在打包下载结果...', 'progress': 95})
+            output_zip_name = storage_manager.unique_output_name('imagebank', zip_filename or skus[0], '', task_id)
+            with timed_stage(task, 'archive'):
+                archive_path = shutil.make_archive(os.path.join(app.config['OUTPUT_FOLDER'], output_zip_name), 'zip', os.path.join(task_dir, 'downloads'))
+            task_metrics.incr('bytes_written', os.path.getsize(archive_path))
+
+            task.update({
+                'status': f'下载完成！成功 {len(succeeded)}/{len(skus)} 个SKU。', 'progress': 100, 'result': 'success',
+                'download_url': url_for('download_processed_zip', filename=f"{output_zip_name}.zip"),
+                'output_file': f"{output_zip_name}.zip",
+            })
+        except Exception as e:
+            traceback.print_exc()
+            tasks[task_id].update({'status': f'下载失败: {str(e)}', 'progress': 100, 'result': 'error'})
+        finally:
+            storage_manager.release(task_dir, delete=True)
+
 # --- Helper Functions ---
 def validate_excel_file(file_path, project_config):
-    # ... (code for this function)
-    return True, "Validation successful" # Placeholder for brevity
+    """上传落盘后立即按项目配置检查工作表与表头 (只读流式打开，不加载数据)，不合格的文件不会进入后台任务。"""
+    try:
+        upload_guard.inspect_workbook(
+            file_path, project_config.get('required_sheets', []),
+            project_config.get('required_columns'), project_config.get('header_row', 0)
+        )
+    except UploadRejected as e:
+        return False, str(e)
+    return True, "Validation successful"
 
 def extract_spreadsheet_id(url):
     # ... (code for this function)
@@ -223,24 +529,30 @@ def upload_file():
 
         if not all([project_type, gsheet_url, file, file.filename]):
             return jsonify({'error': '所有字段均为必填项！'}), 400
+        if project_type not in CONFIG:
+            return jsonify({'error': f"未知的项目类型: {project_type}"}), 400
         
         spreadsheet_id = extract_spreadsheet_id(gsheet_url)
         if not spreadsheet_id:
             return jsonify({'error': '无效的Google Sheet链接！'}), 400
 
-        filename = secure_filename(file.filename)
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(input_path)
+        task_id = str(uuid.uuid4())
+        task_dir = storage_manager.task_upload_dir(app.config['UPLOAD_FOLDER'], task_id)
+        input_path = os.path.join(task_dir, secure_filename(file.filename) or 'upload.xlsx')
+        try:
+            upload_guard.save_upload_stream(file, input_path, app.config['MAX_EXCEL_UPLOAD_BYTES'])
+        except UploadRejected as e:
+            storage_manager.remove_path(task_dir)
+            return jsonify({'error': str(e)}), 400
         
         is_valid, message = validate_excel_file(input_path, CONFIG[project_type])
         if not is_valid:
+            storage_manager.remove_path(task_dir)
             return jsonify({'error': f"文件校验失败: {message}"}), 400
         
-        task_id = str(uuid.uuid4())
-        tasks[task_id] = {'status': '数据任务已创建...', 'progress': 0}
-        thread = threading.Thread(target=run_data_task, args=(task_id, input_path, project_type, spreadsheet_id))
-        thread.start()
-        return jsonify({'task_id': task_id})
+        key = job_registry.job_key('data', {'project_type': project_type, 'spreadsheet_id': spreadsheet_id}, path=input_path)
+        return task_response(*launch_task(key, '数据任务已创建...', run_data_task, input_path, project_type, spreadsheet_id,
+                                          task_id=task_id, upload_dir=task_dir))
 
     context = {"config": CONFIG, "project_type": session.get('project_type'), "gsheet_url": session.get('gsheet_url')}
     return render_template('index.html', **context)
@@ -249,51 +561,76 @@ def upload_file():
 def process_cloud_sync():
     project_type = request.form.get('project_type')
     gsheet_url = request.form.get('gsheet_url')
+    full_sync = request.form.get('full_sync') == 'on'
     
     if not project_type or not gsheet_url:
         return jsonify({'error': '项目类型和 Google Sheet 链接必填！'}), 400
-        
-    spreadsheet_id = extract_spreadsheet_id(gsheet_url)
-    if not spreadsheet_id:
+
+    # 每行一个链接；多个链接或指定了工作表时走多表格同步，单个链接仍然是原来的增量同步 (第一个工作表)
+    targets = parse_targets(gsheet_url)
+    if not targets:
         return jsonify({'error': '无效的Google Sheet链接！'}), 400
-        
-    task_id = str(uuid.uuid4())
-    tasks[task_id] = {'status': '云端同步任务已创建...', 'progress': 0}
-    thread = threading.Thread(target=run_cloud_sync_task, args=(task_id, spreadsheet_id, project_type))
-    thread.start()
-    return jsonify({'task_id': task_id})
+
+    if len(targets) == 1 and targets[0]['gid'] is None and targets[0]['title'] is None:
+        spreadsheet_id = targets[0]['spreadsheet_id']
+        key = cloud_sync_key(spreadsheet_id, project_type, full_sync)
+        return task_response(*launch_task(key, '云端同步任务已创建...', run_cloud_sync_task, spreadsheet_id, project_type, full_sync))
+    key = job_registry.job_key('cloud_fanout', {'project_type': project_type, 'targets': targets})
+    return task_response(*launch_task(key, '云端同步任务已创建...', run_cloud_fanout_task, targets, project_type))
 
 @app.route('/process_local_paste', methods=['POST'])
 def process_local_paste():
     project_type = request.form.get('project_type')
     pasted_text = request.form.get('pasted_text')
+    output_format = request.form.get('output_format', 'xlsx')
+    from result_writer import OUTPUT_FORMATS
     
     if not project_type or not pasted_text:
         return jsonify({'error': '项目类型和粘贴的数据必填！'}), 400
+    if output_format not in OUTPUT_FORMATS:
+        return jsonify({'error': f'不支持的输出格式: {output_format}'}), 400
         
-    task_id = str(uuid.uuid4())
-    tasks[task_id] = {'status': '本地数据处理任务已创建...', 'progress': 0}
-    thread = threading.Thread(target=run_local_paste_task, args=(task_id, pasted_text, project_type))
-    thread.start()
-    return jsonify({'task_id': task_id})
+    key = job_registry.job_key('local_paste', {'project_type': project_type, 'output_format': output_format}, text=pasted_text)
+    return task_response(*launch_task(key, '本地数据处理任务已创建...', run_local_paste_task, pasted_text, project_type, output_format))
 
 @app.route('/process_slices', methods=['POST'])
 def process_slices():
     file = request.files.get('zip_file')
+    multi_rendition = request.form.get('multi_rendition') == 'on'
+    tile_long_images = request.form.get('tile_long_images') == 'on'
     if not file or not file.filename.endswith('.zip'):
         return jsonify({'error': '未选择文件或文件不是ZIP格式'}), 400
 
-    filename = secure_filename(file.filename)
-    zip_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(zip_path)
-
     task_id = str(uuid.uuid4())
-    tasks[task_id] = {'status': '切图任务已创建...', 'progress': 0}
-    thread = threading.Thread(target=run_slice_task, args=(task_id, zip_path))
-    thread.start()
-    return jsonify({'task_id': task_id})
+    task_dir = storage_manager.task_upload_dir(app.config['UPLOAD_FOLDER'], task_id)
+    zip_path = os.path.join(task_dir, secure_filename(file.filename) or 'slices.zip')
+    try:
+        upload_guard.save_upload_stream(file, zip_path, app.config['MAX_ZIP_UPLOAD_BYTES'])
+        # 上传一落盘就检查中央目录，炸弹包/超大包在这里同步拒绝，不会占用后台线程
+        entry_count, total_bytes = upload_guard.inspect_zip_archive(
+            zip_path, app.config['ZIP_MAX_ENTRIES'],
+            app.config['ZIP_MAX_UNCOMPRESSED_BYTES'], app.config['ZIP_MAX_COMPRESSION_RATIO']
+        )
+    except UploadRejected as e:
+        storage_manager.remove_path(task_dir)
+        return jsonify({'error': str(e)}), 400
+
+    key = job_registry.job_key('slice', {'multi_rendition': multi_rendition, 'tile_long_images': tile_long_images}, path=zip_path)
+    return task_response(*launch_task(key, f'切图任务已创建 (共 {entry_count} 个文件)...', run_slice_task, zip_path, multi_rendition,
+                                      tile_long_images, task_id=task_id, upload_dir=task_dir))
 
 # --- Utility Routes ---
+@app.teardown_request
+def cleanup_spooled_uploads(exc):
+    # 只有解析过表单的请求才会有落盘文件，避免在这里触发表单解析
+    if 'files' in request.__dict__:
+        upload_guard.discard_spooled(request.files)
+
+@app.errorhandler(413)
+def request_too_large(e):
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // 1024 // 1024
+    return jsonify({'error': f'上传内容过大，上限为 {limit_mb}MB。'}), 413
+
 @app.route('/status/<task_id>')
 def task_status(task_id):
     task = tasks.get(task_id)
@@ -301,9 +638,32 @@ def task_status(task_id):
         return jsonify({'status': '任务未找到', 'progress': 0, 'result': 'error'}), 404
     return jsonify(task)
 
+@app.route('/cancel/<task_id>', methods=['POST'])
+def cancel_task(task_id):
+    """请求取消任务：任务在下一个安全点 (图片之间、Drive / Sheets 请求之前) 停止，并清理中间文件。"""
+    task = tasks.get(task_id)
+    if task is None:
+        return jsonify({'error': '任务未找到'}), 404
+    if 'result' in task or not task_control.cancel(task_id):
+        return jsonify({'error': '任务已结束，无法取消。'}), 409
+    task['status'] = '正在取消任务...'
+    return jsonify({'task_id': task_id, 'cancelling': True})
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus 文本格式，汇总所有任务的数量、各阶段耗时与计数器
+    body = task_metrics.render_prometheus(list(tasks.values()))
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/download_zip/<filename>')
 def download_processed_zip(filename):
-    return send_from_directory(app.config['OUTPUT_FOLDER'], filename, as_attachment=True)
+    # 流式发送文件，并支持 ETag / If-None-Match 和 Range 断点续传
+    file_path = safe_join(app.config['OUTPUT_FOLDER'], filename)
+    if file_path is None or not os.path.isfile(file_path):
+        return jsonify({'error': '文件不存在或已过期被清理，请重新处理。'}), 404
+    response = send_file(file_path, as_attachment=True, conditional=True, etag=True, max_age=0)
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
 
 @app.route('/download_template/<project_type>')
 def download_template(project_type):
@@ -323,6 +683,7 @@ def clear_session():
 # --- 新增：网络连接测试路由 ---
 @app.route('/test_connection')
 def test_connection():
+    import requests
     proxy_port = os.environ.get('PROXY_PORT', '17890')
     proxy_url = f"http://127.0.0.1:{proxy_port}"
     proxies = {"https": proxy_url}
@@ -345,26 +706,53 @@ def test_connection():
 def download_images():
     """
     处理 Image Bank 自动化下载请求的路由。
-    目前仅为占位符，以消除前端的 BuildError。
+    支持一次输入多个SKU (逗号、空格或换行分隔)，由后台的浏览器会话池并行下载。
     """
-    if request.method == 'POST':
-        model_sku = request.form.get('model_sku')
-        zip_filename = request.form.get('zip_filename')
-        
-        # --- 临时逻辑：创建异步任务ID并启动线程 ---
-        task_id = str(uuid.uuid4())
-        tasks[task_id] = {'status': f'下载任务已创建，目标SKU: {model_sku}', 'progress': 0}
-        
-        # ⚠️ 注意：这里我们将使用一个临时的占位线程函数，直到我们完成 longines_downloader.py 的集成
-        # thread = threading.Thread(target=run_image_download_task, args=(task_id, model_sku, zip_filename))
-        # thread.start()
-        
-        # 暂时返回任务ID，模拟成功创建任务
-        return jsonify({'task_id': task_id})
-    
-    # 理论上不会走到这里，但为了防止意外的 GET 请求
-    return jsonify({'error': '错误的请求方法'}), 405
+    from image_downloader import parse_sku_list
+
+    skus = parse_sku_list(request.form.get('model_sku'))
+    zip_filename = (request.form.get('zip_filename') or '').strip()
+    make_renditions = request.form.get('make_renditions') == 'on'
+    if not skus:
+        return jsonify({'error': '请输入至少一个产品SKU！'}), 400
+
+    key = job_registry.job_key('image_download', {'skus': skus, 'zip_filename': zip_filename, 'make_renditions': make_renditions})
+    return task_response(*launch_task(key, f'下载任务已创建，目标SKU: {", ".join(skus)}', run_image_download_task,
+                                      skus, zip_filename, make_renditions))
+
+
+def start_storage_sweeper():
+    storage_manager.start_sweeper(
+        [app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER']],
+        app.config['STORAGE_TTL_SECONDS'], app.config['STORAGE_QUOTA_BYTES'], app.config['STORAGE_SWEEP_INTERVAL']
+    )
+
+
+def cloud_sync_key(spreadsheet_id, project_type, full_sync=False):
+    return job_registry.job_key('cloud_sync', {'spreadsheet_id': spreadsheet_id, 'project_type': project_type, 'full_sync': full_sync})
+
+def enqueue_watch_sync(spreadsheet_id, project_type, skus):
+    """
+    Drive 监听发现表格受影响时调用。与手动 Mode A 使用同一个任务键：
+    该表格的同步尚未结束时不重复排队 (下一轮轮询会再次检测)。
+    """
+    task_id, deduplicated = launch_task(cloud_sync_key(spreadsheet_id, project_type), f'检测到 {len(skus)} 个SKU有新图片，自动同步已创建...',
+                                        run_cloud_sync_task, spreadsheet_id, project_type)
+    if not deduplicated:
+        tasks[task_id]['trigger'] = 'drive_watch'
+    return task_id
+
+def start_drive_watcher():
+    drive_watcher.start_watcher(
+        CONFIG, app.config['SYNC_STATE_FOLDER'], enqueue_watch_sync,
+        app.config['WATCH_INTERVAL_SECONDS'], app.config['WATCH_MAX_BACKOFF_SECONDS']
+    )
 
 
 if __name__ == '__main__':
+    # debug 模式下重载器会启动两个进程，只在真正提供服务的子进程中启动清理与监听线程
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_storage_sweeper()
+        if app.config['WATCH_DRIVE']:
+            start_drive_watcher()
     app.run(debug=True)
@@ -0,0 +1,111 @@
+# asset_pipeline.py (Image Bank 套图的后处理：解包、TIFF 转换、生成网页尺寸)
+
+import os
+import time
+import zipfile
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from PIL import Image
+
+from slice_processor import resize_image, encode_within_size, prepare_draft
+
+# 网页用的输出宽度 (从大到小)，以及每张输出图的大小上限
+RENDITION_WIDTHS = (1500, 750)
+RENDITION_TARGET_SIZE = 300 * 1024
+ASSET_EXTENSIONS = ('.tif', '.tiff', '.jpg', '.jpeg', '.png')
+# Image Bank 原图动辄几十 MB，同时送入进程池的图片数量需要受控
+MAX_IN_FLIGHT_PER_WORKER = 2
+
+
+def decode_for_width(data, max_width):
+    """
+    解码图片并尽早缩小到接近 max_width：
+    JPEG 使用 draft() 在解码阶段按 1/2、1/4、1/8 缩小；其它格式 (TIFF 等) 解码后用 reduce() 做整数倍快速缩小，
+    最后再交给 resize_image 做高质量的精确缩放。
+    """
+    img = prepare_draft(Image.open(BytesIO(data)), max_width)
+    img.load()
+    factor = img.width // max_width
+    if factor >= 2:
+        img = img.reduce(factor)
+    # TIFF 可能是 CMYK、16 位或带透明通道，网页图统一转为 RGB
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def rendition_name(source_name, sku, width):
+    """按 SKU + 后缀 + 宽度命名，例如 L8.124.4.87.2_FACE_750.jpg"""
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    if sku and stem.upper().startswith(sku.upper()):
+        suffix = stem[len(sku):]
+    else:
+        suffix = f"_{stem}"
+    return f"{sku}{suffix}_{width}.jpg"
+
+
+def process_asset(source_name, data, sku, output_dir, widths=RENDITION_WIDTHS, target_size=RENDITION_TARGET_SIZE):
+    """处理单张图片 (在子进程中运行)，返回包含输出文件和各阶段耗时的字典。"""
+    start = time.perf_counter()
+    result = {'source': source_name, 'outputs': [], 'error': None}
+    try:
+        widths = sorted(widths, reverse=True)
+        img = decode_for_width(data, widths[0])
+        result['decode_ms'] = round((time.perf_counter() - start) * 1000, 1)
+
+        encode_start = time.perf_counter()
+        for width in widths:
+            if img.width < width:
+                continue  # 不把原图拉伸到比自身更大的尺寸
+            # 从上一档尺寸继续缩小，不需要每档都从原图开始
+            img = resize_image(img, source_name, width)
+            encoded, fits = encode_within_size(img, 'JPEG', target_size)
+            output_path = os.path.join(output_dir, rendition_name(source_name, sku, width))
+            with open(output_path, 'wb') as f:
+                f.write(encoded)
+            result['outputs'].append({'file': os.path.basename(output_path), 'width': width,
+                                      'bytes': len(encoded), 'within_budget': fits})
+        result['encode_ms'] = round((time.perf_counter() - encode_start) * 1000, 1)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['total_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+def iter_zip_assets(zip_path):
+    """逐个读取 ZIP 中的图片条目 (一次只在内存中保留一个)，跳过 macOS 元数据等非图片文件。"""
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        for info in zf.infolist():
+            name = info.filename
+            if info.is_dir() or '__MACOSX' in name or os.path.basename(name).startswith('.'):
+                continue
+            if name.lower().endswith(ASSET_EXTENSIONS):
+                yield name, zf.read(info)
+
+
+def process_asset_zip(zip_path, output_dir, sku=None, widths=RENDITION_WIDTHS,
+                      target_size=RENDITION_TARGET_SIZE, max_workers=None):
+    """
+    把一个 Image Bank 下载的 ZIP 转换为网页尺寸的 JPG，输出到 output_dir。
+    图片在进程池中并行处理，同时在途的图片数量有上限，避免一次把整个 ZIP 读进内存。
+    返回每张图片的处理结果 (含耗时)。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    sku = sku or os.path.splitext(os.path.basename(zip_path))[0]
+    max_workers = max_workers or os.cpu_count() or 2
+    results, pending = [], set()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for name, data in iter_zip_assets(zip_path):
+            if len(pending) >= max_workers * MAX_IN_FLIGHT_PER_WORKER:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                results.extend(f.result() for f in done)
+            pending.add(pool.submit(process_asset, name, data, sku, output_dir, widths, target_size))
+        results.extend(f.result() for f in wait(pending).done)
+
+    for r in sorted(results, key=lambda r: r['source']):
+        if r['error']:
+            print(f"⚠️ {r['source']} 处理失败: {r['error']}")
+        else:
+            print(f"🖼️ {r['source']}: 解码 {r['decode_ms']}ms, 编码 {r['encode_ms']}ms, 输出 {len(r['outputs'])} 张")
+    return results
@@ -0,0 +1,257 @@
+# batch_runner.py (命令行批量处理：不经过网页，一次运行处理整季的 Excel / 切图)
+#
+# 用法:
+#   python batch_runner.py manifest.json [--workers 4] [--output-dir outputs/batch]
+#   python batch_runner.py 待处理目录/ --project example_project [--output-format xlsx]
+#
+# manifest.json 是任务列表 (或 {"jobs": [...]})，每项:
+#   {"input": "春季/天梭.xlsx", "project": "example_project", "gsheet_url": "https://docs.google.com/spreadsheets/d/..."}
+#   {"input": "春季/切图.zip", "type": "slice", "tile_long_images": true}
+# 相对路径相对于 manifest 所在目录。没有 gsheet_url 的 Excel 任务把结果写成本地文件 (同 Mode B)。
+# Excel 任务可加 "verify_links": true (或命令行 --verify-links 对所有任务生效)，校验生成的图片链接能否公开访问。
+# 传入目录时：其中的 .xlsx/.xls 按 --project 处理并导出到本地，.zip 按切图处理。
+#
+# 所有任务共用一份 Google 授权；同一个 Drive 项目文件夹 (及同一组图片来源) 的文件列表只拉取一次，供相关任务共享。
+# 运行结束后写出 JSON 汇总报告 (每个任务的各阶段耗时、计数器和结果)，有任务失败时退出码为 1。
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import storage_manager
+import task_metrics
+import upload_guard
+from task_metrics import timed_stage, timed_call
+from processor_registry import get_processor
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+# 本地文件视为可信输入，只保留解压总量上限，防止误放入的超大压缩包写满磁盘
+ZIP_MAX_UNCOMPRESSED_BYTES = 8 * 1024 ** 3
+
+# Drive 文件列表缓存：(项目文件夹名, 图片来源配置) -> build_image_index 的结果
+_index_cache = {}
+_index_locks = {}
+_cache_lock = threading.Lock()
+
+
+def load_project_config(config_path):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def spreadsheet_id_from(job):
+    """任务中可以直接写 spreadsheet_id，也可以写完整的 gsheet_url。"""
+    if job.get('spreadsheet_id'):
+        return job['spreadsheet_id']
+    match = re.search(r'/spreadsheets/d/([a-zA-Z0-9-_]+)', job.get('gsheet_url') or '')
+    return match.group(1) if match else None
+
+
+def load_jobs(source, default_project=None, default_format='xlsx'):
+    """把 manifest 文件或目录展开为任务列表，每个任务是一个字典 (input 为绝对路径)。"""
+    if os.path.isdir(source):
+        jobs = []
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if name.startswith(('.', '~$')) or not os.path.isfile(path):
+                continue
+            if name.lower().endswith('.zip'):
+                jobs.append({'input': path, 'type': 'slice'})
+            elif name.lower().endswith(EXCEL_EXTENSIONS):
+                jobs.append({'input': path, 'type': 'data', 'project': default_project})
+        base_dir = source
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        jobs = manifest['jobs'] if isinstance(manifest, dict) else manifest
+        base_dir = os.path.dirname(os.path.abspath(source))
+
+    for job in jobs:
+        job['input'] = os.path.abspath(os.path.join(base_dir, job['input']))
+        job.setdefault('type', 'slice' if job['input'].lower().endswith('.zip') else 'data')
+        job.setdefault('project', default_project)
+        job.setdefault('output_format', default_format)
+    return jobs
+
+
+def cached_image_index(project_config, creds):
+    """
+    同一个 Drive 项目文件夹 + 同一组图片来源只列一次；并发任务在该键的锁上等待第一次列取的结果。
+    共用文件夹但 source_folders 不同的项目 (链接列、路径或递归方式不同) 各自构建索引。
+    """
+    from google_drive_finder import DEFAULT_SOURCE_FOLDERS, build_image_index
+
+    sources = project_config.get('source_folders') or DEFAULT_SOURCE_FOLDERS
+    key = (project_config['drive_folder'], json.dumps(sources, sort_keys=True, ensure_ascii=False))
+    with _cache_lock:
+        lock = _index_locks.setdefault(key, threading.Lock())
+    with lock:
+        if key in _index_cache:
+            task_metrics.incr('index_cache_hits')
+        else:
+            _index_cache[key] = build_image_index(project_config, creds)
+            task_metrics.incr('index_builds')
+        return _index_cache[key]
+
+
+def run_data_job(task, job, project_config, creds, output_dir):
+    """Excel -> 处理器 -> 匹配图片链接 -> 回写 Google Sheet (或导出本地文件)。返回输出位置。"""
+    from google_drive_finder import apply_image_links, link_columns, project_link_format, update_google_sheet
+
+    # 与网页上传相同的预检：缺工作表/缺列的文件在解析前就失败，不占用 Drive 列取
+    upload_guard.inspect_workbook(job['input'], project_config.get('required_sheets', []),
+                                  project_config.get('required_columns'), project_config.get('header_row', 0))
+    processor_function = get_processor(project_config['processor'])
+    processed_df = timed_call(task, 'excel_processing', processor_function, job['input'])
+    if processed_df is None or processed_df.empty:
+        raise ValueError("处理Excel文件时出错，或未生成有效数据。")
+
+    image_index = timed_call(task, 'drive_listing', cached_image_index, project_config, creds)
+    if image_index is None:
+        task['warning'] = '在Google Drive中找不到项目文件夹或其 产品图/场景图 子文件夹，未填充图片链接。'
+    with timed_stage(task, 'link_matching'):
+        final_df = apply_image_links(processed_df, image_index, project_link_format(project_config))
+    if image_index is not None and (job.get('verify_links') or project_config.get('verify_links')):
+        from link_verifier import verify_frame_links
+        task['link_check'] = timed_call(task, 'link_verification', verify_frame_links, final_df, link_columns(project_config))
+        if task['link_check']['failed']:
+            task['warning'] = f"{task['link_check']['failed']} 个图片链接无法访问 (可能未公开共享)"
+
+    spreadsheet_id = spreadsheet_id_from(job)
+    if spreadsheet_id:
+        with timed_stage(task, 'sheet_update'):
+            if not update_google_sheet(spreadsheet_id, final_df, creds):
+                raise ValueError("更新Google Sheet失败。")
+        return f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}"
+
+    from result_writer import write_result_file
+    output_name = storage_manager.unique_output_name('processed', os.path.basename(job['input']), '')
+    return timed_call(task, 'export', write_result_file, final_df,
+                      os.path.join(output_dir, output_name), job['output_format'], link_columns(project_config))
+
+
+def run_slice_job(task, job, output_dir):
+    """切图 ZIP -> 解压 -> 重命名与压缩 -> 重新打包到 output_dir。返回输出 ZIP 路径。"""
+    from slice_processor import process_slice_folder, DEFAULT_RENDITIONS, TILE_HEIGHT
+
+    with tempfile.TemporaryDirectory(prefix='batch_slices_') as extract_dir:
+        with timed_stage(task, 'extract'):
+            upload_guard.safe_extract(job['input'], extract_dir, ZIP_MAX_UNCOMPRESSED_BYTES)
+        image_folder = extract_dir
+        items = os.listdir(extract_dir)
+        if len(items) == 1 and os.path.isdir(os.path.join(extract_dir, items[0])):
+            image_folder = os.path.join(extract_dir, items[0])
+
+        with timed_stage(task, 'slice_processing'):
+            process_slice_folder(image_folder, DEFAULT_RENDITIONS if job.get('multi_rendition') else None,
+                                 TILE_HEIGHT if job.get('tile_long_images') else None)
+
+        output_name = storage_manager.unique_output_name('processed', os.path.basename(job['input']), '')
+        with timed_stage(task, 'archive'):
+            archive_path = shutil.make_archive(os.path.join(output_dir, output_name), 'zip', image_folder)
+        task_metrics.incr('bytes_written', os.path.getsize(archive_path))
+        return archive_path
+
+
+def run_job(job, config, creds, output_dir):
+    """在工作线程中执行单个任务，返回报告中的一项 (异常被记录而不是抛出，其它任务继续)。"""
+    task = task_metrics.bind({}, job['type'])
+    report = {'input': job['input'], 'type': job['type'], 'project': job.get('project')}
+    try:
+        with timed_stage(task, 'total'):
+            if job['type'] == 'slice':
+                report['output'] = run_slice_job(task, job, output_dir)
+            else:
+                if job.get('project') not in config:
+                    raise ValueError(f"config.json 中没有项目 '{job.get('project')}'")
+                report['output'] = run_data_job(task, job, config[job['project']], creds, output_dir)
+        report['ok'] = True
+    except Exception as e:
+        traceback.print_exc()
+        report.update({'ok': False, 'error': f"{type(e).__name__}: {e}"})
+    report.update({'timings': task['timings'], 'counters': task['counters']})
+    if task.get('warning'):
+        report['warning'] = task['warning']
+    if task.get('link_check'):
+        report['link_check'] = task['link_check']
+    return report
+
+
+def run_batch(jobs, config, output_dir, workers=4):
+    """并发执行所有任务，返回汇总报告字典。需要 Google 的任务共用同一份授权。"""
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.time()
+
+    creds = None
+    if any(job['type'] == 'data' for job in jobs):
+        from google_drive_finder import authenticate_google_drive
+        creds = authenticate_google_drive()
+        if creds is None:
+            raise SystemExit("🚨 Google 授权失败，无法执行 Excel 任务。")
+
+    reports = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch') as pool:
+        futures = {pool.submit(run_job, job, config, creds, output_dir): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            report = future.result()
+            reports.append(report)
+            state = '✅' if report['ok'] else f"❌ {report['error']}"
+            print(f"[{done}/{len(jobs)}] {os.path.basename(report['input'])} {state} ({report['timings'].get('total', 0)}s)", flush=True)
+
+    order = {job['input']: i for i, job in enumerate(jobs)}
+    reports.sort(key=lambda r: order[r['input']])
+    return {
+        'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started)),
+        'seconds': round(time.time() - started, 3),
+        'workers': workers,
+        'succeeded': sum(1 for r in reports if r['ok']),
+        'failed': sum(1 for r in reports if not r['ok']),
+        'index_builds': sum(r['counters'].get('index_builds', 0) for r in reports),
+        'index_cache_hits': sum(r['counters'].get('index_cache_hits', 0) for r in reports),
+        'jobs': reports,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量处理 Excel / 切图 (无需打开网页)')
+    parser.add_argument('source', help='manifest.json 或包含待处理文件的目录')
+    parser.add_argument('--project', help='目录模式下 Excel 文件使用的项目类型 (config.json 中的键)')
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--output-dir', default=os.path.join('outputs', 'batch'))
+    parser.add_argument('--output-format', default='xlsx', choices=['xlsx', 'csv', 'parquet'])
+    parser.add_argument('--verify-links', action='store_true', help='生成链接后逐个请求，报告无法公开访问的图片')
+    parser.add_argument('--report', help='汇总报告路径，默认写到输出目录下的 batch_report_<时间>.json')
+    args = parser.parse_args()
+
+    config = load_project_config(args.config)
+    jobs = load_jobs(args.source, args.project, args.output_format)
+    for job in jobs:
+        job.setdefault('verify_links', args.verify_links)
+    if not jobs:
+        print("⚠️ 没有找到需要处理的文件。")
+        return
+    print(f"🚀 共 {len(jobs)} 个任务，并发 {args.workers}", flush=True)
+
+    summary = run_batch(jobs, config, args.output_dir, args.workers)
+    report_path = args.report or os.path.join(args.output_dir, f"batch_report_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
+
+    print(f"🎉 完成 {summary['succeeded']}/{len(jobs)}，耗时 {summary['seconds']}s，"
+          f"Drive 列表拉取 {summary['index_builds']} 次 (复用 {summary['index_cache_hits']} 次)")
+    print(f"📄 汇总报告: {report_path}")
+    if summary['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
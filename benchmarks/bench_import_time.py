@@ -0,0 +1,92 @@
+# benchmarks/bench_import_time.py (工作台冷启动耗时基准)
+#
+# 用法: python benchmarks/bench_import_time.py [--runs 5] [--module app]
+# 每次在全新的子进程中导入模块，统计墙钟时间，并用 -X importtime 找出最慢的导入项。
+# 结果追加到 benchmarks/results/import_time.json，便于与历史结果对比。
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FILE = os.path.join(ROOT_DIR, 'benchmarks', 'results', 'import_time.json')
+
+
+def measure_once(module):
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT_DIR, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+    return elapsed, proc.stderr
+
+
+def slowest_imports(importtime_output, top=10):
+    """解析 -X importtime 的输出，按累计耗时 (微秒) 排序，只看顶层导入。"""
+    rows = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        if not cumulative_us.strip().isdigit():
+            continue  # 表头行
+        # 嵌套导入的模块名前有额外缩进，只保留顶层
+        if name.startswith('  '):
+            continue
+        rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def load_history():
+    if not os.path.exists(RESULTS_FILE):
+        return []
+    with open(RESULTS_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量工作台冷启动 (import) 耗时')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--module', default='app')
+    args = parser.parse_args()
+
+    timings, last_output = [], ''
+    for _ in range(args.runs):
+        elapsed, last_output = measure_once(args.module)
+        timings.append(elapsed)
+
+    result = {
+        'module': args.module,
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'runs': args.runs,
+        'median_seconds': round(statistics.median(timings), 4),
+        'min_seconds': round(min(timings), 4),
+        'slowest_imports': [{'module': name, 'cumulative_ms': round(us / 1000, 1)} for us, name in slowest_imports(last_output)],
+    }
+
+    history = load_history()
+    previous = next((r for r in reversed(history) if r['module'] == args.module), None)
+
+    print(f"📦 import {args.module}: 中位数 {result['median_seconds'] * 1000:.0f}ms, 最快 {result['min_seconds'] * 1000:.0f}ms ({args.runs} 次)")
+    for item in result['slowest_imports']:
+        print(f"   {item['cumulative_ms']:>8.1f}ms  {item['module']}")
+    if previous:
+        delta = (result['median_seconds'] - previous['median_seconds']) * 1000
+        print(f"📈 与上次 ({previous['timestamp']}) 相比: {delta:+.0f}ms")
+
+    history.append(result)
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# benchmarks/bench_memory.py (Mode A 数据流的峰值内存基准)
+#
+# 用法: python benchmarks/bench_memory.py [--rows 100000] [--modes object,compact]
+# 模拟一次整表同步：Sheets 返回的二维列表 -> DataFrame -> 匹配图片链接 -> 分块生成回写请求 (JSON 编码)。
+#   object : 原来的做法 (全部 object 列、逐行 apply 匹配、fillna('') + .values.tolist() 生成整表请求)；
+#   compact: 当前代码 (values_to_frame 转为 category / string 列、按不重复 SKU 匹配、sheet_value_chunks 分块生成)。
+# 每种模式在全新的子进程中运行，读取 ru_maxrss 作为峰值 RSS；"流程增量" 为峰值减去准备好测试数据后的 RSS。
+# 结果追加到 benchmarks/results/memory.json，便于与历史结果对比。不需要 Google 凭证。
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+RESULTS_FILE = os.path.join(ROOT_DIR, 'benchmarks', 'results', 'memory.json')
+MODES = ('object', 'compact')
+BRANDS = ['天梭', '美度', '汉米尔顿', '宇联', '帝舵', '雪铁纳', '尼维达', '盛时']
+
+
+def peak_rss_mb():
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 ** 2
+
+
+def sheet_values(rows, seed=0):
+    """Sheets values().get 返回的二维列表：SKU 为小写 (触发大写化)，品牌和系列高度重复，链接列为空。"""
+    import synthetic
+
+    rng = random.Random(seed)
+    series = [f"{rng.choice(BRANDS)}系列{n}" for n in range(200)]
+    values = [['sort_order', 'model_sku', 'brand_name', 'product_name', 'msrp', 'product_image', 'scene_image']]
+    for n, sku in enumerate(synthetic.b2c_skus(rows, seed), start=1):
+        values.append([str(n), sku.lower(), rng.choice(BRANDS), rng.choice(series), str(rng.randrange(1000, 50000)), '', ''])
+    return values
+
+
+def image_index_for(values):
+    skus = [row[1].upper() for row in values[1:]]
+    return {
+        'product_image': {sku: f"file{n:08d}" for n, sku in enumerate(skus)},
+        'scene_image': {sku: f"scene{n:08d}" for n, sku in enumerate(skus) if n % 3},
+    }
+
+
+def run_object(values, image_index, chunk_rows):
+    import pandas as pd
+    from google_drive_finder import search_link
+
+    df = pd.DataFrame(values[1:], columns=values[0])
+    values.clear()  # Sheets 的响应在转为 DataFrame 后即可释放
+    df['model_sku'] = df['model_sku'].astype(str).str.upper()
+    for column, file_map in image_index.items():
+        df[column] = df['model_sku'].apply(lambda sku: search_link(sku, file_map))
+    df_cleaned = df.fillna('')
+    payload = [df_cleaned.columns.values.tolist()] + df_cleaned.values.tolist()
+    return sum(len(json.dumps(payload[start:start + chunk_rows])) for start in range(0, len(payload), chunk_rows))
+
+
+def run_compact(values, image_index, chunk_rows):
+    from frame_utils import sheet_value_chunks
+    from google_drive_finder import apply_image_links, values_to_frame
+
+    df = values_to_frame(values, 'Sheet1')
+    values.clear()
+    apply_image_links(df, image_index)
+    return sum(len(json.dumps(rows)) for _, rows in sheet_value_chunks(df, chunk_rows))
+
+
+def run_child(mode, rows):
+    import contextlib
+    import io
+    from google_drive_finder import SHEET_WRITE_CHUNK_ROWS
+
+    values = sheet_values(rows)
+    image_index = image_index_for(values)
+    setup_mb = peak_rss_mb()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        payload_bytes = (run_object if mode == 'object' else run_compact)(values, image_index, SHEET_WRITE_CHUNK_ROWS)
+    seconds = time.perf_counter() - start
+    peak_mb = peak_rss_mb()
+    print(json.dumps({'mode': mode, 'rows': rows, 'seconds': round(seconds, 3), 'setup_mb': round(setup_mb, 1),
+                      'peak_mb': round(peak_mb, 1), 'pipeline_mb': round(peak_mb - setup_mb, 1),
+                      'payload_bytes': payload_bytes}))
+
+
+def measure(mode, rows):
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, '--rows', str(rows)],
+                          cwd=ROOT_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{mode} 模式运行失败:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def load_history():
+    if not os.path.exists(RESULTS_FILE):
+        return []
+    with open(RESULTS_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量 Mode A 数据流的峰值内存')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.rows)
+        return
+
+    modes = [m.strip() for m in args.modes.split(',')]
+    results = {mode: measure(mode, args.rows) for mode in modes}
+    for r in results.values():
+        print(f"🧠 {r['mode']:>7}: 峰值 {r['peak_mb']:.0f}MB (流程增量 {r['pipeline_mb']:.0f}MB)，耗时 {r['seconds']:.2f}s，{args.rows} 行")
+    if 'object' in results and 'compact' in results:
+        saved = results['object']['pipeline_mb'] - results['compact']['pipeline_mb']
+        print(f"📉 compact 比 object 少用 {saved:.0f}MB")
+
+    history = load_history()
+    history.append({'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), 'rows': args.rows, 'results': list(results.values())})
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_resize.py (切图缩放：完整解码 vs draft/reducing_gap 快速缩小)
+#
+# 用法: python benchmarks/bench_resize.py [--width 2250] [--height 6000] [--runs 5]
+# 生成一张 Figma 3x 导出尺寸的合成 JPEG，分别在独立子进程中用两种方式缩放到 750px，
+# 对比解码+缩放耗时与进程峰值内存 (RSS)。
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+
+def peak_rss_mb():
+    """当前进程的峰值内存 (MB)；Windows 上需要 psutil，无法获取时返回 None。"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+    except ImportError:
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / 1024 / 1024, 1)
+        except Exception:
+            return None
+
+
+def make_sample(path, width, height):
+    from PIL import Image, ImageDraw
+    img = Image.new('RGB', (width, height), (245, 240, 235))
+    draw = ImageDraw.Draw(img)
+    for y in range(0, height, 40):
+        draw.rectangle([0, y, width, y + 18], fill=((y * 3) % 255, (y * 7) % 255, (y * 11) % 255))
+        draw.text((20, y), f"row {y} " * 20, fill=(0, 0, 0))
+    img.save(path, 'JPEG', quality=92)
+
+
+def run_child(mode, path, runs):
+    """在子进程中执行：mode 为 full (原始做法) 或 fast (draft + reducing_gap)。"""
+    import slice_processor
+    from PIL import Image
+
+    slice_processor.FAST_DOWNSCALE = (mode == 'fast')
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        img = Image.open(path)
+        img = slice_processor.resize_image(slice_processor.prepare_draft(img), path)
+        img.load()
+        timings.append(time.perf_counter() - start)
+    print(json.dumps({'mode': mode, 'median_ms': round(statistics.median(timings) * 1000, 1),
+                      'peak_rss_mb': peak_rss_mb(), 'output_size': list(img.size)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比切图缩放的两种解码方式')
+    parser.add_argument('--width', type=int, default=2250)
+    parser.add_argument('--height', type=int, default=6000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', choices=['full', 'fast'], help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.path, args.runs)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sample = os.path.join(tmp, 'sample.jpg')
+        make_sample(sample, args.width, args.height)
+        print(f"🧪 样例图: {args.width}x{args.height}px, {os.path.getsize(sample) // 1024}KB")
+        results = {}
+        for mode in ('full', 'fast'):
+            proc = subprocess.run([sys.executable, __file__, '--child', mode, '--path', sample, '--runs', str(args.runs)],
+                                  capture_output=True, text=True, check=True)
+            results[mode] = json.loads(proc.stdout.strip().splitlines()[-1])
+            r = results[mode]
+            print(f"   {mode:>4}: {r['median_ms']:>8.1f}ms  峰值内存 {r['peak_rss_mb']}MB  输出 {r['output_size']}")
+
+    full, fast = results['full'], results['fast']
+    print(f"⚡ 快速模式耗时为原来的 {fast['median_ms'] / full['median_ms']:.0%}")
+    if full['peak_rss_mb'] and fast['peak_rss_mb']:
+        print(f"💾 峰值内存减少 {full['peak_rss_mb'] - fast['peak_rss_mb']:.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
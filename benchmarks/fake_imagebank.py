@@ -0,0 +1,234 @@
+# benchmarks/fake_imagebank.py (本地模拟的 Image Bank 站点，用于离线测试下载器)
+#
+# 用法: python benchmarks/fake_imagebank.py --port 8765 [--latency 0.2]
+# 然后设置 IMAGEBANK_BASE_URL=http://127.0.0.1:8765 再运行下载器。
+# 页面结构与 image_downloader.py 中使用的定位器保持一致：
+#   /            未登录时为登录表单 (username/password)，登录后为搜索框 #SearchText
+#   /search      表款页面 .product-page-container，每张图一个 div#file_N[data-filename][data-jpg-url]
+#   /cart        #downloadButtonContainer 与 #downloadJpgButton
+#   /download/jpg  以 ZIP 返回已选中的图片
+#   /asset/<name>  单张图片 (需要登录 Cookie)
+# 型号以 MISSING 开头时模拟“查无此款”；以 PARTIAL 开头时 _SOL 图片只发送一半就断开连接 (模拟下载中断)。
+# LoginDriver 是只够 image_downloader.login() 使用的假浏览器，HTTP 直连模式可以完全离线运行。
+
+import argparse
+import io
+import secrets
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote, unquote, urljoin
+
+import requests
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+SUFFIXES = ["_BACK", "_DRback", "_DRface", "_FACE", "_SOL"]
+
+
+def make_image_bytes(name, size=(1200, 1600), image_format='JPEG'):
+    """生成一张示例图片；没有安装 Pillow 时返回占位字节。"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return (name.encode('utf-8') + b'\n') * 1024
+    seed = sum(name.encode('utf-8'))
+    img = Image.new('RGB', size, ((seed * 7) % 255, (seed * 13) % 255, (seed * 29) % 255))
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, quality=90)
+    return buffer.getvalue()
+
+
+class FakeImageBank:
+    def __init__(self, latency=0.0, username=None, password=None):
+        self.latency = latency
+        self.username = username
+        self.password = password
+        self.sessions = {}  # token -> 已选中的文件名列表
+        self.lock = threading.Lock()
+        self.stats = {'logins': 0, 'searches': 0, 'zip_downloads': 0, 'asset_downloads': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+
+def make_handler(bank):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _token(self):
+            for part in self.headers.get('Cookie', '').split(';'):
+                key, _, value = part.strip().partition('=')
+                if key == 'session' and value in bank.sessions:
+                    return value
+            return None
+
+        def _send(self, status, body=b'', content_type='text/html; charset=utf-8', headers=None):
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            time.sleep(bank.latency)
+            length = int(self.headers.get('Content-Length', 0))
+            form = parse_qs(self.rfile.read(length).decode('utf-8'))
+            if urlparse(self.path).path != '/login':
+                return self._send(404, 'not found')
+            username = form.get('username', [''])[0]
+            password = form.get('password', [''])[0]
+            if not username or (bank.username and (username, password) != (bank.username, bank.password)):
+                return self._send(401, '<p>login failed</p>')
+            token = secrets.token_hex(8)
+            with bank.lock:
+                bank.sessions[token] = []
+            bank.count('logins')
+            self._send(302, '', headers={'Location': '/', 'Set-Cookie': f'session={token}; Path=/'})
+
+        def do_GET(self):
+            time.sleep(bank.latency)
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            token = self._token()
+
+            if url.path == '/':
+                if not token:
+                    return self._send(200, """<html><body><form method="post" action="/login">
+                        <input name="username"><input name="password" type="password">
+                        <button type="submit">Login</button></form></body></html>""")
+                return self._send(200, """<html><body><form method="get" action="/search">
+                    <input id="SearchText" name="SearchText"></form></body></html>""")
+
+            if not token:
+                return self._send(401, 'login required')
+
+            if url.path == '/search':
+                bank.count('searches')
+                sku = query.get('SearchText', [''])[0].strip()
+                if sku.upper().startswith('MISSING'):
+                    return self._send(200, '<html><body><div class="product-page-container">no result</div></body></html>')
+                files = []
+                for i, suffix in enumerate(SUFFIXES):
+                    filename = f"{sku}{suffix}.tif"
+                    select_js = f"var x=new XMLHttpRequest();x.open('GET','/select?file={quote(filename)}',false);x.send();return false;"
+                    files.append(
+                        f'<div id="file_{i}" data-filename="{filename}" data-jpg-url="/asset/{quote(sku + suffix)}.jpg">'
+                        f'<a class="select-arrow" href="#" onclick="{select_js}">select</a></div>'
+                    )
+                return self._send(200, f"""<html><body><div class="product-page-container">{''.join(files)}</div>
+                    <a id="cartIcon" href="/cart">cart</a></body></html>""")
+
+            if url.path == '/select':
+                with bank.lock:
+                    bank.sessions[token].append(unquote(query.get('file', [''])[0]))
+                return self._send(200, 'ok', 'text/plain')
+
+            if url.path == '/cart':
+                return self._send(200, """<html><body><div id="downloadButtonContainer">
+                    <a id="downloadJpgButton" href="/download/jpg">Download JPG</a></div></body></html>""")
+
+            if url.path == '/download/jpg':
+                bank.count('zip_downloads')
+                with bank.lock:
+                    selected, bank.sessions[token] = bank.sessions[token], []
+                buffer = io.BytesIO()
+                with zipfile.ZipFile(buffer, 'w') as zf:
+                    for filename in selected:
+                        jpg_name = filename.rsplit('.', 1)[0] + '.jpg'
+                        zf.writestr(jpg_name, make_image_bytes(jpg_name))
+                archive_name = (selected[0].split('_')[0] if selected else 'empty') + '.zip'
+                return self._send(200, buffer.getvalue(), 'application/zip',
+                                  {'Content-Disposition': f'attachment; filename="{archive_name}"'})
+
+            if url.path.startswith('/asset/'):
+                bank.count('asset_downloads')
+                name = unquote(url.path[len('/asset/'):])
+                body = make_image_bytes(name)
+                if name.upper().startswith('PARTIAL') and '_SOL' in name:
+                    # 声明完整长度，只发送一半后断开
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'image/jpeg')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body[:len(body) // 2])
+                    self.close_connection = True
+                    return
+                return self._send(200, body, 'image/jpeg')
+
+            self._send(404, 'not found')
+
+    return Handler
+
+
+class _Element:
+    def __init__(self, driver, name=None, submit=False):
+        self.driver, self.name, self.submit = driver, name, submit
+
+    def send_keys(self, text):
+        self.driver.form[self.name] = text
+
+    def click(self):
+        if self.submit:
+            response = self.driver.session.post(urljoin(self.driver.url, '/login'), data=self.driver.form)
+            self.driver.url, self.driver.page = response.url, response.text
+
+
+class LoginDriver:
+    """
+    用 requests 实现的最小 WebDriver：只支持 login() 用到的 get / find_element / click / send_keys，
+    以及 session_from_driver() 用到的 get_cookies / execute_script。签名与 image_downloader.setup_driver 相同。
+    """
+
+    def __init__(self, download_dir=None, headless=True):
+        self.session = requests.Session()
+        self.url, self.page, self.form = None, '', {}
+
+    def get(self, url):
+        response = self.session.get(url)
+        self.url, self.page = response.url, response.text
+
+    def find_element(self, by, value):
+        if by in (By.NAME, By.ID) and f'{by}="{value}"' in self.page:
+            return _Element(self, value)
+        if by == By.XPATH and "@type='submit'" in value and 'type="submit"' in self.page:
+            return _Element(self, submit=True)
+        raise NoSuchElementException(f"{by}={value}")
+
+    def get_cookies(self):
+        return [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path} for c in self.session.cookies]
+
+    def execute_script(self, script):
+        return 'fake-imagebank-driver'
+
+    def quit(self):
+        self.session.close()
+
+
+def start_server(port=0, latency=0.0, username=None, password=None):
+    """在后台线程中启动模拟站点，返回 (server, bank, base_url)。用完调用 server.shutdown()。"""
+    bank = FakeImageBank(latency, username, password)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(bank))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, bank, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地模拟 Image Bank 站点')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求额外的延迟 (秒)')
+    args = parser.parse_args()
+    server, bank, base_url = start_server(args.port, args.latency)
+    print(f"🧪 模拟 Image Bank 已启动: {base_url} (Ctrl+C 退出)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
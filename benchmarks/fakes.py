@@ -0,0 +1,418 @@
+# benchmarks/fakes.py (进程内的 Google Drive / Sheets 假服务，供基准测试在没有凭证的情况下运行)
+#
+# 只实现了 google_drive_finder 用到的接口：
+#   drive.files().list(q=..., fields=..., pageToken=..., pageSize=...)
+#   drive.changes().getStartPageToken() / .list(pageToken=..., pageSize=...)
+#   sheets.spreadsheets().get(...) / .values().get / clear / update / batchGet / batchUpdate
+# 每次 execute() 都可以模拟网络延迟和 429 配额错误，调用次数记录在 stats 中。
+# FakeImageHost 是本地 HTTP 服务，代替 lh3.googleusercontent.com 供链接校验使用 (项目配置的 link_base 指向它)。
+#
+# 用法:
+#   fake = FakeGoogle(latency=0.05, page_size=1000)
+#   project_id = fake.drive.add_folder('项目A')
+#   ...
+#   with fake.install():
+#       build_image_index(project_config, creds=None)
+
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+
+
+def _quota_error(method):
+    """构造与 googleapiclient 抛出的一致的 429 错误，让 execute_with_retry 走真实的重试分支。"""
+    import httplib2
+    from googleapiclient.errors import HttpError
+    content = json.dumps({'error': {'code': 429, 'message': f'Quota exceeded ({method})'}}).encode()
+    return HttpError(httplib2.Response({'status': 429}), content)
+
+
+class _FakeService:
+    """Drive / Sheets 假服务的公共部分：延迟、错误注入和调用统计。"""
+
+    def __init__(self, latency=0.0, quota_error_rate=0.0, seed=0):
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._fail_next = 0
+        self._lock = threading.Lock()
+
+    def fail_next(self, count=1):
+        """让接下来的 count 次调用返回 429，用于确定性地测试重试开销。"""
+        with self._lock:
+            self._fail_next += count
+
+    def _call(self, method, func, extra_latency=0.0):
+        with self._lock:
+            self.stats[method] += 1
+            fail = self._fail_next > 0 or (self.quota_error_rate and self._random.random() < self.quota_error_rate)
+            if self._fail_next > 0:
+                self._fail_next -= 1
+            if fail:
+                self.stats['quota_errors'] += 1
+        if self.latency or extra_latency:
+            time.sleep(self.latency + extra_latency)
+        if fail:
+            raise _quota_error(method)
+        with self._lock:
+            return func()
+
+
+class _Request:
+    """模拟 googleapiclient 的 HttpRequest：构造时不发请求，execute() 时才执行。"""
+
+    def __init__(self, service, method, func, extra_latency=0.0):
+        self._service, self._method, self._func, self._extra_latency = service, method, func, extra_latency
+
+    def execute(self, num_retries=0):
+        return self._service._call(self._method, self._func, self._extra_latency)
+
+
+# --- Drive ---
+
+class FakeDrive(_FakeService):
+    """
+    内存中的 Drive 文件树。files().list 支持 google_drive_finder 使用的查询写法：
+    name='...'、'<id>' in parents、mimeType = / != 文件夹、trashed = false，条件之间用 and 连接。
+    与真实接口一致，未指定 pageSize 时每页 100 条；page_size 是服务端的单页上限 (真实 Drive 为 1000)。
+    每次新增、移到回收站都会记入变更日志，changes() 按日志下标作为 page token。
+    """
+
+    def __init__(self, latency=0.0, page_size=1000, quota_error_rate=0.0, seed=0):
+        super().__init__(latency, quota_error_rate, seed)
+        self.page_size = page_size
+        self.items = {}
+        self.children = {}
+        self._next_id = 0
+        self.change_log = []
+
+    def _new_id(self, prefix):
+        self._next_id += 1
+        return f"{prefix}{self._next_id:08d}"
+
+    def _add(self, name, mime_type, parent_id):
+        item_id = self._new_id('fld' if mime_type == FOLDER_MIME else 'file')
+        item = {'id': item_id, 'name': name, 'mimeType': mime_type, 'parents': [parent_id] if parent_id else []}
+        self.items[item_id] = item
+        self.children.setdefault(parent_id, []).append(item)
+        self.change_log.append(item_id)
+        return item_id
+
+    def add_folder(self, name, parent_id=None):
+        return self._add(name, FOLDER_MIME, parent_id)
+
+    def add_files(self, folder_id, names, mime_type='image/jpeg'):
+        return [self._add(name, mime_type, folder_id) for name in names]
+
+    def trash(self, item_id):
+        """把文件移到回收站：从父文件夹的列表中消失，并产生一条 trashed 变更。"""
+        item = self.items[item_id]
+        item['trashed'] = True
+        for parent_id in item['parents']:
+            self.children[parent_id].remove(item)
+        self.change_log.append(item_id)
+
+    def files(self):
+        return self
+
+    def changes(self):
+        return _FakeChanges(self)
+
+    def _match(self, item, conditions):
+        for key, op, value in conditions:
+            if key == 'name' and item['name'] != value:
+                return False
+            if key == 'mimeType' and (item['mimeType'] == value) != (op == '='):
+                return False
+        return True
+
+    def list(self, q='', fields=None, pageToken=None, pageSize=None, **kwargs):
+        parents = re.findall(r"'([^']+)' in parents", q)
+        conditions = [('name', '=', v) for v in re.findall(r"name\s*=\s*'([^']*)'", q)]
+        conditions += [('mimeType', op, v) for op, v in re.findall(r"mimeType\s*(!?=)\s*'([^']*)'", q)]
+        page_size = min(pageSize or 100, self.page_size)
+        offset = int(pageToken or 0)
+
+        def run():
+            if parents:
+                candidates = [item for pid in parents for item in self.children.get(pid, [])]
+            else:
+                candidates = list(self.items.values())
+            matched = [item for item in candidates if self._match(item, conditions)]
+            page = matched[offset:offset + page_size]
+            response = {'files': [dict(item) for item in page]}
+            if offset + page_size < len(matched):
+                response['nextPageToken'] = str(offset + page_size)
+            self.stats['files_returned'] += len(page)
+            return response
+
+        return _Request(self, 'files.list', run)
+
+
+class _FakeChanges:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def getStartPageToken(self, **kwargs):
+        return _Request(self.drive, 'changes.getStartPageToken', lambda: {'startPageToken': str(len(self.drive.change_log))})
+
+    def list(self, pageToken, pageSize=None, fields=None, **kwargs):
+        page_size = min(pageSize or 100, self.drive.page_size)
+        offset = int(pageToken)
+
+        def run():
+            log = self.drive.change_log
+            changes = []
+            for item_id in log[offset:offset + page_size]:
+                item = self.drive.items[item_id]
+                changes.append({'fileId': item_id, 'removed': False, 'file': dict(item, trashed=item.get('trashed', False))})
+            response = {'changes': changes}
+            if offset + page_size < len(log):
+                response['nextPageToken'] = str(offset + page_size)
+            else:
+                response['newStartPageToken'] = str(len(log))
+            return response
+
+        return _Request(self.drive, 'changes.list', run)
+
+
+# --- Sheets ---
+
+def _column_index(letters):
+    index = 0
+    for ch in letters.upper():
+        index = index * 26 + ord(ch) - ord('A') + 1
+    return index - 1
+
+
+def parse_a1_range(range_name):
+    """把 "'工作表'!B2:D9" 解析为 (工作表名, 起始行, 起始列, 结束行, 结束列)，行列从 0 开始，结束为开区间，未指定时为 None。"""
+    title, _, cells = range_name.partition('!')
+    title = title.strip("'")
+    start_row = start_col = 0
+    end_row = end_col = None
+    if cells:
+        start, _, end = cells.partition(':')
+        m = re.fullmatch(r'([A-Za-z]*)(\d*)', start)
+        if m:
+            start_col = _column_index(m.group(1)) if m.group(1) else 0
+            start_row = int(m.group(2)) - 1 if m.group(2) else 0
+        m = re.fullmatch(r'([A-Za-z]*)(\d*)', end)
+        if m and m.group(1):
+            end_col = _column_index(m.group(1)) + 1
+        if m and m.group(2):
+            end_row = int(m.group(2))
+    return title, start_row, start_col, end_row, end_col
+
+
+class FakeSheets(_FakeService):
+    """
+    内存中的电子表格：{spreadsheet_id: OrderedDict(工作表名 -> 二维列表)}。
+    seconds_per_1k_cells 用来模拟写入大表时按单元格数增长的耗时。
+    """
+
+    def __init__(self, latency=0.0, quota_error_rate=0.0, seed=0, seconds_per_1k_cells=0.0):
+        super().__init__(latency, quota_error_rate, seed)
+        self.seconds_per_1k_cells = seconds_per_1k_cells
+        self.spreadsheets_data = {}
+
+    def add_spreadsheet(self, spreadsheet_id, tabs):
+        self.spreadsheets_data[spreadsheet_id] = OrderedDict((title, [list(r) for r in rows]) for title, rows in tabs.items())
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return _FakeValues(self)
+
+    def _tabs(self, spreadsheet_id):
+        if spreadsheet_id not in self.spreadsheets_data:
+            raise KeyError(f"fake spreadsheet {spreadsheet_id} 不存在")
+        return self.spreadsheets_data[spreadsheet_id]
+
+    def _cell_latency(self, cells):
+        return self.seconds_per_1k_cells * cells / 1000
+
+    def get(self, spreadsheetId, fields=None, **kwargs):
+        def run():
+            return {'spreadsheetId': spreadsheetId, 'sheets': [
+                {'properties': {'sheetId': i, 'title': title, 'index': i}}
+                for i, title in enumerate(self._tabs(spreadsheetId))
+            ]}
+        return _Request(self, 'spreadsheets.get', run)
+
+    def read_range(self, spreadsheet_id, range_name):
+        title, start_row, start_col, end_row, end_col = parse_a1_range(range_name)
+        rows = self._tabs(spreadsheet_id).get(title, [])
+        rows = rows[start_row:end_row]
+        values = [row[start_col:end_col] for row in rows]
+        # 与真实接口一致：去掉末尾的空行和每行末尾的空单元格
+        values = [row[:len(row) - next((i for i, v in enumerate(reversed(row)) if v != ''), len(row))] for row in values]
+        while values and not values[-1]:
+            values.pop()
+        return {'range': range_name, 'majorDimension': 'ROWS', 'values': values} if values else {'range': range_name}
+
+    def write_range(self, spreadsheet_id, range_name, values):
+        title, start_row, start_col, _, _ = parse_a1_range(range_name)
+        rows = self._tabs(spreadsheet_id).setdefault(title, [])
+        for offset, new_row in enumerate(values):
+            index = start_row + offset
+            while len(rows) <= index:
+                rows.append([])
+            row = rows[index]
+            if len(row) < start_col + len(new_row):
+                row.extend([''] * (start_col + len(new_row) - len(row)))
+            row[start_col:start_col + len(new_row)] = ['' if v is None else v for v in new_row]
+        cells = sum(len(r) for r in values)
+        self.stats['cells_written'] += cells
+        return {'updatedRange': range_name, 'updatedRows': len(values), 'updatedCells': cells}
+
+
+class _FakeValues:
+    def __init__(self, sheets):
+        self.sheets = sheets
+
+    def get(self, spreadsheetId, range, **kwargs):
+        return _Request(self.sheets, 'values.get', lambda: self.sheets.read_range(spreadsheetId, range))
+
+    def batchGet(self, spreadsheetId, ranges, **kwargs):
+        ranges = [ranges] if isinstance(ranges, str) else list(ranges)
+        return _Request(self.sheets, 'values.batchGet', lambda: {
+            'spreadsheetId': spreadsheetId,
+            'valueRanges': [self.sheets.read_range(spreadsheetId, r) for r in ranges],
+        })
+
+    def clear(self, spreadsheetId, range, body=None, **kwargs):
+        def run():
+            title = parse_a1_range(range)[0]
+            self.sheets._tabs(spreadsheetId)[title] = []
+            return {'clearedRange': range}
+        return _Request(self.sheets, 'values.clear', run)
+
+    def update(self, spreadsheetId, range, body, valueInputOption='RAW', **kwargs):
+        cells = sum(len(r) for r in body.get('values', []))
+        return _Request(self.sheets, 'values.update',
+                        lambda: self.sheets.write_range(spreadsheetId, range, body.get('values', [])),
+                        self.sheets._cell_latency(cells))
+
+    def batchUpdate(self, spreadsheetId, body, **kwargs):
+        data = body.get('data', [])
+        cells = sum(len(r) for d in data for r in d.get('values', []))
+
+        def run():
+            responses = [self.sheets.write_range(spreadsheetId, d['range'], d.get('values', [])) for d in data]
+            return {'spreadsheetId': spreadsheetId, 'totalUpdatedCells': sum(r['updatedCells'] for r in responses),
+                    'responses': responses}
+        return _Request(self.sheets, 'values.batchUpdate', run, self.sheets._cell_latency(cells))
+
+
+# --- 组合与安装 ---
+
+class FakeGoogle:
+    """同时提供 Drive 与 Sheets 的假服务，install() 期间替换 google_drive_finder.build。"""
+
+    def __init__(self, latency=0.0, page_size=1000, quota_error_rate=0.0, seed=0, seconds_per_1k_cells=0.0):
+        self.drive = FakeDrive(latency, page_size, quota_error_rate, seed)
+        self.sheets = FakeSheets(latency, quota_error_rate, seed + 1, seconds_per_1k_cells)
+
+    def build(self, service_name, version, credentials=None, **kwargs):
+        if service_name == 'drive':
+            return self.drive
+        if service_name == 'sheets':
+            return self.sheets
+        raise ValueError(f"FakeGoogle 不支持的服务: {service_name}")
+
+    def stats(self):
+        return {'drive': dict(self.drive.stats), 'sheets': dict(self.sheets.stats)}
+
+    @contextmanager
+    def install(self, retry_delay=0.01):
+        """替换 google_drive_finder 中的 build() 并缩短重试间隔，退出时恢复。"""
+        import google_drive_finder
+        original_build, original_delay = google_drive_finder.build, google_drive_finder.RETRY_DELAY_SECONDS
+        google_drive_finder.build = self.build
+        google_drive_finder.RETRY_DELAY_SECONDS = retry_delay
+        try:
+            yield self
+        finally:
+            google_drive_finder.build = original_build
+            google_drive_finder.RETRY_DELAY_SECONDS = original_delay
+
+
+# --- 图片链接服务 ---
+
+class _ImageServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # 默认的 5 在并发校验时会让连接排队重试，延迟统计失真
+
+    def handle_error(self, request, client_address):
+        # check_link 只读响应头就关闭连接，客户端断开是正常情况，不打印堆栈
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class FakeImageHost:
+    """
+    本地的 lh3 替身：GET /d/<文件ID><尺寸后缀> 对 drive 中存在且未设为私有的文件返回 200 image/jpeg，
+    私有文件返回 403 (与未公开共享的 Drive 文件一致)，不存在的返回 404。每个请求都会等待 latency 秒。
+    用法: with FakeImageHost(fake.drive, latency=0.02) as host: project_config['link_base'] = host.base
+    """
+
+    def __init__(self, drive, latency=0.0):
+        self.drive = drive
+        self.latency = latency
+        self.private = set()
+        self.stats = Counter()
+        self._server = None
+
+    def _handler(self):
+        host = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                host.stats['requests'] += 1
+                if host.latency:
+                    time.sleep(host.latency)
+                match = re.match(r'^/d/([^=/?]+)', self.path)
+                file_id = match.group(1) if match else None
+                if file_id in host.private:
+                    self._reply(403, 'text/html; charset=utf-8', b'<html>forbidden</html>')
+                elif file_id in host.drive.items and not host.drive.items[file_id].get('trashed'):
+                    self._reply(200, 'image/jpeg', b'\xff\xd8\xff\xe0' + b'\0' * 1020)
+                else:
+                    self._reply(404, 'text/html; charset=utf-8', b'<html>not found</html>')
+
+            def _reply(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    @property
+    def base(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/d/"
+
+    def __enter__(self):
+        self._server = _ImageServer(('127.0.0.1', 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, name='fake-image-host', daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
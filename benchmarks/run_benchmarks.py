@@ -0,0 +1,421 @@
+# benchmarks/run_benchmarks.py (核心流程的基准测试：假 Google 服务 + 合成数据)
+#
+# 用法: python benchmarks/run_benchmarks.py [--scale small|medium|large] [--runs 3] [--only drive_links,sheet_update]
+#                                          [--latency 0.02] [--quota-error-rate 0.0] [--threshold 0.1]
+# 每个场景在指定规模下重复运行，取中位数；结果追加到 benchmarks/results/benchmarks.json，
+# 并与同一规模、同一参数的上一次结果对比，变慢超过 threshold 的场景会被标出。
+# 不需要 Google 凭证：Drive / Sheets 调用全部由 benchmarks/fakes.py 在进程内模拟。
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+from fakes import FakeGoogle, FakeImageHost
+
+RESULTS_FILE = os.path.join(ROOT_DIR, 'benchmarks', 'results', 'benchmarks.json')
+
+# 各场景在不同规模下的数据量 (行数 / 图片数)
+SCALES = {
+    'small':  {'excel_b2c': 200,  'excel_longines': 200,  'drive_links': 500,   'drive_links_quota': 200,  'drive_links_concurrent': 500,   'drive_links_recursive': 500,   'sheet_update': 1000,  'sheet_fanout': 1000,  'sheet_sync': 1000,  'drive_watch': 1000, 'link_verify': 500,  'slice_folder': 5,  'slice_long_images': 2,  'imagebank_http': 8},
+    'medium': {'excel_b2c': 2000, 'excel_longines': 2000, 'drive_links': 5000,  'drive_links_quota': 1000, 'drive_links_concurrent': 5000,  'drive_links_recursive': 5000,  'sheet_update': 10000, 'sheet_fanout': 10000, 'sheet_sync': 10000, 'drive_watch': 10000, 'link_verify': 2000, 'slice_folder': 20, 'slice_long_images': 4,  'imagebank_http': 20},
+    'large':  {'excel_b2c': 8000, 'excel_longines': 8000, 'drive_links': 20000, 'drive_links_quota': 5000, 'drive_links_concurrent': 20000, 'drive_links_recursive': 20000, 'sheet_update': 50000, 'sheet_fanout': 50000, 'sheet_sync': 50000, 'drive_watch': 50000, 'link_verify': 5000, 'slice_folder': 60, 'slice_long_images': 10, 'imagebank_http': 50},
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+# --- 场景：setup(size, workdir, args) 返回一个无参函数，只有该函数的执行时间被计入 ---
+
+def scenario_excel_b2c(size, workdir, args):
+    from excel_processor import process_excel_file
+    path = os.path.join(workdir, 'b2c.xlsx')
+    synthetic.make_b2c_workbook(path, size)
+
+    def run():
+        df = process_excel_file(path)
+        return {'rows': len(df)}
+    return run
+
+
+def scenario_excel_longines(size, workdir, args):
+    from longines_processor import process_longines_file
+    path = os.path.join(workdir, 'longines.xlsx')
+    synthetic.make_longines_workbook(path, size)
+
+    def run():
+        df = process_longines_file(path)
+        return {'rows': len(df)}
+    return run
+
+
+def _drive_links(size, args, quota_error_rate, seasons=0):
+    from google_drive_finder import find_image_links_for_df
+    fake = FakeGoogle(latency=args.latency, page_size=args.page_size, quota_error_rate=quota_error_rate)
+    skus = synthetic.b2c_skus(size)
+    project_config = synthetic.populate_drive(fake.drive, '基准项目', skus, extra_files=size, seasons=seasons)
+
+    def run():
+        df = synthetic.sku_frame(skus)
+        with fake.install():
+            result = find_image_links_for_df(df, project_config, creds=None)
+        matched = int((result['product_image'] != '').sum()) if 'product_image' in result else 0
+        return {'rows': len(result), 'matched': matched, 'fake': fake.stats()}
+    return run
+
+
+def scenario_drive_links(size, workdir, args):
+    return _drive_links(size, args, args.quota_error_rate)
+
+
+def scenario_drive_links_quota(size, workdir, args):
+    # 5% 的 Drive 请求返回 429，衡量重试带来的额外耗时
+    return _drive_links(size, args, max(args.quota_error_rate, 0.05))
+
+
+def scenario_drive_links_recursive(size, workdir, args):
+    # 图片按季度分散在 产品图/场景图 下的 12 个子文件夹中，递归遍历
+    return _drive_links(size, args, args.quota_error_rate, seasons=12)
+
+
+def scenario_drive_links_concurrent(size, workdir, args):
+    # 3 个任务同时为同一个项目查找链接，文件夹列取应被合并为一次 (见 files.list 调用数)
+    from google_drive_finder import find_image_links_for_df
+    fake = FakeGoogle(latency=args.latency, page_size=args.page_size, quota_error_rate=args.quota_error_rate)
+    skus = synthetic.b2c_skus(size)
+    project_config = synthetic.populate_drive(fake.drive, '基准项目', skus, extra_files=size)
+
+    def run():
+        with fake.install(), ThreadPoolExecutor(max_workers=3) as pool:
+            results = list(pool.map(lambda _: find_image_links_for_df(synthetic.sku_frame(skus), project_config, None), range(3)))
+        return {'rows': sum(len(r) for r in results), 'fake': fake.stats()}
+    return run
+
+
+def scenario_sheet_update(size, workdir, args):
+    from google_drive_finder import update_google_sheet
+    fake = FakeGoogle(latency=args.latency, quota_error_rate=args.quota_error_rate)
+    fake.sheets.add_spreadsheet('bench-sheet', {'Sheet1': [['old']]})
+    df = synthetic.sku_frame(synthetic.b2c_skus(size), extra_columns=6)
+
+    def run():
+        with fake.install():
+            ok = update_google_sheet('bench-sheet', df, creds=None)
+        return {'ok': ok, 'cells': size * df.shape[1], 'fake': fake.stats()}
+    return run
+
+
+def scenario_sheet_fanout(size, workdir, args):
+    # 2 个表格 x 4 个工作表，共 size 行；API 调用数应与工作表数量无关 (见 sheets 的调用统计)。
+    # 最后一个工作表没有 scene_image 列，且表头右侧还有一列没有列名的备注：新列必须追加在备注之后
+    from sheet_fanout import sync_many
+    fake = FakeGoogle(latency=args.latency, page_size=args.page_size, quota_error_rate=args.quota_error_rate)
+    skus = synthetic.b2c_skus(size)
+    project_config = synthetic.populate_drive(fake.drive, '基准项目', skus, extra_files=size)
+    header = ['sort_order', 'model_sku', 'product_image', 'scene_image']
+    chunks = [skus[i::8] for i in range(8)]
+    targets = [{'spreadsheet_id': f'bench-fanout-{s}', 'gid': None, 'title': None} for s in range(2)]
+    notes = [f"备注{n}" for n in range(len(chunks[7]))]
+
+    def run():
+        for s in range(2):
+            fake.sheets.add_spreadsheet(f'bench-fanout-{s}', {
+                f'活动{t + 1}': [header] + [[str(n), sku, '', ''] for n, sku in enumerate(chunks[s * 4 + t], start=1)]
+                for t in range(4)
+            })
+        fake.sheets.spreadsheets_data['bench-fanout-1']['活动4'] = [header[:3]] + [
+            [str(n), sku, '', note] for n, (sku, note) in enumerate(zip(chunks[7], notes), start=1)]
+        with fake.install():
+            summary = sync_many(targets, project_config, creds=None)
+        rows = fake.sheets.spreadsheets_data['bench-fanout-1']['活动4']
+        assert rows[0][4] == 'scene_image', rows[0]
+        assert [row[3] for row in rows[1:]] == notes, '表头右侧的数据被覆盖'
+        return {'tabs': len(summary['tabs']), 'cells': summary['cells_written'], 'fake': fake.stats()}
+    return run
+
+
+def scenario_sheet_sync(size, workdir, args):
+    # 整表同步 -> Drive 新增几张产品图，同时用户追加了重复 / 带空格的小写 SKU，并清掉一个重复 SKU 行的链接 -> 增量同步
+    # -> 无变化再同步一次。这些行都要补上链接，最后一次不应重新查找任何一行 (计时包含建立假 Drive 和表格)
+    from google_drive_finder import PRODUCT_IMG_FOLDER_NAME, read_sheet_data
+    from sync_state import sync_image_links
+    skus = synthetic.b2c_skus(size)
+    late = skus[:3]  # 第一次同步之后才上传产品图的 SKU
+    header = ['sort_order', 'model_sku', 'product_image', 'scene_image']
+    state_dir = os.path.join(workdir, 'sync_state')
+
+    def sync(project_config):
+        return sync_image_links('bench-sync', read_sheet_data('bench-sync', None), project_config, None, state_dir)
+
+    def run():
+        shutil.rmtree(state_dir, ignore_errors=True)
+        fake = FakeGoogle(latency=args.latency, page_size=args.page_size)
+        project_config = synthetic.populate_drive(fake.drive, '基准项目', skus[3:], extra_files=size)
+        product_id = next(item['id'] for item in fake.drive.items.values() if item['name'] == PRODUCT_IMG_FOLDER_NAME)
+        fake.sheets.add_spreadsheet('bench-sync', {'Sheet1': [header] + [[str(n), sku, '', ''] for n, sku in enumerate(skus, start=1)]})
+        with fake.install():
+            first = sync(project_config)
+            # 整表同步会清空后重写，之后再取工作表的内容
+            values = fake.sheets.spreadsheets_data['bench-sync']['Sheet1']
+            fake.drive.add_files(product_id, [f"{sku}.jpg" for sku in late])
+            linked = next(row for row in values[1:] if row[2])
+            for sku in [late[0], f"  {late[1].lower()} ", f"{late[2]} ", linked[1]]:
+                values.append([str(len(values)), sku, '', ''])
+            linked[2] = ''
+            second = sync(project_config)
+            third = sync(project_config)
+        assert (first['mode'], second['mode']) == ('full', 'incremental'), (first, second)
+        expected = set(late) | {linked[1]}
+        rows = [row for row in values[1:] if row[1].strip().upper() in expected]
+        assert len(rows) == 8 and all(row[2] for row in rows), f"重复或带空格的 SKU 没有补上链接: {rows}"
+        assert third['refreshed'] == 0, third
+        return {'refreshed': second['refreshed'], 'cells': second['cells_written'], 'fake': fake.stats()}
+    return run
+
+
+def scenario_drive_watch(size, workdir, args):
+    # 同一项目登记了两个表格 (各含一半 SKU)，另一个项目的表格也含有其中的 SKU。开始监听后，向项目的产品图 / 场景图上传
+    # 3 张图 (其中一张带 _DETAIL 后缀)，并在不受监听的文件夹中上传一张同名图：只有含这些 SKU 的那个表格被排队，
+    # 没有新变更时不排队；连续失败时的等待时间按 backoff_delay 翻倍并封顶
+    import drive_watcher
+    import sync_state
+    from google_drive_finder import PRODUCT_IMG_FOLDER_NAME, SCENE_IMG_FOLDER_NAME
+    fake = FakeGoogle(latency=args.latency, page_size=args.page_size)
+    skus = synthetic.b2c_skus(size)
+    config = {'bench': synthetic.populate_drive(fake.drive, '基准项目', skus[10:], extra_files=size),
+              'other': synthetic.populate_drive(fake.drive, '其它项目', [])}
+    project_id = next(item['id'] for item in fake.drive.items.values() if item['name'] == '基准项目')
+    folder_ids = {item['name']: item['id'] for item in fake.drive.children[project_id]}
+    unwatched_id = fake.drive.add_folder('临时上传')
+    state_dir = os.path.join(workdir, 'watch_state')
+    sheets = {'sheet-a': ('bench', skus[0::2]), 'sheet-b': ('bench', skus[1::2]), 'sheet-other': ('other', skus[:10])}
+    for spreadsheet_id, (project_type, sheet_skus) in sheets.items():
+        sync_state.save_state(state_dir, spreadsheet_id, {'listing_version': None, 'rows': [[sku, ''] for sku in sheet_skus]})
+        drive_watcher.register_sheet(state_dir, spreadsheet_id, project_type)
+    uploaded = {skus[0], skus[2], skus[4]}
+
+    def run():
+        enqueued = []
+        watch = {'service': fake.build('drive', 'v3'), 'creds': None}
+
+        def enqueue(spreadsheet_id, project_type, hits):
+            enqueued.append((spreadsheet_id, project_type, hits))
+
+        with fake.install():
+            drive_watcher.watch_cycle(watch, config, state_dir, enqueue)  # 第一次只记录起始 page token
+            fake.drive.add_files(folder_ids[PRODUCT_IMG_FOLDER_NAME], [f"{skus[0]}.jpg", f"{skus[2]}.jpg"])
+            fake.drive.add_files(folder_ids[SCENE_IMG_FOLDER_NAME], [f"{skus[4]}_DETAIL.jpg"])
+            fake.drive.add_files(unwatched_id, [f"{skus[1]}.jpg"])
+            drive_watcher.watch_cycle(watch, config, state_dir, enqueue)
+            drive_watcher.watch_cycle(watch, config, state_dir, enqueue)
+        assert enqueued == [('sheet-a', 'bench', uploaded)], enqueued
+        delays = [drive_watcher.backoff_delay(failures, 30, 600) for failures in range(6)]
+        assert delays == [30, 60, 120, 240, 480, 600], delays
+        return {'folders': len(watch['folders']), 'enqueued': len(enqueued), 'fake': fake.stats()}
+    return run
+
+
+def scenario_link_verify(size, workdir, args):
+    # 为 size 个 SKU 生成链接后逐个校验，其中 5% 的文件是私有的；本地图片服务的每个请求有 latency 秒延迟
+    from google_drive_finder import build_image_index, search_link
+    from link_verifier import verify_links
+    fake = FakeGoogle(latency=args.latency, page_size=args.page_size)
+    skus = synthetic.b2c_skus(size)
+    project_config = synthetic.populate_drive(fake.drive, '基准项目', skus)
+    with fake.install():
+        image_index = build_image_index(project_config, creds=None)
+    host = FakeImageHost(fake.drive, latency=args.latency)
+    file_ids = [file_id for file_map in image_index.values() for file_id in file_map.values()]
+    host.private.update(file_ids[::20])
+
+    def run():
+        host.stats.clear()
+        with host:
+            urls = [search_link(sku, file_map, base=host.base) for file_map in image_index.values() for sku in skus]
+            report = verify_links(urls)
+        return {'checked': report['checked'], 'failed': report['failed'], 'p95_ms': report['latency_ms']['p95'],
+                'requests': host.stats['requests']}
+    return run
+
+
+def scenario_imagebank_http(size, workdir, args):
+    # HTTP 直连模式从本地模拟的 Image Bank 下载 size 个 SKU，外加一个查无此款和一个 _SOL 图片传到一半断开的 SKU：
+    # 这两个 SKU 各自报错，其余照常完成，输出目录中不能留下残缺的 ZIP 或 .part 临时文件
+    from fake_imagebank import LoginDriver, start_server
+    from image_downloader import SUFFIXES, download_batch
+    skus = synthetic.longines_skus(size) + ['MISSING001', 'PARTIAL001']
+    output_dir = os.path.join(workdir, 'imagebank')
+
+    def run():
+        shutil.rmtree(output_dir, ignore_errors=True)
+        server, bank, base_url = start_server(latency=args.latency)
+        try:
+            results = download_batch(skus, output_dir, base_url=base_url, driver_factory=LoginDriver, backend='http')
+        finally:
+            server.shutdown()
+            server.server_close()
+        failed = sorted(sku for sku, result in results.items() if not result['ok'])
+        assert failed == ['MISSING001', 'PARTIAL001'], {sku: results[sku] for sku in failed}
+        assert all(results[sku]['error'] for sku in failed)
+        names = os.listdir(output_dir)
+        assert not [name for name in names if name.endswith('.part')] and 'PARTIAL001.zip' not in names, names
+        for sku in skus[:-2]:
+            with zipfile.ZipFile(os.path.join(output_dir, f"{sku}.zip")) as zf:
+                assert len(zf.namelist()) == len(SUFFIXES) and zf.testzip() is None, sku
+        return {'skus': len(skus), 'failed': len(failed), 'fake': dict(bank.stats)}
+    return run
+
+
+def scenario_slice_folder(size, workdir, args):
+    from slice_processor import process_slice_folder
+    source = os.path.join(workdir, 'slices_source')
+    synthetic.write_slice_folder(source, size)
+    target = os.path.join(workdir, 'slices')
+
+    def run():
+        # process_slice_folder 会原地改写文件，每次运行都从原始切图的副本开始 (复制时间也计入，但远小于编码)
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.copytree(source, target)
+        process_slice_folder(target)
+        output_bytes = sum(os.path.getsize(os.path.join(target, f)) for f in os.listdir(target))
+        return {'images': size, 'output_kb': output_bytes // 1024}
+    return run
+
+
+def scenario_slice_long_images(size, workdir, args):
+    # 整页详情图 (1500x30000，缩放后 750x15000) 切成约 1500px 高的多块，各块并行编码
+    from slice_processor import TILE_HEIGHT, process_slice_folder
+    source = os.path.join(workdir, 'long_source')
+    synthetic.write_slice_folder(source, size, width=1500, height=30000)
+    target = os.path.join(workdir, 'long_slices')
+
+    def run():
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.copytree(source, target)
+        process_slice_folder(target, tile_height=TILE_HEIGHT)
+        outputs = os.listdir(target)
+        return {'images': size, 'tiles': len(outputs),
+                'max_kb': max(os.path.getsize(os.path.join(target, f)) for f in outputs) // 1024}
+    return run
+
+
+SCENARIOS = {
+    'excel_b2c': scenario_excel_b2c,
+    'excel_longines': scenario_excel_longines,
+    'drive_links': scenario_drive_links,
+    'drive_links_quota': scenario_drive_links_quota,
+    'drive_links_concurrent': scenario_drive_links_concurrent,
+    'drive_links_recursive': scenario_drive_links_recursive,
+    'sheet_update': scenario_sheet_update,
+    'sheet_fanout': scenario_sheet_fanout,
+    'sheet_sync': scenario_sheet_sync,
+    'drive_watch': scenario_drive_watch,
+    'link_verify': scenario_link_verify,
+    'imagebank_http': scenario_imagebank_http,
+    'slice_folder': scenario_slice_folder,
+    'slice_long_images': scenario_slice_long_images,
+}
+
+
+def run_scenario(name, size, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        run = SCENARIOS[name](size, workdir, args)
+        timings, info = [], {}
+        for _ in range(args.runs):
+            output = io.StringIO()
+            # 处理函数会打印大量进度信息，默认不输出
+            redirect = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(output)
+            with redirect:
+                start = time.perf_counter()
+                info = run()
+                timings.append(time.perf_counter() - start)
+    return {
+        'size': size,
+        'median_seconds': round(statistics.median(timings), 4),
+        'min_seconds': round(min(timings), 4),
+        'info': info,
+    }
+
+
+def load_history():
+    if not os.path.exists(RESULTS_FILE):
+        return []
+    with open(RESULTS_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='核心流程基准测试 (无需 Google 凭证)')
+    parser.add_argument('--scale', choices=list(SCALES), default='small')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--only', help='逗号分隔的场景名，默认运行全部: ' + ','.join(SCENARIOS))
+    parser.add_argument('--latency', type=float, default=0.02, help='每次假 API 调用的延迟 (秒)')
+    parser.add_argument('--page-size', type=int, default=1000, help='假 Drive 单页最多返回的文件数')
+    parser.add_argument('--quota-error-rate', type=float, default=0.0, help='假 API 返回 429 的概率')
+    parser.add_argument('--threshold', type=float, default=0.10, help='比上次慢多少 (比例) 视为退化')
+    parser.add_argument('--verbose', action='store_true', help='显示处理函数自身的输出')
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.only.split(',')] if args.only else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    params = {'latency': args.latency, 'page_size': args.page_size, 'quota_error_rate': args.quota_error_rate}
+    history = load_history()
+    previous = next((r for r in reversed(history) if r['scale'] == args.scale and r['params'] == params), None)
+
+    print(f"🧪 规模 {args.scale}，每个场景运行 {args.runs} 次 (假 API 延迟 {args.latency * 1000:.0f}ms)")
+    results, regressions = {}, []
+    for name in names:
+        size = SCALES[args.scale][name]
+        result = results[name] = run_scenario(name, size, args)
+        line = f"   {name:<18} n={size:<6} 中位数 {result['median_seconds'] * 1000:>9.1f}ms"
+        old = (previous or {}).get('scenarios', {}).get(name)
+        if old and old['size'] == size and old['median_seconds']:
+            change = result['median_seconds'] / old['median_seconds'] - 1
+            line += f"  ({change:+.0%} vs {previous['revision'] or previous['timestamp']})"
+            if change > args.threshold:
+                regressions.append(name)
+                line += " ⚠️"
+        print(line)
+
+    history.append({
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'revision': git_revision(),
+        'scale': args.scale,
+        'runs': args.runs,
+        'params': params,
+        'scenarios': results,
+    })
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+
+    if regressions:
+        print(f"📉 以下场景比上次慢超过 {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
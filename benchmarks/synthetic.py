@@ -0,0 +1,176 @@
+# benchmarks/synthetic.py (合成测试数据：活动画板/画板工作簿、Figma 切图 ZIP、Drive 图片目录)
+#
+# 生成的数据结构与真实文件一致，可以直接交给 excel_processor / longines_processor / slice_processor 处理。
+# 所有生成函数都接受 seed，同样的参数总是得到同样的数据，便于前后两次结果对比。
+
+import os
+import random
+import zipfile
+from io import BytesIO
+
+BRANDS = ["天梭", "美度", "汉米尔顿", "雪铁纳", "帝舵"]
+SERIES = ["力洛克系列", "PRX超级玩家", "海星系列", "卡森臻我", "贝伦赛丽"]
+TITLES = ["臻选经典", "都市优雅", "运动腕表", "浪琴名匠", "情侣对表", "新品上市"]
+
+
+def b2c_skus(count, seed=0):
+    """B2C 项目的产品型号，例如 T1374071104100 / M0384301105100。"""
+    rng = random.Random(seed)
+    return [f"{rng.choice('TMHC')}{rng.randrange(10 ** 12, 10 ** 13)}{i % 10}" for i in range(count)]
+
+
+def longines_skus(count, seed=0):
+    """浪琴型号，例如 L2.793.4.72.6 去掉点后的 L27934726。"""
+    rng = random.Random(seed)
+    return [f"L{rng.randrange(1, 9)}{rng.randrange(100, 999)}{rng.randrange(1, 9)}{i:04d}" for i in range(count)]
+
+
+def make_b2c_workbook(path, count, seed=0):
+    """
+    生成 excel_processor 期望的工作簿：
+    '活动画板' 第 7 行起的 C~F 列排布型号 (夹杂中文说明)，'活动选款' 第 3 行为表头，包含商品SKU/表款描述/价格列。
+    返回写入的型号列表。
+    """
+    import pandas as pd
+
+    rng = random.Random(seed)
+    skus = b2c_skus(count, seed)
+    board_rows = []
+    for start in range(0, count, 4):
+        board_rows.append([None, None] + skus[start:start + 4] + [None] * (4 - len(skus[start:start + 4])))
+        if rng.random() < 0.2:
+            board_rows.append([None, None, rng.choice(TITLES), None, None, None])
+    board = pd.DataFrame(board_rows)
+
+    selection = pd.DataFrame({
+        '商品SKU': skus,
+        '表款描述': [f"{rng.choice(BRANDS)}{rng.choice(SERIES)}{rng.choice(['机械', '石英'])}{rng.choice(['男', '女'])}" for _ in skus],
+        '公价': [rng.randrange(2000, 40000) for _ in skus],
+        '销售价': [rng.randrange(1500, 35000) for _ in skus],
+        '券后价': [rng.randrange(1000, 30000) for _ in skus],
+    })
+
+    with pd.ExcelWriter(path) as writer:
+        board.to_excel(writer, sheet_name='活动画板', startrow=6, header=False, index=False)
+        selection.to_excel(writer, sheet_name='活动选款', startrow=2, index=False)
+    return skus
+
+
+def make_longines_workbook(path, count, seed=0):
+    """
+    生成 longines_processor 期望的工作簿：
+    '画板' 从第 3 行开始，大标题独占一行，其后若干行产品型号；'Sheet1' 为产品资料表。
+    返回写入的型号列表。
+    """
+    import pandas as pd
+
+    rng = random.Random(seed)
+    skus = longines_skus(count, seed)
+    rows = []
+    for i, sku in enumerate(skus):
+        if i % 12 == 0:
+            rows.append([rng.choice(TITLES), None, None])
+        rows.append([sku, f"{rng.choice(SERIES)} 建议零售价 ¥{rng.randrange(10000, 60000)}", None])
+    board = pd.DataFrame(rows)
+
+    sheet = pd.DataFrame({
+        'SKU': skus,
+        '建议零售价': [rng.randrange(10000, 60000) for _ in skus],
+        '分期价': [f"{rng.choice([3, 6, 12, 24])}期免息" for _ in skus],
+        '性别': [rng.choice(['Men', 'Women']) for _ in skus],
+        '机芯类型': [rng.choice(['自动上链机械机芯', '石英机芯']) for _ in skus],
+        '二级系列': [rng.choice(SERIES) for _ in skus],
+    })
+
+    with pd.ExcelWriter(path) as writer:
+        board.to_excel(writer, sheet_name='画板', startrow=2, header=False, index=False)
+        sheet.to_excel(writer, sheet_name='Sheet1', index=False)
+    return skus
+
+
+def make_slice_image(width, height, seed=0, image_format='JPEG'):
+    """一张带色块和文字的切图 (纯色图压缩率过高，测不出真实的编码开销)。"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    img = Image.new('RGB', (width, height), (rng.randrange(200, 255),) * 3)
+    draw = ImageDraw.Draw(img)
+    for y in range(0, height, 60):
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        draw.rectangle([rng.randrange(width // 4), y, rng.randrange(width // 2, width), y + rng.randrange(10, 50)], fill=color)
+        draw.text((rng.randrange(width // 2), y), "SALE ¥" * 8, fill=(0, 0, 0))
+    buffer = BytesIO()
+    img.save(buffer, image_format, **({'quality': 95} if image_format == 'JPEG' else {}))
+    return buffer.getvalue()
+
+
+def make_slice_zip(path, count, width=2250, height=1800, seed=0, png_ratio=0.2):
+    """
+    生成 Figma 导出的切图 ZIP：文件名如 "切片 12.jpg"，放在一个顶层文件夹内，部分为 PNG。
+    返回 ZIP 内图片数量。
+    """
+    rng = random.Random(seed)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zf:
+        for i in range(1, count + 1):
+            image_format = 'PNG' if rng.random() < png_ratio else 'JPEG'
+            extension = '.png' if image_format == 'PNG' else '.jpg'
+            zf.writestr(f"切图导出/切片 {i}{extension}", make_slice_image(width, height, seed + i, image_format))
+    return count
+
+
+def populate_drive(drive, project_folder, skus, coverage=0.9, extra_files=0, seed=0, seasons=0):
+    """
+    在 FakeDrive 中建立 项目文件夹/产品图、场景图，按 coverage 比例放入与型号同名的图片，
+    部分场景图带 _DETAIL 后缀 (走子串匹配)，extra_files 个无关文件用来放大列表规模。
+    seasons > 0 时图片分散在 产品图/场景图 下的 "季度/月份" 两级子文件夹中，返回的配置会开启递归查找。
+    返回项目配置字典 (可直接传给 build_image_index / find_image_links_for_df)。
+    """
+    from google_drive_finder import PRODUCT_IMG_FOLDER_NAME, SCENE_IMG_FOLDER_NAME
+
+    rng = random.Random(seed)
+    project_id = drive.add_folder(project_folder)
+    product_id = drive.add_folder(PRODUCT_IMG_FOLDER_NAME, project_id)
+    scene_id = drive.add_folder(SCENE_IMG_FOLDER_NAME, project_id)
+
+    def season_folders(root_id):
+        if not seasons:
+            return [root_id]
+        folders = []
+        for i in range(seasons):
+            season_id = drive.add_folder(f"{2020 + i // 2}{'春夏' if i % 2 == 0 else '秋冬'}", root_id)
+            folders += [drive.add_folder(f"{month}月", season_id) for month in range(1, 4)]
+        return folders
+
+    product_folders, scene_folders = season_folders(product_id), season_folders(scene_id)
+    covered = [sku for sku in skus if rng.random() < coverage]
+    for i, sku in enumerate(covered):
+        drive.add_files(product_folders[i % len(product_folders)], [f"{sku}.jpg"])
+        drive.add_files(scene_folders[i % len(scene_folders)], [f"{sku}{'_DETAIL' if rng.random() < 0.3 else ''}.jpg"])
+    drive.add_files(product_id, [f"OTHER_{i:06d}.jpg" for i in range(extra_files)])
+
+    config = {'display_name': project_folder, 'drive_folder': project_folder, 'processor': 'excel_processor'}
+    if seasons:
+        config['source_folders'] = [
+            {'path': PRODUCT_IMG_FOLDER_NAME, 'column': 'product_image', 'recursive': True},
+            {'path': SCENE_IMG_FOLDER_NAME, 'column': 'scene_image', 'recursive': True},
+        ]
+    return config
+
+
+def sku_frame(skus, extra_columns=3):
+    """只含 model_sku 和若干文本列的 DataFrame，用于链接匹配与回写场景。"""
+    import pandas as pd
+
+    data = {'sort_order': range(1, len(skus) + 1), 'model_sku': list(skus)}
+    for i in range(extra_columns):
+        data[f'col_{i}'] = [f"value {i}-{n}" for n in range(len(skus))]
+    return pd.DataFrame(data)
+
+
+def write_slice_folder(folder, count, width=2250, height=1800, seed=0):
+    """直接把切图写到文件夹 (不经过 ZIP)，供 process_slice_folder 场景使用。"""
+    os.makedirs(folder, exist_ok=True)
+    for i in range(1, count + 1):
+        with open(os.path.join(folder, f"切片 {i}.jpg"), 'wb') as f:
+            f.write(make_slice_image(width, height, seed + i))
+    return count
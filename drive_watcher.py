@@ -0,0 +1,221 @@
+# drive_watcher.py (监听 Drive 变更：有新图片上传到项目的图片来源文件夹时，自动为受影响的表格做增量同步)
+#
+# 每个周期只调用一次 changes().list (变更很多时按页继续)，拿到自上次以来变化的文件；
+# 只关心父文件夹属于某个项目图片来源 (含递归的子文件夹) 的文件，把文件名映射回 SKU，
+# 再根据每个已登记表格的同步状态 (sync_state 中记录了该表格的全部 SKU) 找出受影响的表格，交给调用方排队同步。
+#
+# 登记表保存在 <state_dir>/watch_registry.json: {"表格ID": {"project_type": "...", "registered_at": "..."}}，
+# Mode A 每次同步成功后自动登记。
+
+import json
+import os
+import threading
+import time
+import traceback
+
+import sync_state
+from task_metrics import incr
+
+REGISTRY_FILE = 'watch_registry.json'
+CHANGE_FIELDS = 'nextPageToken,newStartPageToken,changes(fileId,removed,file(name,mimeType,parents,trashed))'
+
+_registry_lock = threading.Lock()
+_watcher_thread = None
+
+
+def load_registry(state_dir):
+    try:
+        with open(os.path.join(state_dir, REGISTRY_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (ValueError, OSError) as e:
+        print(f"⚠️ 监听登记表损坏，已忽略: {e}")
+        return {}
+
+
+def _save_registry(state_dir, registry):
+    os.makedirs(state_dir, exist_ok=True)
+    path = os.path.join(state_dir, REGISTRY_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(registry, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def register_sheet(state_dir, spreadsheet_id, project_type):
+    """登记一个需要自动同步的表格 (已登记且项目未变时不重写文件)。"""
+    with _registry_lock:
+        registry = load_registry(state_dir)
+        if registry.get(spreadsheet_id, {}).get('project_type') == project_type:
+            return
+        registry[spreadsheet_id] = {'project_type': project_type, 'registered_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+        _save_registry(state_dir, registry)
+
+
+def unregister_sheet(state_dir, spreadsheet_id):
+    with _registry_lock:
+        registry = load_registry(state_dir)
+        if registry.pop(spreadsheet_id, None) is not None:
+            _save_registry(state_dir, registry)
+
+
+def fetch_changes(service, page_token):
+    """从 page_token 开始读取全部变更，返回 (变更列表, 下一次使用的 page token)。"""
+    from google_drive_finder import execute_with_retry
+
+    changes = []
+    while True:
+        response = execute_with_retry(service.changes().list(
+            pageToken=page_token, fields=CHANGE_FIELDS, pageSize=1000, includeRemoved=True, spaces='drive'))
+        incr('drive_change_pages')
+        changes.extend(response.get('changes', []))
+        if 'newStartPageToken' in response:
+            return changes, response['newStartPageToken']
+        page_token = response['nextPageToken']
+
+
+def watched_folders(config, project_types, creds):
+    """
+    列出各项目的图片来源文件夹 (含递归子文件夹)，返回 {folder_id: (项目类型, 是否递归)}。
+    顺带得到的文件列表会被丢弃：这里只需要文件夹 ID，真正的同步会重新构建 (单飞合并) 文件列表。
+    """
+    from google_drive_finder import build_image_index
+
+    folders = {}
+    for project_type in sorted(project_types):
+        if project_type not in config:
+            print(f"⚠️ 监听登记的项目 '{project_type}' 不在 config.json 中，已跳过。")
+            continue
+        visited = {}
+        if build_image_index(config[project_type], creds, visited) is None:
+            print(f"⚠️ 项目 '{project_type}' 的图片来源文件夹不存在，暂不监听。")
+        for folder_id, recursive in visited.items():
+            folders[folder_id] = (project_type, recursive)
+    return folders
+
+
+def changed_names(changes, folders):
+    """
+    把变更归到项目：返回 {项目类型: {大写文件名 (不含扩展名)}}。
+    递归来源下新建的子文件夹会被加入 folders，之后放进去的图片也能被识别。
+    只给出 fileId 的删除记录无法判断所属项目，会被忽略 (移到回收站的文件仍带有文件信息)。
+    """
+    from google_drive_finder import FOLDER_MIME_TYPE
+
+    names = {}
+    for change in changes:
+        file = change.get('file')
+        if change.get('removed') or not file:
+            continue
+        parent = next((p for p in file.get('parents', []) if p in folders), None)
+        if parent is None:
+            continue
+        project_type, recursive = folders[parent]
+        if file.get('mimeType') == FOLDER_MIME_TYPE:
+            if recursive and not file.get('trashed'):
+                folders[change['fileId']] = (project_type, recursive)
+            continue
+        names.setdefault(project_type, set()).add(os.path.splitext(file.get('name', ''))[0].upper())
+    return names
+
+
+def affected_sheets(registry, names_by_project, state_dir):
+    """
+    找出包含变更 SKU 的表格，返回 {表格ID: (项目类型, {SKU})}。
+    匹配规则与 search_link 一致：文件名等于 SKU，或文件名中包含 SKU (例如 H11221851_DETAIL)。
+    还没有同步状态的表格不知道包含哪些 SKU，跳过 (先在页面上做一次 Mode A 同步)。
+    """
+    affected = {}
+    for spreadsheet_id, entry in registry.items():
+        names = names_by_project.get(entry['project_type'])
+        if not names:
+            continue
+        skus = sync_state.state_skus(sync_state.load_state(state_dir, spreadsheet_id))
+        hits = set()
+        for name in names:
+            if name in skus:
+                hits.add(name)
+            else:
+                hits.update(sku for sku in skus if sku and sku in name)
+        if hits:
+            affected[spreadsheet_id] = (entry['project_type'], hits)
+    return affected
+
+
+def poll_once(watch, service, creds, config, state_dir):
+    """
+    执行一次轮询，返回受影响的表格 (见 affected_sheets)。watch 是在多次轮询之间保留的状态字典:
+    {'page_token': ..., 'folders': {...}, 'projects': 已列取文件夹的项目集合} (watch_cycle 还会存入 service / creds)。
+    第一次轮询只记录起始 page token，不产生同步 (此前上传的图片由手动同步处理)。
+    """
+    registry = load_registry(state_dir)
+    projects = {entry['project_type'] for entry in registry.values()}
+    if not projects:
+        return {}
+    if watch.get('projects') != projects:
+        watch['folders'] = watched_folders(config, projects, creds)
+        watch['projects'] = projects
+    if not watch.get('page_token'):
+        from google_drive_finder import execute_with_retry
+        watch['page_token'] = execute_with_retry(service.changes().getStartPageToken())['startPageToken']
+        print(f"👀 开始监听 {len(projects)} 个项目的 {len(watch['folders'])} 个图片文件夹 ({len(registry)} 个表格)")
+        return {}
+
+    changes, watch['page_token'] = fetch_changes(service, watch['page_token'])
+    names = changed_names(changes, watch['folders'])
+    if not names:
+        return {}
+    return affected_sheets(registry, names, state_dir)
+
+
+def backoff_delay(failures, interval_seconds, max_backoff_seconds):
+    """连续失败 failures 次后下一轮的等待时间：interval * 2^failures，最长 max_backoff_seconds。"""
+    if not failures:
+        return interval_seconds
+    return min(interval_seconds * 2 ** failures, max_backoff_seconds)
+
+
+def watch_cycle(watch, config, state_dir, enqueue):
+    """
+    监听线程的一个周期：没有 Drive 服务时先授权 (结果存入 watch['service'] / watch['creds'])，
+    轮询一次，并对每个受影响的表格调用 enqueue(表格ID, 项目类型, SKU集合)。出错时抛出异常，由调用方退避。
+    """
+    if watch.get('service') is None:
+        from google_drive_finder import authenticate_google_drive, build
+
+        creds = authenticate_google_drive()
+        if creds is None:
+            raise RuntimeError("Google 授权失败")
+        watch['creds'], watch['service'] = creds, build('drive', 'v3', credentials=creds)
+    affected = poll_once(watch, watch['service'], watch.get('creds'), config, state_dir)
+    for spreadsheet_id, (project_type, skus) in affected.items():
+        print(f"🔔 表格 {spreadsheet_id} 有 {len(skus)} 个 SKU 出现新图片，已排队同步")
+        enqueue(spreadsheet_id, project_type, skus)
+    return affected
+
+
+def start_watcher(config, state_dir, enqueue, interval_seconds, max_backoff_seconds):
+    """
+    启动监听线程 (守护线程，进程内只启动一次)，每隔 interval_seconds 执行一次 watch_cycle。
+    出错时按 backoff_delay 退避；授权失效后下一轮会重新授权。
+    """
+    global _watcher_thread
+    if _watcher_thread is not None and _watcher_thread.is_alive():
+        return _watcher_thread
+
+    def loop():
+        watch, failures = {}, 0
+        while True:
+            try:
+                watch_cycle(watch, config, state_dir, enqueue)
+                failures = 0
+            except Exception:
+                failures += 1
+                watch['service'] = None
+                print(f"⚠️ Drive 监听出错 (连续第 {failures} 次):")
+                traceback.print_exc()
+            time.sleep(backoff_delay(failures, interval_seconds, max_backoff_seconds))
+
+    _watcher_thread = threading.Thread(target=loop, name='drive-watcher', daemon=True)
+    _watcher_thread.start()
+    return _watcher_thread
@@ -3,6 +3,8 @@
 import pandas as pd
 import re
 
+from frame_utils import compact_frame
+
 def clean_product_name(name):
     # (此函数无需修改)
     if not isinstance(name, str): return None, ""
@@ -100,7 +102,8 @@ def process_excel_file(input_path):
         
         final_df.insert(0, 'sort_order', range(1, 1 + len(final_df)))
         
-        return final_df
+        # 品牌、系列等重复度高的列转为 category，后续匹配链接和回写表格都不再复制
+        return compact_frame(final_df)
     except Exception as e:
         import traceback
         print(f"处理B2C文件时发生错误: {e}")
@@ -0,0 +1,88 @@
+# frame_utils.py (数据流中 DataFrame 的紧凑表示与低拷贝转换)
+#
+# 表格数据几乎都是字符串，而且除 SKU 外重复度很高 (品牌、系列、空白的图片链接……)。
+# object 列的每个单元格都是独立的 Python 对象，十万行级别时内存主要花在这里，因此:
+#   - 重复度高的字符串列转为 category (整数编码 + 一份不重复值)，其余转为 string[pyarrow] (未安装 pyarrow 时为 string)；
+#   - 大写、去空格等变换和图片链接查找只对不重复值做一次，结果直接以编码形式拼回整列；
+#   - 按列、按块直接生成 Sheets 的 values 二维列表，不再 fillna('') 复制整表，也不经过 .values 的二维 object 数组。
+
+import numpy as np
+import pandas as pd
+
+CATEGORY_MAX_RATIO = 0.5  # 不重复值占比不超过此比例的列转为 category
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = 'string[pyarrow]'
+except ImportError:
+    STRING_DTYPE = 'string'
+
+
+def compact_frame(df, category_max_ratio=CATEGORY_MAX_RATIO):
+    """
+    原地把纯字符串的 object 列转为 category 或 STRING_DTYPE，返回 df。
+    按位置逐列替换 (表头重名的列也能处理)；混有数字等其它类型的列保持不变，避免写回表格时改变单元格的值。
+    """
+    for position in range(df.shape[1]):
+        series = df.iloc[:, position]
+        if series.dtype != object or pd.api.types.infer_dtype(series, skipna=True) != 'string':
+            continue
+        if series.nunique() <= len(series) * category_max_ratio:
+            df.isetitem(position, series.astype('category'))
+        else:
+            df.isetitem(position, series.astype(STRING_DTYPE))
+    return df
+
+
+def factorize_text(series, transform=None):
+    """
+    把一列编码为 (codes, labels)：labels 为不重复的字符串 (NA 记为 '')，codes[i] 是第 i 行在 labels 中的下标。
+    transform (例如 str.upper) 只对不重复值调用一次，变换后相同的值合并为同一个编码。
+    """
+    codes, uniques = pd.factorize(series)
+    labels = [str(value) for value in uniques]
+    if transform is not None:
+        labels = [transform(label) for label in labels]
+    # NA 的编码为 -1，正好指向末尾追加的 ''
+    labels.append('')
+    merged_codes, merged_labels = pd.factorize(np.asarray(labels, dtype=object))
+    return merged_codes[codes], merged_labels
+
+
+def text_values(series, transform=None):
+    """一列的字符串列表 (NA 为 '')，代替 fillna('').astype(str).tolist()，不复制整列。"""
+    codes, labels = factorize_text(series, transform)
+    return labels[codes].tolist()
+
+
+def categorical_text(series, transform=None):
+    """与 text_values 相同，但结果为 category 列 (保留原索引)。"""
+    codes, labels = factorize_text(series, transform)
+    return pd.Series(pd.Categorical.from_codes(codes, labels), index=series.index, name=series.name)
+
+
+def _cell_values(series):
+    """一列转为可直接放进 Sheets 请求的 Python 值 (NA 为 '')。category 列按编码查表，不逐个构造对象。"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = np.asarray(series.cat.categories.tolist() + [''], dtype=object)
+        return categories[series.cat.codes.to_numpy()].tolist()
+    values = series.tolist()
+    if series.hasnans:
+        return ['' if pd.isna(value) else value for value in values]
+    return values
+
+
+def sheet_value_chunks(df, chunk_rows):
+    """
+    按块生成 values().update 的数据 (表格起始行号, 二维列表)：第一块以表头开头，行号从 1 开始。
+    每次只物化 chunk_rows 行，整表不会同时以 Python 列表的形式存在。
+    """
+    header = df.columns.tolist()
+    for start in range(0, len(df) + 1, chunk_rows):
+        # 表格第 start 行 (从 0 开始) 对应数据的第 start - 1 行，第 0 行是表头
+        part = df.iloc[max(start - 1, 0):start + chunk_rows - 1]
+        columns = [_cell_values(part.iloc[:, position]) for position in range(part.shape[1])]
+        rows = [list(row) for row in zip(*columns)]
+        if start == 0:
+            rows.insert(0, header)
+        yield start + 1, rows
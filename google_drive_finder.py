@@ -1,9 +1,10 @@
 import os
 import pandas as pd
 import socket
-import time
 import re
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -11,6 +12,11 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from google.auth.exceptions import RefreshError
 
+import task_control
+from frame_utils import compact_frame, factorize_text, sheet_value_chunks
+from task_control import checkpoint, TaskCancelled
+from task_metrics import incr, submit
+
 # (全局设置保持不变)
 socket.setdefaulttimeout(300)
 PROXY_PORT = "17890" 
@@ -18,6 +24,23 @@ os.environ['HTTPS_PROXY'] = f'http://127.0.0.1:{PROXY_PORT}'
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly', 'https://www.googleapis.com/auth/spreadsheets']
 PRODUCT_IMG_FOLDER_NAME = "产品图"
 SCENE_IMG_FOLDER_NAME = "场景图"
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+# 项目配置没有 source_folders 时的默认图片来源 (与最初只查两个固定子文件夹的行为一致)
+DEFAULT_SOURCE_FOLDERS = [
+    {'path': PRODUCT_IMG_FOLDER_NAME, 'column': 'product_image', 'recursive': False},
+    {'path': SCENE_IMG_FOLDER_NAME, 'column': 'scene_image', 'recursive': False},
+]
+LISTING_PAGE_SIZE = 1000  # Drive files.list 单页上限
+LISTING_WORKERS = 8  # 递归遍历时同时列取的文件夹数
+RETRY_DELAY_SECONDS = 5  # API 限流/网络错误时的重试间隔，基准测试中会调小
+# 图片链接：<base><file_id><尺寸后缀>。=s0 为原图，=w750 按宽度缩放，=s1500 限制长边；项目配置可按列覆盖
+IMAGE_LINK_BASE = "https://lh3.googleusercontent.com/d/"
+DEFAULT_LINK_SIZE = "=s0"
+SHEET_WRITE_CHUNK_ROWS = 5000  # 整表覆写时每次请求写入的行数，块之间可以取消任务
+
+# 正在进行中的文件夹列取：folder_id -> {'done': Event, 'result': list, 'error': Exception}
+_inflight_listings = {}
+_inflight_lock = threading.Lock()
 
 def authenticate_google_drive():
     """
@@ -78,91 +101,248 @@ def authenticate_google_drive():
 
 def execute_with_retry(api_call):
     for attempt in range(3):
+        # 每次请求前都是安全点 (翻页时也会经过这里)；整表覆写期间由 uninterruptible() 屏蔽
+        checkpoint()
+        if attempt: incr('api_retries')
+        incr('api_calls')
         try:
             return api_call.execute()
         except HttpError as e:
             if e.resp.status in [429, 500, 502, 503, 504]:
-                print(f"⚠️ API请求失败 (状态码: {e.resp.status})，将在5秒后重试 (第 {attempt + 1}/3 次)...")
-                time.sleep(5)
+                print(f"⚠️ API请求失败 (状态码: {e.resp.status})，将在{RETRY_DELAY_SECONDS}秒后重试 (第 {attempt + 1}/3 次)...")
+                task_control.sleep(RETRY_DELAY_SECONDS)
             else: raise e
         except Exception as e:
-            print(f"⚠️ 发生网络连接错误 ({type(e).__name__})，将在5秒后重试 (第 {attempt + 1}/3 次)...")
-            time.sleep(5)
+            print(f"⚠️ 发生网络连接错误 ({type(e).__name__})，将在{RETRY_DELAY_SECONDS}秒后重试 (第 {attempt + 1}/3 次)...")
+            task_control.sleep(RETRY_DELAY_SECONDS)
     raise Exception("API请求在重试3次后仍然失败。")
 
 def get_folder_id(service, folder_name, parent_id=None):
-    query = f"mimeType='application/vnd.google-apps.folder' and name='{folder_name}'"
+    escaped_name = folder_name.replace("\\", "\\\\").replace("'", "\\'")
+    query = f"mimeType='{FOLDER_MIME_TYPE}' and name='{escaped_name}'"
     if parent_id: query += f" and '{parent_id}' in parents"
     response = execute_with_retry(service.files().list(q=query, fields='files(id, name)'))
     files = response.get('files', [])
     return files[0]['id'] if files else None
 
-def get_all_files_in_folder(service, folder_id):
+def get_folder_id_by_path(service, path, root_id):
+    """按 "2025秋冬/产品图" 这样的相对路径逐级查找子文件夹，找不到时返回 None。"""
+    folder_id = root_id
+    for name in [part for part in path.split('/') if part.strip()]:
+        folder_id = get_folder_id(service, name.strip(), folder_id)
+        if not folder_id: return None
+    return folder_id
+
+def list_folder_entries(service, folder_id):
     """
-    获取文件夹中所有文件的ID和名称，并将名称统一转换为大写作为Map的Key。
-    以解决大小写敏感的文件匹配问题。
+    列出文件夹的直接子项 (文件和子文件夹)，返回 [{'id', 'name', 'mimeType'}]。
+    同一文件夹的并发请求只会真正列取一次 (single-flight)：后到的线程等待进行中的那次列取并共用结果，
+    返回的列表在线程间共享，调用方不应修改。
     """
-    file_map, page_token = {}, None
+    with _inflight_lock:
+        call = _inflight_listings.get(folder_id)
+        is_leader = call is None
+        if is_leader:
+            call = _inflight_listings[folder_id] = {'done': threading.Event(), 'result': None, 'error': None}
+
+    if not is_leader:
+        incr('drive_listings_coalesced')
+        print(f"🔗 文件夹 {folder_id} 正在被其它任务列取，等待共用结果...")
+        task_control.wait(call['done'])
+        if isinstance(call['error'], TaskCancelled):
+            # 发起列取的任务被取消了，不代表本任务失败：自己重新列取
+            return list_folder_entries(service, folder_id)
+        if call['error'] is not None:
+            raise call['error']
+        return call['result']
+
+    try:
+        call['result'] = _list_folder_entries(service, folder_id)
+        return call['result']
+    except Exception as e:
+        call['error'] = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight_listings.pop(folder_id, None)
+        call['done'].set()
+
+def _list_folder_entries(service, folder_id):
+    incr('drive_listings')
+    entries, page_token = [], None
     while True:
-        response = execute_with_retry(service.files().list(q=f"'{folder_id}' in parents", fields='nextPageToken, files(id, name)', pageToken=page_token))
-        for file in response.get('files', []):
-            # *** 关键修改：将文件名（作为key）统一转换为大写，以实现大小写不敏感查找 ***
-            filename_no_ext = os.path.splitext(file.get('name'))[0].upper() 
-            file_map[filename_no_ext] = file.get('id')
+        # 每页取最大的 1000 条 (默认只有 100 条)，大文件夹的翻页次数减少到十分之一
+        response = execute_with_retry(service.files().list(
+            q=f"'{folder_id}' in parents and trashed = false", pageSize=LISTING_PAGE_SIZE,
+            fields='nextPageToken, files(id, name, mimeType)', pageToken=page_token))
+        incr('drive_pages')
+        entries.extend(response.get('files', []))
         page_token = response.get('nextPageToken', None)
         if page_token is None: break
+    return entries
+
+def get_all_files_in_folder(service, folder_id):
+    """
+    获取文件夹中所有文件的ID和名称，并将名称统一转换为大写作为Map的Key。
+    以解决大小写敏感的文件匹配问题。
+    """
+    file_map = {}
+    for file in list_folder_entries(service, folder_id):
+        # *** 关键修改：将文件名（作为key）统一转换为大写，以实现大小写不敏感查找 ***
+        filename_no_ext = os.path.splitext(file.get('name'))[0].upper()
+        file_map[filename_no_ext] = file.get('id')
     return file_map
 
+def walk_source_folders(creds, sources, visited_folders=None):
+    """
+    广度优先遍历各图片来源文件夹。sources 为 [(优先级, folder_id, 是否递归)]。
+    同一层的所有文件夹在线程池中并发列取 (每个线程使用自己的 Drive service，googleapiclient 的 service 不是线程安全的)。
+    返回按 (优先级, 层级, 列取顺序) 排好的 [(优先级, 文件条目)]。
+    传入 visited_folders (dict) 时，会记录遍历到的每个文件夹: folder_id -> 是否递归。
+    """
+    local = threading.local()
+
+    def list_in_worker(folder_id):
+        if not hasattr(local, 'service'):
+            local.service = build('drive', 'v3', credentials=creds)
+        return list_folder_entries(local.service, folder_id)
+
+    collected = []
+    frontier = list(sources)
+    seen = {folder_id for _, folder_id, _ in sources}
+    with ThreadPoolExecutor(max_workers=LISTING_WORKERS, thread_name_prefix='drive-walk') as pool:
+        while frontier:
+            futures = [submit(pool, list_in_worker, folder_id) for _, folder_id, _ in frontier]
+            next_frontier = []
+            for (priority, folder_id, recursive), future in zip(frontier, futures):
+                if visited_folders is not None:
+                    visited_folders[folder_id] = recursive
+                for entry in future.result():
+                    if entry.get('mimeType') == FOLDER_MIME_TYPE:
+                        if recursive and entry['id'] not in seen:
+                            seen.add(entry['id'])
+                            next_frontier.append((priority, entry['id'], recursive))
+                    else:
+                        collected.append((priority, entry))
+            frontier = next_frontier
+    # sort 是稳定的：同一优先级内保持 层级 -> 列取顺序
+    collected.sort(key=lambda item: item[0])
+    return collected
+
+def build_image_index(project_config: dict, creds, visited_folders=None):
+    """
+    列出项目的所有图片来源文件夹，返回 {输出列名: {大写文件名: file_id}}。
+    来源由项目配置的 source_folders 决定 (默认是主文件夹下的 产品图/场景图)，每项为
+    {"path": "相对 drive_folder 的路径", "column": "输出列名", "recursive": 是否包含子文件夹}，
+    排在前面的来源优先：同名文件只保留优先级最高、层级最浅的那一个，因此无论配置多少个文件夹，查找都只是一次字典访问。
+    只依赖项目配置和凭证，不依赖 Excel 数据，因此可以与 Excel 解析并行执行。
+    主文件夹或全部来源文件夹都不存在时返回 None。
+    visited_folders 见 walk_source_folders (文件夹监听用它判断某个变更是否属于本项目)。
+    """
+    drive_service = build('drive', 'v3', credentials=creds)
+    PARENT_FOLDER_NAME = project_config['drive_folder']
+    print(f"项目: '{project_config['display_name']}', 正在查找主文件夹 '{PARENT_FOLDER_NAME}'...")
+    parent_folder_id = get_folder_id(drive_service, PARENT_FOLDER_NAME)
+    if not parent_folder_id: return None
+
+    source_folders = project_config.get('source_folders') or DEFAULT_SOURCE_FOLDERS
+    print(f"正在查找 {len(source_folders)} 个图片来源文件夹...")
+    sources, image_index = [], {}
+    for priority, source in enumerate(source_folders):
+        image_index.setdefault(source['column'], {})
+        folder_id = get_folder_id_by_path(drive_service, source['path'], parent_folder_id)
+        if not folder_id:
+            print(f"⚠️ 找不到来源文件夹 '{PARENT_FOLDER_NAME}/{source['path']}'，已跳过。")
+            continue
+        sources.append((priority, folder_id, bool(source.get('recursive', False))))
+    if not sources: return None
+    print("正在缓存文件夹中的所有文件名...")
+
+    # 所有 key 都是大写文件名 (不含扩展名)
+    for priority, entry in walk_source_folders(creds, sources, visited_folders):
+        column = source_folders[priority]['column']
+        image_index[column].setdefault(os.path.splitext(entry.get('name'))[0].upper(), entry.get('id'))
+    print(f"文件名缓存完成！共 {sum(len(m) for m in image_index.values())} 个文件。")
+    return image_index
+
+def project_link_format(project_config):
+    """
+    项目的链接格式：link_base 覆盖默认的 lh3 地址 (例如测试用的本地服务，需以 /d/ 结尾)，
+    link_sizes 为每个输出列的尺寸后缀，例如 {"product_image": "=w750"}。
+    """
+    return {'base': project_config.get('link_base', IMAGE_LINK_BASE), 'sizes': dict(project_config.get('link_sizes', {}))}
+
+def link_columns(project_config):
+    """项目输出的图片链接列名 (按来源文件夹顺序，去重)。"""
+    source_folders = project_config.get('source_folders') or DEFAULT_SOURCE_FOLDERS
+    return list(dict.fromkeys(source['column'] for source in source_folders))
+
+def search_link(model_number, file_map, size=DEFAULT_LINK_SIZE, base=IMAGE_LINK_BASE):
+    # model_number 保证是大写的，file_map 的 key 也是大写的
+    if not model_number: return ""
+
+    # 1. 优先进行精确匹配 (model_number == 文件名, 例如 H11221851)
+    if model_number in file_map:
+        file_id = file_map[model_number]
+        return f"{base}{file_id}{size}"
+
+    # 2. 回退到子串匹配，用于查找带有后缀的文件名（例如：H11221851_DETAIL）
+    for file_name_upper, file_id in file_map.items():
+        if model_number in file_name_upper:
+            return f"{base}{file_id}{size}"
+    return ""
+
+def normalize_sku(sku):
+    """查找图片时 SKU 的统一写法 (去掉首尾空白并转为大写)；同步指纹、多表同步与链接匹配都使用它。"""
+    return sku.strip().upper()
+
+def match_image_links(codes, skus, image_index, link_format=None):
+    """
+    为 factorize_text 编码后的 SKU 生成各链接列 ({列名: pandas Categorical})。
+    每个不重复的 SKU 只调用一次 search_link (子串匹配要扫描整个文件列表)，同一个链接在整列中只存一份。
+    """
+    base = (link_format or {}).get('base', IMAGE_LINK_BASE)
+    sizes = (link_format or {}).get('sizes', {})
+    columns = {}
+    for column, file_map in image_index.items():
+        size = sizes.get(column, DEFAULT_LINK_SIZE)
+        link_codes, links = pd.factorize(pd.Series([search_link(sku, file_map, size, base) for sku in skus], dtype=object))
+        row_codes = link_codes[codes]
+        columns[column] = pd.Categorical.from_codes(row_codes, links)
+        incr('links_matched', int((links != "")[row_codes].sum()))
+    return columns
+
+def apply_image_links(df: pd.DataFrame, image_index: dict, link_format=None):
+    """根据 build_image_index 的结果，为每一行填充图片链接列 (原地修改)。link_format 见 project_link_format，默认为原图链接。"""
+    if df is None or df.empty or not image_index: return df
+    # *** 安全保障：确保用于查找的SKU是大写且没有首尾空白 (只对不重复的 SKU 做变换，结果为 category 列) ***
+    codes, skus = factorize_text(df['model_sku'], normalize_sku)
+    df['model_sku'] = pd.Categorical.from_codes(codes, skus)
+
+    print("开始为每一行数据匹配图片链接...")
+    for column, links in match_image_links(codes, skus, image_index, link_format).items():
+        df[column] = links
+    print("图片链接匹配完成！")
+    return df
+
 def find_image_links_for_df(df: pd.DataFrame, project_config: dict, creds):
     if df is None or df.empty: return df
     try:
-        drive_service = build('drive', 'v3', credentials=creds)
-        PARENT_FOLDER_NAME = project_config['drive_folder']
-        print(f"项目: '{project_config['display_name']}', 正在查找主文件夹 '{PARENT_FOLDER_NAME}'...")
-        parent_folder_id = get_folder_id(drive_service, PARENT_FOLDER_NAME)
-        if not parent_folder_id: return df
-        
-        # *** 安全保障：确保用于查找的SKU在当前函数中也是大写 ***
-        df['model_sku'] = df['model_sku'].astype(str).str.upper() 
-
-        print(f"正在查找子文件夹 '{PRODUCT_IMG_FOLDER_NAME}' 和 '{SCENE_IMG_FOLDER_NAME}'...")
-        product_folder_id = get_folder_id(drive_service, PRODUCT_IMG_FOLDER_NAME, parent_folder_id)
-        scene_folder_id = get_folder_id(drive_service, SCENE_IMG_FOLDER_NAME, parent_folder_id)
-        if not (product_folder_id and scene_folder_id): return df
-        print("正在缓存文件夹中的所有文件名...")
-        
-        # 此时，product_file_map 和 scene_file_map 中的 keys 都是大写文件名
-        product_file_map = get_all_files_in_folder(drive_service, product_folder_id)
-        scene_file_map = get_all_files_in_folder(drive_service, scene_folder_id)
-        
-        print("文件名缓存完成！")
-        
-        def search_link(model_number, file_map):
-            # model_number 保证是大写的，file_map 的 key 也是大写的
-            if not model_number: return ""
-            
-            # 1. 优先进行精确匹配 (model_number == 文件名, 例如 H11221851)
-            if model_number in file_map:
-                file_id = file_map[model_number]
-                return f"https://lh3.googleusercontent.com/d/{file_id}=s0"
-                
-            # 2. 回退到子串匹配，用于查找带有后缀的文件名（例如：H11221851_DETAIL）
-            for file_name_upper, file_id in file_map.items():
-                if model_number in file_name_upper: 
-                    return f"https://lh3.googleusercontent.com/d/{file_id}=s0"
-            return ""
-
-        print("开始为每一行数据匹配图片链接...")
-        # 由于 df['model_sku'] 已经是大写，这里调用 search_link 就能实现大小写不敏感查找
-        df['product_image'] = df['model_sku'].apply(lambda x: search_link(x, product_file_map))
-        df['scene_image'] = df['model_sku'].apply(lambda x: search_link(x, scene_file_map))
-        print("图片链接匹配完成！")
-        return df
+        image_index = build_image_index(project_config, creds)
+        return apply_image_links(df, image_index, project_link_format(project_config))
+    except TaskCancelled:
+        raise
     except Exception:
         print("查找Google Drive图片时发生严重错误:")
         traceback.print_exc()
         return df # 返回原始df而不是None，以防后续流程崩溃
 
+def write_sheet_chunk(sheet_api, spreadsheet_id, sheet_title, first_row, rows):
+    """把一块数据写到表格的第 first_row 行起 (A 列开始)。"""
+    body = {'values': rows}
+    execute_with_retry(sheet_api.values().update(spreadsheetId=spreadsheet_id, range=f'{sheet_title}!A{first_row}', valueInputOption='USER_ENTERED', body=body))
+    incr('sheet_cells_written', sum(len(row) for row in rows))
+
 def update_google_sheet(spreadsheet_id, df: pd.DataFrame, creds):
     try:
         print("正在连接 Google Sheets API...")
@@ -171,20 +351,131 @@ def update_google_sheet(spreadsheet_id, df: pd.DataFrame, creds):
         sheet_metadata = execute_with_retry(sheet_api.get(spreadsheetId=spreadsheet_id))
         first_sheet_name = sheet_metadata.get('sheets', [{}])[0].get('properties', {}).get('title', 'Sheet1')
         print(f"检测到目标工作表名称为: '{first_sheet_name}'")
-        df_cleaned = df.fillna('')
-        values = [df_cleaned.columns.values.tolist()] + df_cleaned.values.tolist()
-        print(f"正在清空目标表格 '{first_sheet_name}' (这可能需要几分钟，请耐心等待)...")
-        execute_with_retry(sheet_api.values().clear(spreadsheetId=spreadsheet_id, range=first_sheet_name))
-        print("正在写入新数据...")
-        body = {'values': values}
-        execute_with_retry(sheet_api.values().update(spreadsheetId=spreadsheet_id, range=f'{first_sheet_name}!A1', valueInputOption='USER_ENTERED', body=body))
+        # 按块直接从各列生成请求数据，不复制整表
+        chunks = sheet_value_chunks(df, SHEET_WRITE_CHUNK_ROWS)
+        # 清空和第一块 (含表头) 之间不响应取消，避免留下一张空白的表格；之后每块之间都可以取消或因超时停止
+        checkpoint()
+        with task_control.uninterruptible():
+            print(f"正在清空目标表格 '{first_sheet_name}' (这可能需要几分钟，请耐心等待)...")
+            execute_with_retry(sheet_api.values().clear(spreadsheetId=spreadsheet_id, range=first_sheet_name))
+            print("正在写入新数据...")
+            write_sheet_chunk(sheet_api, spreadsheet_id, first_sheet_name, *next(chunks))
+        for first_row, rows in chunks:
+            checkpoint()
+            write_sheet_chunk(sheet_api, spreadsheet_id, first_sheet_name, first_row, rows)
         print("🎉 成功将数据更新到Google Sheet！")
         return True
+    except TaskCancelled:
+        raise
     except Exception:
-        print(f"更新Google Sheet时发生严重错误:")
+        print("更新Google Sheet时发生严重错误:")
         traceback.print_exc()
         return False
 
+def column_letter(index):
+    """列号 (从 0 开始) 转为 A1 表示法的列字母：0 -> A, 26 -> AA。"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def sheet_cell_ranges(sheet_title, cells):
+    """
+    把 [(数据行号, 列号, 值)] 转为 values().batchUpdate 的 data 列表。行号从 0 开始且不含表头 (即表格第 2 行为 0)，
+    -1 表示表头行。同一列中连续的行合并为一个范围。
+    """
+    quoted_title = "'" + sheet_title.replace("'", "''") + "'"
+    by_column = {}
+    for row, col, value in cells:
+        by_column.setdefault(col, []).append((row, value))
+
+    data = []
+    for col, entries in sorted(by_column.items()):
+        entries.sort()
+        run = [entries[0]]
+        for entry in entries[1:] + [None]:
+            if entry is not None and entry[0] == run[-1][0] + 1:
+                run.append(entry)
+                continue
+            letter = column_letter(col)
+            data.append({'range': f"{quoted_title}!{letter}{run[0][0] + 2}:{letter}{run[-1][0] + 2}",
+                         'values': [[value] for _, value in run]})
+            run = [entry]
+    return data
+
+def update_sheet_tabs(spreadsheet_id, cells_by_title, creds):
+    """只写入发生变化的单元格：cells_by_title 为 {工作表名: [(数据行号, 列号, 值)]}，同一表格的所有工作表通过一次 values().batchUpdate 写入。"""
+    cells_by_title = {title: cells for title, cells in cells_by_title.items() if cells}
+    if not cells_by_title: return True
+    try:
+        service = build('sheets', 'v4', credentials=creds)
+        data = [entry for title, cells in cells_by_title.items() for entry in sheet_cell_ranges(title, cells)]
+        total = sum(len(cells) for cells in cells_by_title.values())
+        print(f"正在写入 {total} 个变化的单元格 ({len(cells_by_title)} 个工作表，{len(data)} 个范围)...")
+        execute_with_retry(service.spreadsheets().values().batchUpdate(
+            spreadsheetId=spreadsheet_id, body={'valueInputOption': 'USER_ENTERED', 'data': data}))
+        incr('sheet_cells_written', total)
+        return True
+    except TaskCancelled:
+        raise
+    except Exception:
+        print("增量更新Google Sheet时发生严重错误:")
+        traceback.print_exc()
+        return False
+
+def update_sheet_cells(spreadsheet_id, sheet_title, cells, creds):
+    """只写入单个工作表中发生变化的单元格，见 update_sheet_tabs。"""
+    return update_sheet_tabs(spreadsheet_id, {sheet_title: cells}, creds)
+
+def list_sheet_titles(spreadsheet_id, creds):
+    """返回表格中所有工作表的 [(sheetId, 工作表名)]，按标签页顺序排列。"""
+    service = build('sheets', 'v4', credentials=creds)
+    metadata = execute_with_retry(service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id, fields='sheets.properties(sheetId,title)'))
+    return [(sheet['properties'].get('sheetId'), sheet['properties'].get('title'))
+            for sheet in metadata.get('sheets', [])]
+
+def values_to_frame(values, sheet_title):
+    """把 values().get 返回的二维列表 (第一行为表头) 转为 DataFrame，短行补齐、长行截断。"""
+    if not values:
+        return pd.DataFrame()
+    header = values[0]
+    data = values[1:]
+    # 表头之外的列 (没有列名或在表头右侧) 可能也有数据，记录实际使用的列数，追加新列时从它之后开始
+    used_columns = max(len(row) for row in values)
+    if header:
+        max_cols = len(header)
+        data_fixed = []
+        for row in data:
+            # 如果行比表头短，补齐
+            if len(row) < max_cols:
+                row.extend([''] * (max_cols - len(row)))
+            # 如果行比表头长，截断（虽然这种情况少见）
+            data_fixed.append(row[:max_cols])
+        df = pd.DataFrame(data_fixed, columns=header)
+    else:
+        df = pd.DataFrame(data)
+    # 重复度高的列转为 category，其余转为紧凑的字符串类型
+    compact_frame(df)
+    # 记录工作表名称，增量回写时用来拼接单元格范围
+    df.attrs['sheet_title'] = sheet_title
+    df.attrs['used_columns'] = used_columns
+    return df
+
+def read_sheet_tabs(spreadsheet_id, titles, creds):
+    """用一次 values().batchGet 读取同一表格的多个工作表，返回 {工作表名: DataFrame}。"""
+    service = build('sheets', 'v4', credentials=creds)
+    ranges = ["'" + title.replace("'", "''") + "'" for title in titles]
+    result = execute_with_retry(service.spreadsheets().values().batchGet(spreadsheetId=spreadsheet_id, ranges=ranges))
+    frames = {}
+    for title, value_range in zip(titles, result.get('valueRanges', [])):
+        values = value_range.get('values', [])
+        incr('sheet_rows_read', len(values))
+        frames[title] = values_to_frame(values, title)
+    return frames
+
 def read_sheet_data(spreadsheet_id, creds, range_name=None):
     """
     读取Google Sheet数据并转换为DataFrame。
@@ -209,34 +500,19 @@ def read_sheet_data(spreadsheet_id, creds, range_name=None):
         print(f"正在读取数据范围: {range_name}...", flush=True)
         result = execute_with_retry(sheet_api.values().get(spreadsheetId=spreadsheet_id, range=range_name))
         values = result.get('values', [])
+        incr('sheet_rows_read', len(values))
         
         if not values:
             print('No data found.', flush=True)
             return pd.DataFrame()
 
-        # 2. 转换为 DataFrame
-        # 假设第一行是表头
-        header = values[0]
-        data = values[1:]
-        
-        # 处理数据列数不一致的问题（补齐空值）
-        if header:
-            max_cols = len(header)
-            data_fixed = []
-            for row in data:
-                # 如果行比表头短，补齐
-                if len(row) < max_cols:
-                    row.extend([''] * (max_cols - len(row)))
-                # 如果行比表头长，截断（虽然这种情况少见）
-                data_fixed.append(row[:max_cols])
-                
-            df = pd.DataFrame(data_fixed, columns=header)
-        else:
-            df = pd.DataFrame(data)
-
+        # 2. 转换为 DataFrame (假设第一行是表头)
+        df = values_to_frame(values, range_name.split('!')[0].strip("'"))
         print(f"成功读取 {len(df)} 行数据。", flush=True)
         return df
 
+    except TaskCancelled:
+        raise
     except Exception as e:
         print(f"读取Google Sheet时发生错误: {e}", flush=True)
         traceback.print_exc()
@@ -1,24 +1,46 @@
-# image_downloader.py (爬虫流程验证脚本)
+# image_downloader.py (Image Bank 批量下载：登录态复用的浏览器会话池 + 目录监控)
 
 import os
 import re
+import html
+import queue
+import shutil
+import threading
 import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 
-# --- 占位符：请替换为你的真实信息 ---
-USERNAME = "sam76826" 
-PASSWORD = "zx123456" 
+import task_metrics
+
+# --- 占位符：请替换为你的真实信息 (也可以通过环境变量覆盖) ---
+USERNAME = os.environ.get("IMAGEBANK_USERNAME", "sam76826")
+PASSWORD = os.environ.get("IMAGEBANK_PASSWORD", "zx123456")
 TARGET_MODEL = "L8.124.4.87.2" # 官方认可的带点格式
 # --- 占位符结束 ---
 
-BASE_URL = "https://imagebank.longines.com"
+# 测试时可以把 IMAGEBANK_BASE_URL 指向本地的模拟服务器 (benchmarks/fake_imagebank.py)；
+# HTTP 直连模式的离线验证见 benchmarks/run_benchmarks.py 的 imagebank_http 场景
+BASE_URL = os.environ.get("IMAGEBANK_BASE_URL", "https://imagebank.longines.com")
 # 确保下载路径是明确的，例如在你的D盘项目目录下创建一个临时文件夹
-DOWNLOAD_DIR = os.path.join("D:\\Projects\\web_project", "imagebank_downloads") 
+DOWNLOAD_DIR = os.environ.get("IMAGEBANK_DOWNLOAD_DIR", os.path.join("D:\\Projects\\web_project", "imagebank_downloads"))
+
+# 目标文件名后缀，用于精确匹配
+SUFFIXES = ["_BACK", "_DRback", "_DRface", "_FACE", "_SOL"]
+# Chrome 下载过程中的临时文件后缀
+PARTIAL_SUFFIXES = ('.crdownload', '.tmp', '.part')
+DOWNLOAD_TIMEOUT = 180
+# HTTP 直连模式下同时处理的 SKU 数 (每个 SKU 的图片再并行下载)
+HTTP_WORKERS = 4
 
 def standardize_model(model: str) -> str:
     """标准化型号格式：L+数字+点+数字"""
@@ -30,126 +52,345 @@ def standardize_model(model: str) -> str:
         return re.sub(r'(L\d{1})(\d{3})(\d{1})(\d{2})(\d{1})', r'\1.\2.\3.\4.\5', model)
     return model
 
-def setup_driver():
+def parse_sku_list(text):
+    """把表单中输入的多个 SKU (逗号、空格或换行分隔) 解析为去重后的列表。"""
+    skus = []
+    for item in re.split(r'[\s,，;；]+', text or ''):
+        if item and standardize_model(item) not in skus:
+            skus.append(standardize_model(item))
+    return skus
+
+def setup_driver(download_dir=DOWNLOAD_DIR, headless=False):
     """配置 Chrome WebDriver，设置下载路径"""
     chrome_options = Options()
-    # chrome_options.add_argument("--headless") # 跑通流程后再启用无头模式
-    
+    if headless:
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--window-size=1920,1080")
+
     # 设置自动化下载路径和行为
     prefs = {
-        "download.default_directory": DOWNLOAD_DIR,
+        "download.default_directory": os.path.abspath(download_dir),
         "download.prompt_for_download": False, # 不弹出下载确认框
         "download.directory_upgrade": True,
-        "safebrowsing.enabled": True 
+        "safebrowsing.enabled": True
     }
     chrome_options.add_experimental_option("prefs", prefs)
-    
+
     # 假设 ChromeDriver 位于 PATH 或项目目录下
-    driver = webdriver.Chrome(options=chrome_options) 
-    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-    print(f"✅ WebDriver 配置完成，下载路径: {DOWNLOAD_DIR}")
+    os.makedirs(download_dir, exist_ok=True)
+    driver = webdriver.Chrome(options=chrome_options)
+    print(f"✅ WebDriver 配置完成，下载路径: {download_dir}")
     return driver
 
-def download_images(driver, model_sku):
+def login(driver, base_url=BASE_URL, username=USERNAME, password=PASSWORD):
+    driver.get(base_url)
+    print("➡️ 尝试登录...")
+    # 假设登录页面的元素ID/Name/XPath
+    WebDriverWait(driver, 20).until(
+        EC.presence_of_element_located((By.NAME, "username"))
+    ).send_keys(username)
+    driver.find_element(By.NAME, "password").send_keys(password)
+    driver.find_element(By.XPATH, "//button[@type='submit']").click()
+
+    # 验证是否登录成功 (等待搜索框出现)
+    WebDriverWait(driver, 20).until(
+        EC.presence_of_element_located((By.ID, "SearchText"))
+    )
+    print("🎉 登录成功！")
+
+def wait_for_download(download_dir, known_files, timeout=DOWNLOAD_TIMEOUT, poll_interval=0.5):
+    """
+    监控下载目录，直到出现新的完整文件且没有 .crdownload 等临时文件为止。
+    返回新下载完成的文件路径列表；超时返回空列表。
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        names = set(os.listdir(download_dir))
+        in_progress = [n for n in names if n.endswith(PARTIAL_SUFFIXES)]
+        finished = [n for n in names - known_files if not n.endswith(PARTIAL_SUFFIXES)]
+        if finished and not in_progress:
+            return [os.path.join(download_dir, n) for n in sorted(finished)]
+        time.sleep(poll_interval)
+    return []
+
+def select_suffix_files(driver, search_sku):
+    """在表款页面中选中 SUFFIXES 对应的图片，返回选中的数量。"""
+    selected_count = 0
+    for suffix in SUFFIXES:
+        full_filename_partial = search_sku + suffix
+        # 使用 XPath 查找包含特定文件名部分的图片元素
+        # 注意：这里的 XPath 需要根据实际网站结构调整
+        try:
+            # 假设每张图片有一个 Select 按钮/图标
+            select_button = driver.find_element(
+                By.XPATH, f"//div[contains(@id, 'file_') and contains(@data-filename, '{full_filename_partial}')]//a[contains(@class, 'select-arrow')]"
+            )
+            select_button.click()
+            selected_count += 1
+        except NoSuchElementException:
+            print(f"⚠️ 未找到文件: {full_filename_partial}.tif")
+    return selected_count
+
+def open_product_page(driver, search_sku):
+    print(f"🔍 正在搜索型号: {search_sku}")
+    search_box = WebDriverWait(driver, 20).until(
+        EC.presence_of_element_located((By.ID, "SearchText"))
+    )
+    search_box.clear()
+    search_box.send_keys(search_sku)
+    search_box.submit() # 或点击搜索按钮
+
+    # 等待搜索结果加载
+    WebDriverWait(driver, 30).until(
+        EC.presence_of_element_located((By.CLASS_NAME, "product-page-container")) # 假设进入了表款页面
+    )
+
+def download_images(driver, model_sku, download_dir=DOWNLOAD_DIR, base_url=BASE_URL):
+    """
+    在已登录的 driver 上下载一个 SKU 的套图，返回下载得到的 ZIP 路径 (失败返回 None)。
+    driver 的生命周期由调用方管理，便于在多个 SKU 之间复用登录态。
+    """
+    search_sku = standardize_model(model_sku)
+    driver.get(base_url)
+    open_product_page(driver, search_sku)
+
+    print("👀 正在查找并选择图片...")
+    selected_count = select_suffix_files(driver, search_sku)
+    if selected_count == 0:
+        print(f"❌ {search_sku} 未成功选择任何图片。")
+        return None
+
+    # 进入下载页面
+    print(f"🛒 已选择 {selected_count} 张图片，进入购物车/手提袋...")
+    driver.find_element(By.ID, "cartIcon").click()
+    WebDriverWait(driver, 20).until(
+        EC.presence_of_element_located((By.ID, "downloadButtonContainer"))
+    )
+
+    known_files = set(os.listdir(download_dir))
+    print("⬇️ 正在点击 'Download JPG' 按钮...")
+    driver.find_element(By.ID, "downloadJpgButton").click()
+
+    # 通过监控下载目录判断完成，而不是固定等待
+    downloaded = [f for f in wait_for_download(download_dir, known_files) if f.endswith('.zip')]
+    if not downloaded:
+        print(f"❌ {search_sku} 未在下载目录中找到 ZIP 文件。")
+        return None
+    print(f"✅ 成功下载文件: {os.path.basename(downloaded[0])}")
+    return downloaded[0]
+
+class NeedsBrowser(Exception):
+    """HTTP 直连无法完成 (登录态失效、页面中没有直接下载链接等)，需要回退到浏览器流程。"""
+
+def session_from_driver(driver, pool_size):
+    """
+    用已登录浏览器的 Cookie 和 User-Agent 构造 requests.Session，连接池大小按并发数设置。
+    """
+    session = requests.Session()
+    for cookie in driver.get_cookies():
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
     try:
-        # 1. 登录
-        driver.get(BASE_URL)
-        print("➡️ 尝试登录...")
-        # 假设登录页面的元素ID/Name/XPath
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.NAME, "username"))
-        ).send_keys(USERNAME)
-        driver.find_element(By.NAME, "password").send_keys(PASSWORD)
-        driver.find_element(By.XPATH, "//button[@type='submit']").click()
-        
-        # 验证是否登录成功 (等待搜索框出现)
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.ID, "SearchText"))
-        )
-        print("🎉 登录成功！")
-
-        # 2. 搜索
-        # 标准化型号以确保搜索成功
-        search_sku = standardize_model(model_sku)
-        print(f"🔍 正在搜索型号: {search_sku}")
-        search_box = driver.find_element(By.ID, "SearchText")
-        search_box.send_keys(search_sku)
-        search_box.submit() # 或点击搜索按钮
-        
-        # 等待搜索结果加载
-        WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.CLASS_NAME, "product-page-container")) # 假设进入了表款页面
-        )
-
-        # 3. 选择所有图片
-        print("👀 正在查找并选择图片...")
-        # 目标文件名后缀，用于精确匹配
-        suffixes = ["_BACK", "_DRback", "_DRface", "_FACE", "_SOL"] 
-        selected_count = 0
-
-        for suffix in suffixes:
-            full_filename_partial = model_sku + suffix
-            # 使用 XPath 查找包含特定文件名部分的图片元素
-            # 注意：这里的 XPath 需要根据实际网站结构调整
-            try:
-                # 假设每张图片有一个 Select 按钮/图标
-                select_button = driver.find_element(
-                    By.XPATH, f"//div[contains(@id, 'file_') and contains(@data-filename, '{full_filename_partial}')]//a[contains(@class, 'select-arrow')]"
-                )
-                select_button.click()
-                selected_count += 1
-                time.sleep(0.5) # 稍微等待，模拟用户操作
-            except NoSuchElementException:
-                print(f"⚠️ 未找到文件: {full_filename_partial}.tif")
-                
-        if selected_count == 0:
-            print("❌ 未成功选择任何图片，流程结束。")
-            return False
-
-        # 4. 进入下载页面
-        print(f"🛒 已选择 {selected_count} 张图片，进入购物车/手提袋...")
-        # 假设手提袋图标的定位器
-        cart_button = driver.find_element(By.ID, "cartIcon") 
-        cart_button.click()
-        
-        # 等待下载页面加载
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.ID, "downloadButtonContainer")) 
-        )
-
-        # 5. 点击 Download JPG
-        print("⬇️ 正在点击 'Download JPG' 按钮...")
-        download_jpg_button = driver.find_element(By.ID, "downloadJpgButton")
-        download_jpg_button.click()
-        
-        # 6. 下载监控 (简易版：等待一段时间，并检查下载目录)
-        print("⏳ 文件下载中，等待 40 秒...")
-        time.sleep(40) 
-        
-        downloaded_files = os.listdir(DOWNLOAD_DIR)
-        zip_files = [f for f in downloaded_files if f.endswith('.zip')]
-        
-        if zip_files:
-            print(f"✅ 成功下载文件: {zip_files[0]}")
-            return True
-        else:
-            print("❌ 未在下载目录中找到 ZIP 文件。")
-            return False
-
-    except TimeoutException:
-        print("❌ 操作超时，可能是网络慢或元素定位器需要更新。")
-        return False
+        session.headers['User-Agent'] = driver.execute_script("return navigator.userAgent")
+    except WebDriverException:
+        pass
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def find_asset_urls(page_html, search_sku, base_url=BASE_URL):
+    """
+    从表款页面 HTML 中找出 SUFFIXES 对应图片的直接下载地址。
+    返回 [(zip 内文件名, 绝对 URL)]，页面中没有 data-jpg-url 时返回空列表。
+    """
+    found = {}
+    for filename, url in re.findall(r'data-filename="([^"]+)"[^>]*?data-jpg-url="([^"]+)"', page_html):
+        found[html.unescape(filename)] = urljoin(base_url + '/', html.unescape(url))
+    assets = []
+    for suffix in SUFFIXES:
+        for filename, url in found.items():
+            if search_sku + suffix in filename:
+                assets.append((os.path.splitext(filename)[0] + '.jpg', url))
+                break
+    return assets
+
+def _fetch_asset(session, url):
+    response = session.get(url, timeout=60)
+    if response.status_code in (401, 403):
+        raise NeedsBrowser(f"下载 {url} 被拒绝 ({response.status_code})")
+    response.raise_for_status()
+    task_metrics.incr('bytes_downloaded', len(response.content))
+    return response.content
+
+def fetch_sku_http(session, sku, output_dir, asset_pool, base_url=BASE_URL):
+    """
+    不经过浏览器，直接用 HTTP 抓取一个 SKU 的套图并打包为 output_dir/<SKU>.zip。
+    图片在 asset_pool 中并行下载。需要回退到浏览器时抛出 NeedsBrowser。
+    """
+    search_sku = standardize_model(sku)
+    response = session.get(f"{base_url}/search", params={'SearchText': search_sku}, timeout=30)
+    if response.status_code in (401, 403):
+        raise NeedsBrowser("登录态失效")
+    response.raise_for_status()
+    assets = find_asset_urls(response.text, search_sku, base_url)
+    if not assets:
+        raise NeedsBrowser("页面中没有可直接下载的图片链接")
+
+    futures = [(name, task_metrics.submit(asset_pool, _fetch_asset, session, url)) for name, url in assets]
+    zip_path = os.path.join(output_dir, f"{sku}.zip")
+    # 先写到临时文件，全部图片下载成功后才改名；否则残缺的 ZIP 会被一起打包给用户
+    part_path = zip_path + '.part'
+    try:
+        # JPG 本身已经压缩过，ZIP 中直接存储即可
+        with zipfile.ZipFile(part_path, 'w', zipfile.ZIP_STORED) as zf:
+            for name, future in futures:
+                zf.writestr(name, future.result())
+        os.replace(part_path, zip_path)
+    except BaseException:
+        for _, future in futures:
+            future.cancel()
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    print(f"⚡ HTTP 直连下载完成: {sku} ({len(assets)} 张)")
+    return zip_path
+
+def _run_http_fetch(skus, output_dir, headless, base_url, driver_factory, record, http_workers, allow_fallback):
+    """
+    只启动一个浏览器完成登录，取出 Cookie 后关闭浏览器，再用连接池并行抓取所有 SKU。
+    返回需要回退到浏览器流程的 SKU 列表。
+    """
+    login_dir = os.path.join(output_dir, ".http_login")
+    driver = None
+    try:
+        driver = driver_factory(login_dir, headless)
+        login(driver, base_url)
+        session = session_from_driver(driver, http_workers * len(SUFFIXES))
     except Exception as e:
-        print(f"❌ 发生错误: {e}")
-        return False
+        print(f"⚠️ HTTP 模式登录失败，全部回退到浏览器流程: {e}")
+        return list(skus)
     finally:
-        driver.quit()
-        print("🔌 浏览器已关闭。")
+        if driver is not None:
+            driver.quit()
+        shutil.rmtree(login_dir, ignore_errors=True)
+
+    fallback = []
+
+    def fetch_one(sku):
+        start = time.perf_counter()
+        path = fetch_sku_http(session, sku, output_dir, asset_pool, base_url)
+        return path, round(time.perf_counter() - start, 2)
+
+    with ThreadPoolExecutor(max_workers=http_workers) as sku_pool, \
+            ThreadPoolExecutor(max_workers=http_workers * len(SUFFIXES)) as asset_pool:
+        futures = {task_metrics.submit(sku_pool, fetch_one, sku): sku for sku in skus}
+        for future in as_completed(futures):
+            sku = futures[future]
+            try:
+                path, seconds = future.result()
+                record(sku, ok=True, path=path, seconds=seconds, error=None, backend='http')
+            except (NeedsBrowser, requests.RequestException) as e:
+                if allow_fallback:
+                    print(f"↩️ {sku} 回退到浏览器流程: {e}")
+                    fallback.append(sku)
+                else:
+                    record(sku, ok=False, path=None, seconds=0.0, error=str(e), backend='http')
+            except Exception as e:
+                # 其它错误 (例如写文件失败) 只记在这个 SKU 上，其余 SKU 照常完成
+                print(f"⚠️ {sku} HTTP 下载出错: {e}")
+                record(sku, ok=False, path=None, seconds=0.0, error=f"{type(e).__name__}: {e}", backend='http')
+    session.close()
+    return fallback
+
+def _run_selenium_workers(skus, output_dir, workers, headless, base_url, driver_factory, record):
+    """启动 workers 个浏览器会话，每个会话只登录一次，然后从共享队列中领取 SKU。"""
+    sku_queue = queue.Queue()
+    for sku in skus:
+        sku_queue.put(sku)
+
+    def worker(index):
+        worker_dir = os.path.join(output_dir, f".worker_{index}")
+        os.makedirs(worker_dir, exist_ok=True)
+        driver = None
+        try:
+            driver = driver_factory(worker_dir, headless)
+            login(driver, base_url)
+            while True:
+                try:
+                    sku = sku_queue.get_nowait()
+                except queue.Empty:
+                    break
+                start = time.perf_counter()
+                try:
+                    zip_path = download_images(driver, sku, worker_dir, base_url)
+                    if zip_path:
+                        final_path = os.path.join(output_dir, f"{sku}.zip")
+                        shutil.move(zip_path, final_path)
+                        task_metrics.incr('bytes_downloaded', os.path.getsize(final_path))
+                        record(sku, ok=True, path=final_path, seconds=round(time.perf_counter() - start, 2), error=None, backend='selenium')
+                    else:
+                        record(sku, ok=False, path=None, seconds=round(time.perf_counter() - start, 2), error='未找到可下载的图片', backend='selenium')
+                except (TimeoutException, WebDriverException) as e:
+                    record(sku, ok=False, path=None, seconds=round(time.perf_counter() - start, 2), error=type(e).__name__, backend='selenium')
+                    # 会话可能已掉线，重新登录后继续处理队列中的其它 SKU
+                    try:
+                        login(driver, base_url)
+                    except Exception:
+                        break
+        except Exception as e:
+            print(f"⚠️ 浏览器会话 {index} 启动或登录失败: {e}")
+        finally:
+            if driver is not None:
+                driver.quit()
+            shutil.rmtree(worker_dir, ignore_errors=True)
+
+    # 子线程继承任务上下文，下载字节数记到发起下载的任务上
+    threads = [threading.Thread(target=task_metrics.run_in_context(worker), args=(i,), daemon=True) for i in range(max(1, min(workers, len(skus))))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+def download_batch(skus, output_dir, workers=3, headless=True, base_url=BASE_URL,
+                   driver_factory=setup_driver, progress_callback=None, backend='auto', http_workers=HTTP_WORKERS):
+    """
+    批量下载多个 SKU，结果为 output_dir/<SKU>.zip。
+    backend:
+      'selenium' - 浏览器会话池，每个会话只登录一次，使用独立的下载子目录以准确识别自己的文件。
+      'http'     - 浏览器只用于登录，之后用 requests 连接池并行直连下载图片。
+      'auto'     - 先走 HTTP 直连，无法直连的 SKU 再回退到浏览器会话池。
+    返回 {sku: {'ok': bool, 'path': str|None, 'seconds': float, 'error': str|None, 'backend': str}}。
+    """
+    if backend not in ('auto', 'http', 'selenium'):
+        raise ValueError(f"未知的下载方式: {backend}")
+    os.makedirs(output_dir, exist_ok=True)
+    results, results_lock = {}, threading.Lock()
+
+    def record(sku, **result):
+        with results_lock:
+            results[sku] = result
+            done = len(results)
+        if progress_callback:
+            progress_callback(done, len(skus), sku, result)
+
+    remaining = list(skus)
+    if backend in ('auto', 'http'):
+        remaining = _run_http_fetch(remaining, output_dir, headless, base_url, driver_factory, record,
+                                    http_workers, allow_fallback=(backend == 'auto'))
+    if remaining and backend != 'http':
+        _run_selenium_workers(remaining, output_dir, workers, headless, base_url, driver_factory, record)
+
+    # 所有会话都启动失败时，剩余 SKU 也要有结果
+    for sku in skus:
+        if sku not in results:
+            record(sku, ok=False, path=None, seconds=0.0, error='浏览器会话不可用', backend=backend)
+    return results
 
 # --- 执行脚本 ---
 if __name__ == '__main__':
-    driver = setup_driver()
-    if download_images(driver, TARGET_MODEL):
+    results = download_batch([TARGET_MODEL], DOWNLOAD_DIR, workers=1, headless=False, backend='auto')
+    if results[TARGET_MODEL]['ok']:
         print(f"✨ {TARGET_MODEL} 图片下载流程验证成功！")
     else:
-        print(f"🔥 {TARGET_MODEL} 图片下载流程验证失败。")
\ No newline at end of file
+        print(f"🔥 {TARGET_MODEL} 图片下载流程验证失败。")
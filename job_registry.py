@@ -0,0 +1,66 @@
+# job_registry.py (任务去重：输入内容与设置完全相同的任务只执行一次)
+#
+# 任务键 = sha256(任务类型 + 设置 + 输入内容)。重复提交时:
+#   - 相同的任务仍在执行 -> 直接返回该任务的 task_id，前端轮询同一个任务 (双击提交、重复上传)；
+#   - 相同的任务在保留时间内已成功完成，且产物仍在 OUTPUT_FOLDER 中 -> 返回已完成的任务，不再重复计算。
+# 回写 Google Sheet 的任务没有本地产物，只合并执行中的重复提交。
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+CHUNK_SIZE = 1024 * 1024
+
+# 任务键 -> {'task_id', 'state': 'running' | 'done', 'finished_at', 'artifacts'}
+_jobs = {}
+_lock = threading.Lock()
+
+
+def job_key(kind, settings, path=None, text=None):
+    """计算任务键：path 为上传文件 (按块读取，不整体载入内存)，text 为粘贴的文本，settings 为影响结果的参数。"""
+    digest = hashlib.sha256()
+    digest.update(kind.encode('utf-8'))
+    digest.update(json.dumps(settings, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    if text is not None:
+        digest.update(b'\0text\0' + text.encode('utf-8'))
+    if path is not None:
+        digest.update(b'\0file\0')
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _reusable(job, retention_seconds, now):
+    if job['state'] == 'running':
+        return True
+    return now - job['finished_at'] <= retention_seconds and all(os.path.exists(p) for p in job['artifacts'])
+
+
+def claim(key, task_id, retention_seconds):
+    """
+    登记 task_id 为该任务键的执行者并返回 None；已有执行中或可复用的相同任务时不登记，返回那个任务的 task_id。
+    顺带清理已过期的记录。
+    """
+    now = time.time()
+    with _lock:
+        for stale in [k for k, job in _jobs.items() if not _reusable(job, retention_seconds, now)]:
+            del _jobs[stale]
+        if key in _jobs:
+            return _jobs[key]['task_id']
+        _jobs[key] = {'task_id': task_id, 'state': 'running'}
+        return None
+
+
+def finish(key, task_id, artifacts=()):
+    """任务结束时调用：成功且有产物的任务留作复用，其余 (失败，或只回写表格的任务) 直接移除。"""
+    with _lock:
+        job = _jobs.get(key)
+        if job is None or job['task_id'] != task_id:
+            return
+        if artifacts:
+            job.update(state='done', finished_at=time.time(), artifacts=list(artifacts))
+        else:
+            del _jobs[key]
@@ -0,0 +1,108 @@
+# link_verifier.py (图片链接校验：并发请求生成的链接，找出无法公开访问的图片，并统计延迟)
+#
+# 使用带连接池的 requests.Session，并发数有上限；每个链接只读取响应头 (stream=True，不下载图片内容)。
+# 可用的条件：HTTP 200 且 Content-Type 为 image/*。Drive 文件没有公开共享时，lh3 会返回 403/404 或一个 HTML 登录页。
+
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import task_control
+from task_metrics import incr, submit
+
+DEFAULT_WORKERS = 16
+DEFAULT_TIMEOUT = 10
+MAX_FAILURE_EXAMPLES = 20  # 报告中最多列出的失效链接数
+
+
+def make_session(pool_size):
+    """连接池大小与并发数一致，所有线程复用同一组 keep-alive 连接；限流与 5xx 自动重试，最终状态码照常返回。"""
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'],
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def check_link(session, url, timeout=DEFAULT_TIMEOUT):
+    """请求一个链接，返回 (是否可用, 耗时秒数, 失败原因)。"""
+    task_control.checkpoint()
+    start = time.perf_counter()
+    try:
+        with session.get(url, stream=True, timeout=timeout) as response:
+            elapsed = time.perf_counter() - start
+            content_type = response.headers.get('Content-Type', '')
+            if response.status_code != 200:
+                return False, elapsed, f"HTTP {response.status_code}"
+            if not content_type.startswith('image/'):
+                return False, elapsed, f"不是图片 ({content_type.split(';')[0] or '无 Content-Type'})"
+            return True, elapsed, None
+    except requests.RequestException as e:
+        return False, time.perf_counter() - start, type(e).__name__
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def verify_links(urls, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, session=None):
+    """
+    并发校验一组链接 (空链接跳过，重复链接只请求一次)，返回:
+    {'checked', 'ok', 'failed', 'seconds', 'latency_ms': {'p50', 'p95', 'max'}, 'reasons': {原因: 次数}, 'failures': [{url, reason}]}。
+    """
+    unique = list(dict.fromkeys(url for url in urls if url))
+    own_session = session is None
+    session = session or make_session(workers)
+    results = {}
+    started = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='link-check')
+    try:
+        futures = {submit(pool, check_link, session, url, timeout): url for url in unique}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    finally:
+        # 任务被取消时不再等待排队中的请求
+        pool.shutdown(wait=False, cancel_futures=True)
+        if own_session:
+            session.close()
+
+    latencies = sorted(elapsed * 1000 for _, elapsed, _ in results.values())
+    failures = [(url, reason) for url, (ok, _, reason) in results.items() if not ok]
+    incr('links_verified', len(results))
+    incr('links_broken', len(failures))
+    return {
+        'checked': len(results),
+        'ok': len(results) - len(failures),
+        'failed': len(failures),
+        'seconds': round(time.perf_counter() - started, 3),
+        'latency_ms': {'p50': round(_percentile(latencies, 0.5), 1), 'p95': round(_percentile(latencies, 0.95), 1),
+                       'max': round(latencies[-1], 1) if latencies else 0.0},
+        'reasons': dict(Counter(reason for _, reason in failures)),
+        'failures': [{'url': url, 'reason': reason} for url, reason in failures[:MAX_FAILURE_EXAMPLES]],
+    }
+
+
+def verify_frame_links(df, columns, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT):
+    """校验 DataFrame 中各链接列的所有链接，报告中额外给出每列的失效数 (by_column)。"""
+    from frame_utils import text_values
+
+    columns = [column for column in columns if column in df.columns]
+    values = {column: text_values(df[column]) for column in columns}
+    report = verify_links([url for urls in values.values() for url in urls], workers, timeout)
+    broken = {failure['url'] for failure in report['failures']}
+    if report['failed'] > len(broken):
+        # 示例列表被截断时，逐列统计需要完整的失效集合
+        broken = None
+    report['by_column'] = {
+        column: sum(1 for url in urls if url in broken) if broken is not None else None
+        for column, urls in values.items()
+    }
+    return report
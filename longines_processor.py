@@ -2,6 +2,8 @@ import pandas as pd
 import re
 import math # <<--- 引入 math 库，用于向上取整
 
+from frame_utils import compact_frame
+
 def is_title_like(text):
     """
     判断一段文字是否“像”大标题（最严格版本，用于近似“粗体”规则）。
@@ -133,7 +135,8 @@ def process_longines_file(input_path):
         
         final_df.insert(0, 'sort_order', range(1, 1 + len(final_df)))
         
-        return final_df
+        # 品牌、系列等重复度高的列转为 category，后续匹配链接和回写表格都不再复制
+        return compact_frame(final_df)
     except Exception as e:
         import traceback
         print(f"An error occurred in process_longines_file: {e}")
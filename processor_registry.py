@@ -0,0 +1,69 @@
+# processor_registry.py (Excel 处理器注册表，按需懒加载)
+
+import importlib
+import threading
+from importlib import metadata
+
+# 内置处理器：config.json 中 "processor" 字段的取值 -> "模块:函数"
+BUILTIN_PROCESSORS = {
+    "excel_processor": "excel_processor:process_excel_file",
+    "longines_processor": "longines_processor:process_longines_file",
+}
+# 第三方包可以通过 entry points 注册新的处理器，例如 pyproject.toml 中:
+# [project.entry-points."design_workbench.processors"]
+# my_brand = "my_package.my_module:process_my_brand_file"
+ENTRY_POINT_GROUP = "design_workbench.processors"
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def _entry_point_target(name):
+    try:
+        for ep in metadata.entry_points(group=ENTRY_POINT_GROUP):
+            if ep.name == name:
+                return ep.value
+    except Exception as e:
+        print(f"⚠️ 读取处理器 entry points 失败: {e}")
+    return None
+
+
+def resolve_target(name):
+    """
+    把 config.json 中的 processor 名称解析为 "模块:函数" 路径，不做任何导入。
+    支持三种写法：内置名称 / entry point 名称 / 直接写 "包.模块:函数"。
+    """
+    if not name:
+        return None
+    if ':' in name:
+        return name
+    return BUILTIN_PROCESSORS.get(name) or _entry_point_target(name)
+
+
+def get_processor(name):
+    """
+    返回处理器函数。模块 (以及它依赖的 pandas 等重量级库) 在第一次使用时才导入，之后缓存复用。
+    """
+    with _lock:
+        if name in _loaded:
+            return _loaded[name]
+        target = resolve_target(name)
+        if target is None:
+            raise ValueError(f"未注册的处理器: '{name}'，请检查 config.json 中的 processor 字段。")
+        module_name, _, func_name = target.partition(':')
+        module = importlib.import_module(module_name)
+        processor_function = getattr(module, func_name, None)
+        if not callable(processor_function):
+            raise ValueError(f"处理器 '{name}' 指向的 {target} 不是可调用对象。")
+        _loaded[name] = processor_function
+        return processor_function
+
+
+def available_processors():
+    """列出所有可用的处理器名称 (不触发导入)。"""
+    names = set(BUILTIN_PROCESSORS)
+    try:
+        names.update(ep.name for ep in metadata.entry_points(group=ENTRY_POINT_GROUP))
+    except Exception:
+        pass
+    return sorted(names)
@@ -0,0 +1,100 @@
+# result_writer.py (Mode B 结果文件的快速导出)
+
+import math
+import os
+import pandas as pd
+
+from task_metrics import incr
+
+# 默认的图片链接列 (未配置 source_folders 的项目)，在 Excel 中写成可点击的超链接；调用方应传入项目实际的链接列
+LINK_COLUMNS = ('product_image', 'scene_image')
+# Excel 单个工作表最多支持 65530 个超链接，超出的部分按普通文本写入
+MAX_URLS_PER_SHEET = 65530
+
+OUTPUT_FORMATS = {
+    'xlsx': '.xlsx',
+    'csv': '.csv',
+    'parquet': '.parquet',
+}
+
+
+def _is_blank(value):
+    if value is None:
+        return True
+    if isinstance(value, float):
+        return math.isnan(value)
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def _write_xlsx_fast(df, output_path, link_columns=LINK_COLUMNS):
+    """
+    使用 xlsxwriter 的 constant_memory 模式逐行写出，内存占用与行数无关。
+    链接列写成真正的超链接。
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(output_path, {
+        'constant_memory': True,
+        'strings_to_urls': False,  # 只有链接列才生成超链接，避免普通文本被误判
+        'strings_to_numbers': False,
+        'nan_inf_to_errors': True,
+    })
+    try:
+        worksheet = workbook.add_worksheet()
+        header_format = workbook.add_format({'bold': True})
+        link_format = workbook.add_format({'font_color': 'blue', 'underline': 1})
+
+        columns = [str(col) for col in df.columns]
+        worksheet.write_row(0, 0, columns, header_format)
+        link_indexes = {i for i, col in enumerate(columns) if col in set(link_columns)}
+
+        url_count = 0
+        for row_idx, row in enumerate(df.itertuples(index=False, name=None), start=1):
+            for col_idx, value in enumerate(row):
+                if _is_blank(value):
+                    continue
+                if col_idx in link_indexes and isinstance(value, str) and value.startswith('http'):
+                    if url_count < MAX_URLS_PER_SHEET:
+                        worksheet.write_url(row_idx, col_idx, value, link_format, string=value)
+                        url_count += 1
+                    else:
+                        worksheet.write_string(row_idx, col_idx, value)
+                elif isinstance(value, str):
+                    worksheet.write_string(row_idx, col_idx, value)
+                else:
+                    worksheet.write(row_idx, col_idx, value)
+    finally:
+        workbook.close()
+
+
+def write_result_file(df: pd.DataFrame, output_path_base, output_format='xlsx', link_columns=LINK_COLUMNS):
+    """
+    按指定格式写出结果文件，返回最终文件路径 (output_path_base + 扩展名)。
+    xlsx 优先使用 xlsxwriter，未安装时回退到 pandas 默认的 openpyxl 写法。
+    link_columns 为项目的图片链接列 (见 google_drive_finder.link_columns)，这些列写成超链接。
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {output_format}")
+    output_path = output_path_base + OUTPUT_FORMATS[output_format]
+
+    if output_format == 'csv':
+        # utf-8-sig 带 BOM，Excel 直接双击打开中文也不会乱码
+        df.to_csv(output_path, index=False, encoding='utf-8-sig')
+    elif output_format == 'parquet':
+        try:
+            df.to_parquet(output_path, index=False)
+        except ImportError:
+            raise ValueError("导出 Parquet 需要安装 pyarrow，请改用 xlsx 或 csv 格式。")
+    else:
+        try:
+            _write_xlsx_fast(df, output_path, link_columns)
+        except ImportError:
+            print("⚠️ 未安装 xlsxwriter，回退到 openpyxl 写出 (大数据量时较慢)。")
+            df.to_excel(output_path, index=False)
+
+    incr('bytes_written', os.path.getsize(output_path))
+    print(f"📄 结果文件已生成: {output_path} ({len(df)} 行)")
+    return output_path
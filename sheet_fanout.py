@@ -0,0 +1,154 @@
+# sheet_fanout.py (Mode A 多表格 / 多工作表同步：一个活动分散在多个标签页或多个表格中时一次处理完)
+#
+# 每行一个目标：表格链接，可以带 #gid=<id> 指定工作表，或在链接后写 "!工作表名"；
+# 没有指定工作表时处理该表格中所有带 SKU 列的工作表。
+# 每个表格的 API 往返固定为：1 次 get (需要工作表列表或 gid 时) + 1 次 batchGet + 1 次 batchUpdate，
+# 与工作表数量无关；图片匹配在所有工作表 SKU 的并集上只做一次，且只回写变化的单元格。
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from task_metrics import incr, submit
+
+SKU_COLUMN_ALIASES = ['model_sku', 'SKU', '商品SKU', '型号']
+SHEET_WORKERS = 4  # 同时读写的表格数
+
+
+def parse_targets(text):
+    """把多行输入解析为 [{'spreadsheet_id', 'gid', 'title'}]，无法识别的行会被忽略。"""
+    targets = []
+    for line in (text or '').splitlines():
+        url, _, title = line.strip().partition('!')
+        match = re.search(r'/spreadsheets/d/([a-zA-Z0-9-_]+)', url)
+        if not match:
+            continue
+        gid = re.search(r'[#&?]gid=(\d+)', url)
+        targets.append({
+            'spreadsheet_id': match.group(1),
+            'gid': int(gid.group(1)) if gid else None,
+            'title': title.strip() or None,
+        })
+    return targets
+
+
+def find_sku_column(columns):
+    return next((column for column in SKU_COLUMN_ALIASES if column in columns), None)
+
+
+def _resolve_titles(spreadsheet_id, selectors, creds):
+    """把同一表格的目标解析为要读取的工作表名列表 (去重并保持顺序)。只按名字指定时不需要查询元数据。"""
+    from google_drive_finder import list_sheet_titles
+
+    if all(selector['title'] for selector in selectors):
+        return list(dict.fromkeys(selector['title'] for selector in selectors))
+    sheets = list_sheet_titles(spreadsheet_id, creds)
+    by_gid = dict(sheets)
+    titles = []
+    for selector in selectors:
+        if selector['title']:
+            titles.append(selector['title'])
+        elif selector['gid'] is not None:
+            if selector['gid'] not in by_gid:
+                raise ValueError(f"表格 {spreadsheet_id} 中没有 gid={selector['gid']} 的工作表")
+            titles.append(by_gid[selector['gid']])
+        else:
+            titles.extend(title for _, title in sheets)
+    return list(dict.fromkeys(titles))
+
+
+def _read_spreadsheet(spreadsheet_id, selectors, creds):
+    from google_drive_finder import read_sheet_tabs
+
+    return read_sheet_tabs(spreadsheet_id, _resolve_titles(spreadsheet_id, selectors, creds), creds)
+
+
+def _changed_cells(df, sku_column, links):
+    """
+    对比工作表当前的链接列与匹配结果，返回需要写入的 [(数据行号, 列号, 值)]。
+    缺少的链接列追加在工作表实际使用的最后一列之后 (不只是表头的宽度，避免覆盖表头右侧的数据) 并写入表头。
+    """
+    from frame_utils import text_values
+    from google_drive_finder import normalize_sku
+
+    skus = text_values(df[sku_column], normalize_sku)
+    cells = []
+    next_column = max(len(df.columns), df.attrs.get('used_columns', 0))
+    for column, link_map in links.items():
+        if column in df.columns:
+            col_index = df.columns.get_loc(column)
+            old_values = text_values(df[column])
+        else:
+            col_index, next_column = next_column, next_column + 1
+            old_values = [''] * len(df)
+            cells.append((-1, col_index, column))
+        for row, (sku, old) in enumerate(zip(skus, old_values)):
+            new = link_map.get(sku, '')
+            if old != new:
+                cells.append((row, col_index, new))
+    return cells
+
+
+def sync_many(targets, project_config, creds, image_index=None):
+    """
+    为多个表格 / 工作表补全图片链接，返回摘要:
+    {'spreadsheets', 'tabs': [{'spreadsheet_id', 'title', 'rows', 'cells_written'}], 'skipped_tabs', 'unique_skus', 'cells_written'}。
+    没有 SKU 列的工作表会被跳过并记录在 skipped_tabs 中。
+    """
+    from frame_utils import factorize_text
+    from google_drive_finder import DEFAULT_LINK_SIZE, build_image_index, normalize_sku, project_link_format, search_link, update_sheet_tabs
+
+    by_spreadsheet = {}
+    for target in targets:
+        by_spreadsheet.setdefault(target['spreadsheet_id'], []).append(target)
+
+    with ThreadPoolExecutor(max_workers=SHEET_WORKERS, thread_name_prefix='sheet-fanout') as pool:
+        index_future = None
+        if image_index is None:
+            index_future = submit(pool, build_image_index, project_config, creds)
+        read_futures = {sid: submit(pool, _read_spreadsheet, sid, selectors, creds) for sid, selectors in by_spreadsheet.items()}
+        frames = {sid: future.result() for sid, future in read_futures.items()}
+        if index_future is not None:
+            image_index = index_future.result()
+    if image_index is None:
+        return {'spreadsheets': len(frames), 'tabs': [], 'skipped_tabs': [], 'unique_skus': 0, 'cells_written': 0,
+                'warning': '在Google Drive中找不到项目文件夹或图片来源文件夹，未更新图片链接。'}
+
+    tabs, skipped = [], []
+    for spreadsheet_id, tab_frames in frames.items():
+        for title, df in tab_frames.items():
+            sku_column = find_sku_column(df.columns)
+            if df.empty or sku_column is None:
+                skipped.append({'spreadsheet_id': spreadsheet_id, 'title': title})
+                continue
+            tabs.append((spreadsheet_id, title, df, sku_column))
+
+    # 所有工作表的 SKU 取并集后只匹配一次
+    unique_skus = set()
+    for _, _, df, sku_column in tabs:
+        unique_skus.update(factorize_text(df[sku_column], normalize_sku)[1].tolist())
+    unique_skus.discard('')
+    link_format, links = project_link_format(project_config), {}
+    for column, file_map in image_index.items():
+        size = link_format['sizes'].get(column, DEFAULT_LINK_SIZE)
+        links[column] = {sku: search_link(sku, file_map, size, link_format['base']) for sku in unique_skus}
+        incr('links_matched', sum(1 for link in links[column].values() if link))
+
+    cells_by_spreadsheet, summary_tabs = {}, []
+    for spreadsheet_id, title, df, sku_column in tabs:
+        cells = _changed_cells(df, sku_column, links)
+        cells_by_spreadsheet.setdefault(spreadsheet_id, {})[title] = cells
+        summary_tabs.append({'spreadsheet_id': spreadsheet_id, 'title': title, 'rows': len(df), 'cells_written': len(cells)})
+
+    with ThreadPoolExecutor(max_workers=SHEET_WORKERS, thread_name_prefix='sheet-fanout') as pool:
+        write_futures = {sid: submit(pool, update_sheet_tabs, sid, cells, creds) for sid, cells in cells_by_spreadsheet.items()}
+        failed = [sid for sid, future in write_futures.items() if not future.result()]
+    if failed:
+        raise ValueError(f"回写数据失败: {', '.join(failed)}")
+
+    return {
+        'spreadsheets': len(frames),
+        'tabs': summary_tabs,
+        'skipped_tabs': skipped,
+        'unique_skus': len(unique_skus),
+        'cells_written': sum(tab['cells_written'] for tab in summary_tabs),
+    }
@@ -2,108 +2,158 @@
 
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from io import BytesIO
 
+import numpy as np
+
+from task_control import checkpoint, TaskCancelled
+from task_metrics import incr, submit
+
 TARGET_SIZE = 150 * 1024
 SUPPORTED_EXTENSIONS = ('.jpg', '.jpeg', '.png')
 TARGET_WIDTH = 750  # 新增：目标宽度像素
 
+# 多规格输出：每张切图只解码一次，同一宽度只缩放一次，各格式的编码共享这份结果
+# suffix 会拼接在序号后面，例如 1.jpg / 1.webp / 1_375.jpg
+DEFAULT_RENDITIONS = (
+    {'width': 750, 'format': 'JPEG', 'max_bytes': 150 * 1024, 'suffix': ''},
+    {'width': 750, 'format': 'WEBP', 'max_bytes': 80 * 1024, 'suffix': ''},
+    {'width': 375, 'format': 'JPEG', 'max_bytes': 60 * 1024, 'suffix': '_375'},
+)
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'AVIF': '.avif'}
+# 这些格式通过 quality 参数控制体积
+LOSSY_FORMATS = ("JPEG", "JPG", "WEBP", "AVIF")
+
+# 快速缩小：JPEG 在解码阶段用 draft() 直接按 1/2、1/4、1/8 解码；
+# 大倍数缩小时先用 reduce() 做整数倍缩小，最后 reducing_gap 倍以内再用 LANCZOS，画质几乎无差别
+FAST_DOWNSCALE = True
+REDUCING_GAP = 3.0
+
+# 长图切块：缩放到目标宽度后高度超过 LONG_IMAGE_HEIGHT 的切图 (常见于整页详情图 750x15000)
+# 按约 TILE_HEIGHT 的高度切成多块，切点在理想位置上下 TILE_SEARCH_RATIO 的范围内选最平坦的一行，避免切断文字
+LONG_IMAGE_HEIGHT = 3000
+TILE_HEIGHT = 1500
+TILE_SEARCH_RATIO = 0.25
+TILE_WORKERS = min(4, os.cpu_count() or 1)
+
 def natural_sort_key(s):
     return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
 
-def resize_image(img, image_path):
+def prepare_draft(img, target_width=TARGET_WIDTH):
+    """
+    对尚未解码的 JPEG 设置 draft 模式，让解码器直接输出不小于 target_width 的缩小版本，
+    Figma 2x/3x 导出的大图可以省掉大部分解码时间和内存。必须在 load() 之前调用。
+    """
+    if FAST_DOWNSCALE and img.format == 'JPEG' and img.width >= 2 * target_width:
+        img.draft(img.mode, (target_width, max(1, img.height * target_width // img.width)))
+    return img
+
+def resize_image(img, image_path, target_width=TARGET_WIDTH):
     """
-    调整图片宽度：
-    1. 如果宽度 > TARGET_WIDTH (750px)，则等比缩放到 TARGET_WIDTH。
-    2. 如果宽度 < TARGET_WIDTH (750px) 且宽度 > 375px，则等比拉宽到 TARGET_WIDTH。
-    3. 如果宽度 <= 375px，则不调整尺寸。
+    调整图片宽度 (target_width 默认为 TARGET_WIDTH 750px)：
+    1. 如果宽度 > target_width，则等比缩放到 target_width。
+    2. 如果宽度 < target_width 且宽度 > target_width / 2，则等比拉宽到 target_width。
+    3. 如果宽度 <= target_width / 2 (默认 375px)，则不调整尺寸。
     """
     original_width, original_height = img.size
     new_img = img
 
-    # 情况1: 宽度 > TARGET_WIDTH (750px)，等比缩放
-    if original_width > TARGET_WIDTH:
-        new_height = int(original_height * TARGET_WIDTH / original_width)
-        new_img = img.resize((TARGET_WIDTH, new_height), Image.Resampling.LANCZOS)
-        print(f"📐 缩放宽度: {original_width}px -> {TARGET_WIDTH}px")
+    # 情况1: 宽度 > target_width，等比缩放
+    if original_width > target_width:
+        new_height = int(original_height * target_width / original_width)
+        new_img = img.resize((target_width, new_height), Image.Resampling.LANCZOS,
+                             reducing_gap=REDUCING_GAP if FAST_DOWNSCALE else None)
+        print(f"📐 缩放宽度: {original_width}px -> {target_width}px")
     
-    # 情况2: 宽度 < TARGET_WIDTH (750px) 且 > 375px，等比拉宽
-    elif original_width < TARGET_WIDTH and original_width > 375:
-        new_height = int(original_height * TARGET_WIDTH / original_width)
+    # 情况2: 宽度 < target_width 且 > target_width / 2，等比拉宽
+    elif original_width < target_width and original_width > target_width // 2:
+        new_height = int(original_height * target_width / original_width)
         # 注意：拉伸可能会损失画质，但这里用 Image.Resampling.LANCZOS (高质量滤波)
-        new_img = img.resize((TARGET_WIDTH, new_height), Image.Resampling.LANCZOS)
-        print(f"📏 拉伸宽度: {original_width}px -> {TARGET_WIDTH}px")
+        new_img = img.resize((target_width, new_height), Image.Resampling.LANCZOS)
+        print(f"📏 拉伸宽度: {original_width}px -> {target_width}px")
 
     # 情况3: 宽度 <= 375px，不调整
 
     return new_img
 
+def encode_within_size(img, img_format, target_size=TARGET_SIZE):
+    """
+    在内存中编码图片，逐步降低质量直到文件大小不超过 target_size。
+    返回 (编码后的字节, 是否达标)；无法达标时返回最后一次 (质量最低) 的结果。
+    """
+    # 先尝试用较高画质保存到内存检查大小，避免文件I/O
+    temp_buffer = BytesIO()
+    save_kwargs_initial = {"format": img_format, "optimize": True}
+    if img_format.upper() in LOSSY_FORMATS:
+        save_kwargs_initial["quality"] = 95 # 用一个较高的初始质量来检查
+
+    img.save(temp_buffer, **save_kwargs_initial)
+    if temp_buffer.tell() <= target_size:
+        return temp_buffer.getvalue(), True
+
+    # 如果尺寸调整后仍然超标，则开始压缩循环
+    buffer = temp_buffer
+    quality, step = 85, 5
+    while quality >= 10:
+        buffer = BytesIO()
+        save_kwargs = {"format": img_format, "optimize": True}
+        if img_format.upper() in LOSSY_FORMATS:
+            save_kwargs["quality"] = quality
+
+        # 对于PNG，可以使用更激进的优化/压缩级别，但PIL的save方法主要是靠`optimize`和`compress_level`
+        # 对于PNG我们不使用quality参数，而是让PIL自行优化
+        if img_format.upper() == "PNG":
+            # 如果是PNG，压缩主要靠无损压缩级别 (compress_level)
+            if quality == 85: # 仅在第一次循环尝试设置较高的compress_level
+                 save_kwargs["compress_level"] = 9
+
+        img.save(buffer, **save_kwargs)
+        if buffer.tell() <= target_size:
+            return buffer.getvalue(), True
+
+        quality -= step
+        # 如果是PNG，压缩循环效果不明显，可以考虑跳出，避免无限循环
+        if img_format.upper() == "PNG" and quality <= 70 and quality % 10 != 0 :
+            # PNG的quality下降对文件大小影响小，除非转换格式或降采样，这里简单地减少迭代
+            quality = 10
+
+    return buffer.getvalue(), False
+
+def needs_resize(width, target_width=TARGET_WIDTH):
+    """与 resize_image 的规则保持一致：宽度不等于目标且大于目标的一半时才需要缩放。"""
+    return width != target_width and width > target_width // 2
+
 def compress_image(image_path):
     try:
         original_size = os.path.getsize(image_path)
-        img = Image.open(image_path)
+        img = Image.open(image_path)  # 此时只读取了文件头，尚未解码像素
+
+        # 尺寸和大小都已达标的图片无需解码和重新编码，直接跳过 (重新保存只会损失画质)
+        if not needs_resize(img.width) and original_size <= TARGET_SIZE:
+            img.close()
+            print(f"✅ 已满足尺寸和大小要求，跳过：{os.path.basename(image_path)}")
+            incr('images_skipped')
+            return True
 
         # --- 新增尺寸调整步骤 ---
-        img = resize_image(img, image_path)
+        img = resize_image(prepare_draft(img), image_path)
         # --- 尺寸调整结束 ---
 
         # 确保RGBA的PNG图在保存为JPG时不会出错
         if img.mode == 'RGBA' and image_path.lower().endswith(('.jpg', '.jpeg')):
             img = img.convert('RGB')
 
-        # 检查调整尺寸后的图片大小，如果已经满足，则保存并返回
-        # 注意：这里需要先保存一次，因为调整尺寸可能会改变大小。
-        # 为了避免文件I/O，我们先尝试用最高质量保存到内存检查大小。
-        temp_buffer = BytesIO()
         img_format = img.format if img.format else 'JPEG'
-        
-        # 尝试以高画质保存，检查是否已在目标范围内
-        save_kwargs_initial = {"format": img_format, "optimize": True}
-        if img_format.upper() in ["JPEG", "JPG"]:
-            save_kwargs_initial["quality"] = 95 # 用一个较高的初始质量来检查
-
-        img.save(temp_buffer, **save_kwargs_initial)
-        current_size = temp_buffer.tell()
-
-        if current_size <= TARGET_SIZE:
-            # 如果高画质保存后就在目标内，则直接覆盖原文件
+        data, fits = encode_within_size(img, img_format)
+        incr('images_encoded')
+        if fits:
             with open(image_path, "wb") as f:
-                f.write(temp_buffer.getvalue())
-            print(f"✅ 尺寸调整后，文件大小已在目标范围内：{os.path.basename(image_path)}")
+                f.write(data)
+            incr('bytes_written', len(data))
+            print(f"🗜️ 成功压缩：{os.path.basename(image_path)} => {len(data) // 1024}KB")
             return True
-        
-        # 如果尺寸调整后仍然超标，则开始压缩循环
-        quality, step = 85, 5
-        while quality >= 10:
-            buffer = BytesIO()
-            save_kwargs = {"format": img_format, "optimize": True}
-            if img_format.upper() in ["JPEG", "JPG"]:
-                save_kwargs["quality"] = quality
-
-            # 对于PNG，可以使用更激进的优化/压缩级别，但PIL的save方法主要是靠`optimize`和`compress_level`
-            # 对于PNG我们不使用quality参数，而是让PIL自行优化
-            if img_format.upper() == "PNG":
-                # 尝试通过降采样或降低色彩深度来进一步减少大小，这里仅靠PIL的默认优化
-                # 如果是PNG，压缩主要靠无损压缩级别 (compress_level)，这里先保持默认
-                if quality == 85: # 仅在第一次循环尝试设置较高的compress_level
-                     save_kwargs["compress_level"] = 9 
-                pass 
-            
-            img.save(buffer, **save_kwargs)
-            current_size_compressed = buffer.tell()
-
-            if current_size_compressed <= TARGET_SIZE:
-                with open(image_path, "wb") as f:
-                    f.write(buffer.getvalue())
-                print(f"🗜️ 成功压缩：{os.path.basename(image_path)} => {current_size_compressed // 1024}KB")
-                return True
-            else:
-                quality -= step
-                # 如果是PNG，压缩循环效果不明显，可以考虑跳出，避免无限循环
-                if img_format.upper() == "PNG" and quality <= 70 and quality % 10 != 0 : 
-                    # PNG的quality下降对文件大小影响小，除非转换格式或降采样，这里简单地减少迭代
-                    quality = 10 
 
         print(f"❌ 无法压缩至{TARGET_SIZE // 1024}KB以下：{os.path.basename(image_path)}")
         return False
@@ -112,6 +162,150 @@ def compress_image(image_path):
         print(f"⚠️ 错误处理图片 {os.path.basename(image_path)}：{e}")
         return False
 
+def is_format_supported(img_format):
+    """当前安装的 Pillow 是否能写出该格式 (AVIF 需要较新的 Pillow 或 pillow-avif-plugin)。"""
+    Image.init()
+    return img_format.upper() in Image.SAVE
+
+def render_slice(image_path, renditions=DEFAULT_RENDITIONS):
+    """
+    为一张切图生成多种规格。源图只解码一次；宽度从大到小依次缩放 (小图由上一档结果继续缩小)；
+    每种规格在各自的大小预算内编码。源文件最终被规格输出替代。返回生成的文件路径列表。
+    """
+    try:
+        img = Image.open(image_path)
+        prepare_draft(img, max(r['width'] for r in renditions))
+        img.load()
+        stem = os.path.splitext(image_path)[0]
+
+        resized = {}
+        previous = img
+        for width in sorted({r['width'] for r in renditions}, reverse=True):
+            previous = resized[width] = resize_image(previous, image_path, width)
+
+        outputs, rgb_cache = [], {}
+        for rendition in renditions:
+            img_format = rendition['format'].upper()
+            if not is_format_supported(img_format):
+                print(f"⚠️ 当前环境不支持 {img_format} 编码，已跳过该规格。")
+                continue
+            frame = resized[rendition['width']]
+            # JPEG 不支持透明通道和调色板模式，同一宽度只转换一次
+            if img_format == 'JPEG' and frame.mode not in ('RGB', 'L'):
+                if rendition['width'] not in rgb_cache:
+                    rgb_cache[rendition['width']] = frame.convert('RGB')
+                frame = rgb_cache[rendition['width']]
+
+            data, fits = encode_within_size(frame, img_format, rendition['max_bytes'])
+            output_path = stem + rendition.get('suffix', '') + FORMAT_EXTENSIONS[img_format]
+            with open(output_path, 'wb') as f:
+                f.write(data)
+            incr('images_encoded')
+            incr('bytes_written', len(data))
+            outputs.append(output_path)
+            state = "🗜️" if fits else "❌ 超出预算"
+            print(f"{state} {os.path.basename(output_path)} => {len(data) // 1024}KB (预算 {rendition['max_bytes'] // 1024}KB)")
+
+        if outputs and image_path not in outputs:
+            os.remove(image_path)
+        return outputs
+    except Exception as e:
+        print(f"⚠️ 错误处理图片 {os.path.basename(image_path)}：{e}")
+        return []
+
+def find_cut_rows(img, tile_height=TILE_HEIGHT, search_ratio=TILE_SEARCH_RATIO):
+    """
+    为过高的图片选择切分行号 (不含 0 和图片高度)。每一行的"平坦度"= 行内灰度方差 + 与上一行的平均差异，
+    留白和纯色背景接近 0，文字和图片边缘很高；在每个理想切点附近取最平坦的行，同样平坦时取离理想切点最近的一行。
+    """
+    gray = np.asarray(img.convert('L'), dtype=np.float32)
+    score = gray.var(axis=1)
+    score[1:] += np.abs(np.diff(gray, axis=0)).mean(axis=1)
+
+    height, window = gray.shape[0], int(tile_height * search_ratio)
+    cuts, top = [], 0
+    # 剩余部分不超过 tile_height + window 时作为最后一块，不再切出过矮的尾块
+    while height - top > tile_height + window:
+        low, high = top + tile_height - window, min(top + tile_height + window, height - 1)
+        candidates = np.flatnonzero(score[low:high] <= score[low:high].min() + 1.0) + low
+        cuts.append(int(candidates[np.argmin(np.abs(candidates - (top + tile_height)))]))
+        top = cuts[-1]
+    return cuts
+
+def _write_tile(img, box, path, img_format, lossless):
+    """裁出一块并写入 path。lossless 时保存为 PNG 中间文件 (多规格模式会再统一编码)，否则直接在大小预算内编码。"""
+    checkpoint()
+    tile = img.crop(box)
+    if lossless:
+        tile.save(path, format='PNG')
+        return True
+    data, fits = encode_within_size(tile, img_format)
+    with open(path, 'wb') as f:
+        f.write(data)
+    incr('images_encoded')
+    incr('bytes_written', len(data))
+    state = "🗜️" if fits else f"❌ 超出{TARGET_SIZE // 1024}KB"
+    print(f"{state} {os.path.basename(path)} ({box[3] - box[1]}px) => {len(data) // 1024}KB")
+    return fits
+
+def split_tall_image(image_path, tile_height=TILE_HEIGHT, lossless=False):
+    """
+    把过高的切图缩放到目标宽度后切成多块，保存为 <原名>__tileNNN.<扩展名> 并删除原图；
+    各块在线程池中并行编码。返回生成的文件列表，无需切分或出错时返回空列表 (原图保持不变，已写出的块会被删除，
+    否则重命名时原图和切块会一起编号，页面内容重复)。任务被取消时同样清理切块并继续抛出 TaskCancelled。
+    """
+    paths = []
+    try:
+        img = Image.open(image_path)
+        scaled_height = img.height * TARGET_WIDTH // img.width if needs_resize(img.width) else img.height
+        if scaled_height <= LONG_IMAGE_HEIGHT:
+            img.close()
+            return []
+
+        img_format = img.format if img.format else 'JPEG'
+        img = resize_image(prepare_draft(img), image_path)
+        if img.mode == 'RGBA' and image_path.lower().endswith(('.jpg', '.jpeg')):
+            img = img.convert('RGB')
+        img.load()
+
+        rows = [0] + find_cut_rows(img, tile_height) + [img.height]
+        stem, extension = os.path.splitext(image_path)
+        extension = '.png' if lossless else extension
+        paths = [f"{stem}__tile{n:03d}{extension}" for n in range(1, len(rows))]
+        boxes = [(0, top, img.width, bottom) for top, bottom in zip(rows, rows[1:])]
+        print(f"✂️ 长图切块：{os.path.basename(image_path)} ({img.width}x{img.height}) -> {len(paths)} 块")
+
+        pool = ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix='slice-tile')
+        try:
+            futures = [submit(pool, _write_tile, img, box, path, img_format, lossless) for box, path in zip(boxes, paths)]
+            for future in futures:
+                future.result()
+        finally:
+            # 出错时不再开始排队中的块，但要等正在写的块结束，之后的清理才不会漏掉文件
+            pool.shutdown(wait=True, cancel_futures=True)
+        os.remove(image_path)
+        incr('images_tiled')
+        incr('tiles_written', len(paths))
+        return paths
+    except TaskCancelled:
+        _remove_tiles(paths)
+        raise
+    except Exception as e:
+        _remove_tiles(paths)
+        print(f"⚠️ 长图切块失败，按原图处理 {os.path.basename(image_path)}：{e}")
+        return []
+
+def _remove_tiles(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def split_tall_images_in_folder(folder_path, tile_height=TILE_HEIGHT, lossless=False):
+    for file in sorted(os.listdir(folder_path), key=natural_sort_key):
+        if file.lower().endswith(SUPPORTED_EXTENSIONS):
+            checkpoint()
+            split_tall_image(os.path.join(folder_path, file), tile_height, lossless)
+
 # 以下函数保持不变
 def rename_images_in_folder(folder_path):
     images = []
@@ -137,20 +331,35 @@ def rename_images_in_folder(folder_path):
         os.rename(temp_path, new_path)
         print(f"🔄 重命名: {os.path.basename(temp_path)} -> {index}{extension}")
 
-def compress_images_in_folder(folder_path):
+def compress_images_in_folder(folder_path, renditions=None):
     for file in os.listdir(folder_path):
         if file.lower().endswith(SUPPORTED_EXTENSIONS):
+            # 每张图片之间检查任务是否已被取消或超时
+            checkpoint()
             # 注意：这里我们是直接在原文件上操作的，不需要返回值
-            compress_image(os.path.join(folder_path, file))
+            if renditions:
+                render_slice(os.path.join(folder_path, file), renditions)
+            else:
+                compress_image(os.path.join(folder_path, file))
 
-def process_slice_folder(folder_path):
-    """对指定文件夹执行重命名和压缩的核心函数"""
+def process_slice_folder(folder_path, renditions=None, tile_height=None):
+    """
+    对指定文件夹执行重命名和压缩的核心函数。
+    renditions 为空时保持原有行为 (每张切图输出一张 750px、150KB 以内的图片)；
+    传入规格列表 (例如 DEFAULT_RENDITIONS) 时为每张切图输出多种格式/尺寸。
+    tile_height 不为空时先把过高的长图切成约该高度的多块，各块与其它切图一起按顺序编号。
+    """
+    if tile_height:
+        print("---")
+        print("✂️ 开始检查并切分长图...")
+        # 切块已在预算内编码，后面的压缩步骤会直接跳过；多规格模式下先存为无损 PNG，由 render_slice 统一编码
+        split_tall_images_in_folder(folder_path, tile_height, lossless=bool(renditions))
     print("---")
     print("🔄 开始重命名图片...")
     rename_images_in_folder(folder_path)
     print("---")
     print("🗜️ 开始调整尺寸和压缩图片...")
-    compress_images_in_folder(folder_path)
+    compress_images_in_folder(folder_path, renditions)
     print("---")
     print("🎉 所有图片处理完成！")
     return True
\ No newline at end of file
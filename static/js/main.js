@@ -79,6 +79,23 @@ function startPolling(taskId, statusUrlBase, progressBar, progressStatus, submit
     const url = statusUrlBase.replace('_TASK_ID_', taskId);
     let pollingInterval; // 使用局部变量存储 Interval ID
 
+    // 取消按钮：任务执行期间显示，点击后后台会在下一个安全点停止任务
+    const progressArea = progressStatus.parentElement;
+    let cancelButton = progressArea.querySelector('.cancel-btn');
+    if (!cancelButton) {
+        cancelButton = document.createElement('button');
+        cancelButton.type = 'button';
+        cancelButton.className = 'cancel-btn';
+        cancelButton.textContent = '取消任务';
+        progressArea.appendChild(cancelButton);
+    }
+    cancelButton.style.display = 'inline-block';
+    cancelButton.disabled = false;
+    cancelButton.onclick = function () {
+        cancelButton.disabled = true;
+        fetch(url.replace('/status/', '/cancel/'), { method: 'POST' });
+    };
+
     // 定义任务结束处理函数
     const handleTaskEnd = (isSuccess, message, downloadUrl = null) => {
         const originalButtonText = submitButton.closest('form').id === 'data-form' ? '开始处理并更新' : '开始处理并下载';
@@ -87,6 +104,7 @@ function startPolling(taskId, statusUrlBase, progressBar, progressStatus, submit
 
         // 确保清除之前的 Interval
         if (pollingInterval) clearInterval(pollingInterval);
+        cancelButton.style.display = 'none';
 
         if (isSuccess) {
             progressBar.style.backgroundColor = '#4CAF50'; // 绿色
@@ -117,12 +135,12 @@ function startPolling(taskId, statusUrlBase, progressBar, progressStatus, submit
                 progressStatus.textContent = status;
 
                 // 重置进度条颜色为默认（处理中）
-                if (result !== 'success' && result !== 'error') {
+                if (result !== 'success' && result !== 'error' && result !== 'cancelled') {
                     progressBar.style.backgroundColor = '#2196F3'; // 蓝色
                 }
 
 
-                if (result === 'success' || result === 'error') {
+                if (result === 'success' || result === 'error' || result === 'cancelled') {
                     // 停止轮询，调用结束处理
                     handleTaskEnd(result === 'success', status, data.download_url);
                 }
@@ -0,0 +1,147 @@
+# storage_manager.py (uploads/ 与 outputs/ 的产物生命周期管理)
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from werkzeug.utils import secure_filename
+
+# 正在被后台任务使用的路径，清理线程不会删除它们
+_active_paths = set()
+_active_lock = threading.Lock()
+_sweeper_thread = None
+
+
+def task_upload_dir(upload_root, task_id):
+    """为每个任务创建独立的上传目录 uploads/<task_id>/，彻底避免同名文件互相覆盖。"""
+    path = os.path.join(upload_root, task_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def safe_stem(filename, default='upload'):
+    """secure_filename 会丢掉中文字符，文件名被清空时使用默认名。"""
+    stem = os.path.splitext(secure_filename(filename or ''))[0]
+    return stem or default
+
+
+def unique_output_name(prefix, original_name, extension, task_id=None):
+    """生成带任务短ID的输出文件名，例如 processed_slices_1a2b3c4d.zip / processed_paste_1a2b3c4d.xlsx"""
+    short_id = (task_id or uuid.uuid4().hex).replace('-', '')[:8]
+    parts = [prefix]
+    if original_name:
+        parts.append(safe_stem(original_name, 'result'))
+    parts.append(short_id)
+    return '_'.join(parts) + extension
+
+
+def mark_active(path):
+    with _active_lock:
+        _active_paths.add(os.path.abspath(path))
+
+
+def release(path, delete=False):
+    """任务结束时释放路径；delete=True 时顺带删除（用于上传的中间文件）。"""
+    abs_path = os.path.abspath(path)
+    with _active_lock:
+        _active_paths.discard(abs_path)
+    if delete:
+        remove_path(abs_path)
+
+
+def is_active(path):
+    with _active_lock:
+        return os.path.abspath(path) in _active_paths
+
+
+def remove_path(path):
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        print(f"⚠️ 删除 {path} 失败: {e}")
+
+
+def get_path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def list_entries(folder):
+    """列出目录下的顶层条目 (文件或任务子目录)，返回 [(path, mtime, size)]，按时间从旧到新排序。"""
+    entries = []
+    if not os.path.isdir(folder):
+        return entries
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            entries.append((path, os.path.getmtime(path), get_path_size(path)))
+        except OSError:
+            continue
+    entries.sort(key=lambda e: e[1])
+    return entries
+
+
+def sweep_expired(folder, ttl_seconds, now=None):
+    """删除超过 TTL 的条目，跳过正在使用的路径。返回删除的数量。"""
+    now = now or time.time()
+    removed = 0
+    for path, mtime, _ in list_entries(folder):
+        if now - mtime > ttl_seconds and not is_active(path):
+            remove_path(path)
+            removed += 1
+    return removed
+
+
+def enforce_quota(folder, max_bytes):
+    """目录总大小超过配额时，从最旧的条目开始删除，直到回到配额以内。返回删除的数量。"""
+    entries = list_entries(folder)
+    total = sum(size for _, _, size in entries)
+    removed = 0
+    for path, _, size in entries:
+        if total <= max_bytes:
+            break
+        if is_active(path):
+            continue
+        remove_path(path)
+        total -= size
+        removed += 1
+    return removed
+
+
+def sweep_once(folders, ttl_seconds, quota_bytes):
+    for folder in folders:
+        expired = sweep_expired(folder, ttl_seconds)
+        over_quota = enforce_quota(folder, quota_bytes) if quota_bytes else 0
+        if expired or over_quota:
+            print(f"🧹 清理 {os.path.basename(folder)}/: 过期 {expired} 项，超配额 {over_quota} 项")
+
+
+def start_sweeper(folders, ttl_seconds, quota_bytes, interval_seconds):
+    """启动后台清理线程 (守护线程，进程内只启动一次)。"""
+    global _sweeper_thread
+    if _sweeper_thread is not None and _sweeper_thread.is_alive():
+        return _sweeper_thread
+
+    def loop():
+        while True:
+            try:
+                sweep_once(folders, ttl_seconds, quota_bytes)
+            except Exception as e:
+                print(f"⚠️ 存储清理线程出错: {e}")
+            time.sleep(interval_seconds)
+
+    _sweeper_thread = threading.Thread(target=loop, name='storage-sweeper', daemon=True)
+    _sweeper_thread.start()
+    return _sweeper_thread
@@ -0,0 +1,202 @@
+# sync_state.py (Mode A 增量同步：每个表格的行指纹与上次使用的 Drive 文件列表版本)
+#
+# 状态按表格保存为 <state_dir>/<spreadsheet_id>.json:
+#   {"listing_version": "...", "link_columns": [...], "link_format": {...}, "rows": [["SKU", "指纹"], ...], "updated_at": "..."}
+# rows 按行的位置记录 (没有 SKU 的行为 null)，重复的 SKU 各自占一行；SKU 统一经过 normalize_sku。
+# 再次同步时只重新查找：新增、移动或被修改过的行；以及上次缺图、而 Drive 文件列表已经变化的行
+# (文件列表变化时，也会检查已填链接指向的文件是否还存在)。
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+# 同一个表格的同步串行执行，避免两个任务同时读写同一份状态
+_sheet_locks = {}
+_locks_guard = threading.Lock()
+
+_FILE_ID_PATTERN = re.compile(r'/d/([A-Za-z0-9_-]+)')
+# 没有记录链接格式的旧状态文件，其链接都是默认地址的原图链接
+LEGACY_LINK_FORMAT = {'base': 'https://lh3.googleusercontent.com/d/', 'sizes': {}}
+
+
+def sheet_lock(spreadsheet_id):
+    with _locks_guard:
+        return _sheet_locks.setdefault(spreadsheet_id, threading.Lock())
+
+
+def _state_path(state_dir, spreadsheet_id):
+    return os.path.join(state_dir, f"{re.sub(r'[^A-Za-z0-9_-]', '_', spreadsheet_id)}.json")
+
+
+def load_state(state_dir, spreadsheet_id):
+    """读取表格的同步状态；不存在或已损坏时返回空状态 (相当于第一次同步)。"""
+    try:
+        with open(_state_path(state_dir, spreadsheet_id), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {'listing_version': None, 'rows': []}
+    except (ValueError, OSError) as e:
+        print(f"⚠️ 同步状态文件损坏，将执行完整同步: {e}")
+        return {'listing_version': None, 'rows': []}
+    if isinstance(state.get('rows'), dict):
+        # 旧版状态按 SKU 记录，区分不了重复 SKU 的行，当作没有历史 (下次同步整表覆写)
+        state['rows'] = []
+    return state
+
+
+def save_state(state_dir, spreadsheet_id, state):
+    """先写临时文件再替换，进程中途退出也不会留下半个 JSON。"""
+    os.makedirs(state_dir, exist_ok=True)
+    path = _state_path(state_dir, spreadsheet_id)
+    state['updated_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def listing_version(image_index):
+    """Drive 文件列表的版本号：对 (列名, 文件名, file_id) 做哈希，任何文件增删改名都会改变版本。"""
+    digest = hashlib.sha1()
+    for column in sorted(image_index or {}):
+        for name, file_id in sorted(image_index[column].items()):
+            digest.update(f"{column}\t{name}\t{file_id}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _file_id(link):
+    match = _FILE_ID_PATTERN.search(link)
+    return match.group(1) if match else None
+
+
+def row_fingerprint(sku, links):
+    return hashlib.sha1('\t'.join([sku, *links]).encode('utf-8')).hexdigest()[:16]
+
+
+def _row_links(df, link_columns):
+    """每一行各链接列的当前值 (缺列或空值记为空字符串)。"""
+    from frame_utils import text_values
+
+    columns = []
+    for column in link_columns:
+        if column in df.columns:
+            columns.append(text_values(df[column]))
+        else:
+            columns.append([''] * len(df))
+    return list(zip(*columns)) if columns else [()] * len(df)
+
+
+def _normalized_skus(df):
+    from frame_utils import text_values
+    from google_drive_finder import normalize_sku
+
+    return text_values(df['model_sku'], normalize_sku)
+
+
+def state_skus(state):
+    """状态中记录过的所有 SKU (去重)。"""
+    return {row[0] for row in state.get('rows', []) if row}
+
+
+def rows_to_refresh(df, state, version, image_index, link_columns):
+    """
+    返回需要重新查找图片链接的行号 (DataFrame 的位置下标)。
+    未变化、且链接已齐全 (或文件列表没有变化) 的行会被跳过。
+    """
+    skus = _normalized_skus(df)
+    listing_changed = version != state.get('listing_version') or list(link_columns) != state.get('link_columns')
+    known_ids = None
+    if listing_changed:
+        known_ids = {file_id for file_map in (image_index or {}).values() for file_id in file_map.values()}
+
+    previous = state.get('rows', [])
+    refresh = []
+    for position, (sku, links) in enumerate(zip(skus, _row_links(df, link_columns))):
+        if not sku:
+            continue
+        old = previous[position] if position < len(previous) else None
+        if old != [sku, row_fingerprint(sku, links)]:
+            refresh.append(position)  # 新增或移动过的行，或者 SKU / 链接在表格中被改动过
+        elif listing_changed:
+            missing = any(not link for link in links)
+            stale = any(link and _file_id(link) not in known_ids for link in links)
+            if missing or stale:
+                refresh.append(position)
+    return refresh
+
+
+def remember(df, state, version, link_columns, link_format=None):
+    """同步完成后记录每一行的指纹和本次使用的文件列表版本。"""
+    skus = _normalized_skus(df)
+    state['rows'] = [
+        [sku, row_fingerprint(sku, links)] if sku else None
+        for sku, links in zip(skus, _row_links(df, link_columns))
+    ]
+    state['listing_version'] = version
+    state['link_columns'] = list(link_columns)
+    state['link_format'] = link_format
+    return state
+
+
+def sync_image_links(spreadsheet_id, df, project_config, creds, state_dir, full_sync=False, image_index=None):
+    """
+    Mode A 的同步主流程：df 为刚从表格读出的数据 (已有 model_sku 列)。
+    有历史状态时只为需要的行重新查找链接，并只回写变化的单元格；第一次同步、强制完整同步
+    或表格中还没有链接列时，退回到整表覆写。返回本次同步的摘要。
+    image_index 可以由调用方预先构建 (例如批量或监听任务共享同一份文件列表)。
+    """
+    from frame_utils import factorize_text, text_values
+    from google_drive_finder import build_image_index, apply_image_links, match_image_links, normalize_sku, project_link_format, update_google_sheet, update_sheet_cells
+    from task_metrics import incr
+
+    with sheet_lock(spreadsheet_id):
+        if image_index is None:
+            image_index = build_image_index(project_config, creds)
+        if image_index is None:
+            return {'mode': 'skipped', 'refreshed': 0, 'skipped': len(df),
+                    'warning': '在Google Drive中找不到项目文件夹或图片来源文件夹，未更新图片链接。'}
+
+        link_columns = list(image_index)
+        link_format = project_link_format(project_config)
+        version = listing_version(image_index)
+        state = {'listing_version': None, 'rows': []} if full_sync else load_state(state_dir, spreadsheet_id)
+        # 链接格式 (尺寸后缀 / 地址) 改变时所有已有链接都要重写，退回整表同步
+        incremental = (bool(state.get('rows')) and all(column in df.columns for column in link_columns)
+                       and state.get('link_format', LEGACY_LINK_FORMAT) == link_format)
+
+        if not incremental:
+            final_df = apply_image_links(df, image_index, link_format)
+            if not update_google_sheet(spreadsheet_id, final_df, creds):
+                raise ValueError("回写数据失败。")
+            save_state(state_dir, spreadsheet_id, remember(final_df, state, version, link_columns, link_format))
+            incr('rows_refreshed', len(final_df))
+            return {'mode': 'full', 'refreshed': len(final_df), 'skipped': 0}
+
+        refresh = rows_to_refresh(df, state, version, image_index, link_columns)
+        incr('rows_refreshed', len(refresh))
+        incr('rows_skipped', len(df) - len(refresh))
+        cells = []
+        if refresh:
+            # 只对需要刷新的行查找链接，不复制这些行；链接列可能是 category，改动后整列换成普通字符串列表
+            codes, skus = factorize_text(df['model_sku'].iloc[refresh], normalize_sku)
+            looked_up = match_image_links(codes, skus, image_index, link_format)
+            for column in link_columns:
+                col_index = df.columns.get_loc(column)
+                values = text_values(df[column])
+                changed = False
+                for position, new in zip(refresh, looked_up[column].tolist()):
+                    if values[position] != new:
+                        cells.append((position, col_index, new))
+                        values[position] = new
+                        changed = True
+                if changed:
+                    df.isetitem(col_index, values)
+
+        sheet_title = df.attrs.get('sheet_title', 'Sheet1')
+        if not update_sheet_cells(spreadsheet_id, sheet_title, cells, creds):
+            raise ValueError("回写数据失败。")
+        save_state(state_dir, spreadsheet_id, remember(df, state, version, link_columns, link_format))
+        return {'mode': 'incremental', 'refreshed': len(refresh), 'skipped': len(df) - len(refresh), 'cells_written': len(cells)}
@@ -0,0 +1,118 @@
+# task_control.py (后台任务的协作式取消与阶段时限)
+#
+# 每个任务有一个取消令牌，与 task_metrics 一样放在 contextvar 中，submit()/run_in_context() 派生的线程也能看到。
+# 耗时的循环在安全点调用 checkpoint() (每张图片之间、每次 Drive / Sheets 请求之前)：
+# 任务已被取消，或某个进行中的阶段超过了时限时抛出 TaskCancelled，任务函数按失败处理并清理中间文件。
+# 进行中的阶段由 task_metrics.timed_stage 记录在 task['active_stages']，时限按阶段名配置，例如 {'slice_processing': 900}。
+# 阻塞在网络调用里的线程无法被打断；等待它的一方改用 wait()/result() 轮询，取消后立即返回，不必等到 socket 超时。
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import wait as wait_futures
+
+POLL_SECONDS = 0.5
+
+_current_token = contextvars.ContextVar('cancel_token', default=None)
+# task_id -> 令牌 {'event': Event, 'reason': str, 'timed_out': bool, 'task': 任务状态, 'deadlines': {阶段: 秒}}
+_tokens = {}
+_lock = threading.Lock()
+
+
+class TaskCancelled(Exception):
+    """任务被取消，或某个阶段超过了时限。"""
+
+
+def register(task_id):
+    """创建任务时登记令牌，这样任务线程真正开始执行之前也可以取消。"""
+    with _lock:
+        return _tokens.setdefault(task_id, {'event': threading.Event(), 'reason': None, 'timed_out': False})
+
+
+def bind(task_id, task, deadlines=None):
+    """在任务线程中绑定令牌，之后本线程 (及继承上下文的子线程) 的 checkpoint() 都检查这个任务。"""
+    token = register(task_id)
+    token.update(task=task, deadlines=dict(deadlines or {}))
+    _current_token.set(token)
+    return token
+
+
+def release(task_id):
+    with _lock:
+        _tokens.pop(task_id, None)
+
+
+def cancel(task_id, reason='用户取消'):
+    """请求取消任务，返回是否找到了尚未结束的任务。任务会在下一个安全点停止。"""
+    with _lock:
+        token = _tokens.get(task_id)
+    if token is None:
+        return False
+    token['reason'] = token['reason'] or reason
+    token['event'].set()
+    return True
+
+
+def _overdue_stage(token):
+    now = time.time()
+    for stage, started_at in list(token.get('task', {}).get('active_stages', {}).items()):
+        limit = token.get('deadlines', {}).get(stage)
+        if limit and now - started_at > limit:
+            return f"阶段 '{stage}' 超过时限 ({limit} 秒)"
+    return None
+
+
+def checkpoint():
+    """安全点：任务已取消或超时则抛出 TaskCancelled。没有绑定令牌 (例如命令行批处理) 时什么也不做。"""
+    token = _current_token.get()
+    if token is None:
+        return
+    if not token['event'].is_set():
+        overdue = _overdue_stage(token)
+        if overdue is None:
+            return
+        token.update(reason=overdue, timed_out=True)
+        token['event'].set()
+    raise TaskCancelled(token['reason'])
+
+
+@contextmanager
+def uninterruptible():
+    """
+    在这段代码中屏蔽 checkpoint() (重试间隔的 sleep 也不再可取消)，用于开始后就必须完成的操作，
+    例如清空表格并写入第一块数据：中途停止会留下一张空白的表格。取消请求会保留，离开后的下一个安全点照常生效。
+    """
+    token = _current_token.set(None)
+    try:
+        yield
+    finally:
+        _current_token.reset(token)
+
+
+def sleep(seconds):
+    """可取消的 time.sleep，用于重试间隔。"""
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+        return
+    end = time.monotonic() + seconds
+    while True:
+        checkpoint()
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            return
+        token['event'].wait(min(remaining, POLL_SECONDS))
+
+
+def wait(event):
+    """等待 threading.Event，期间定期检查取消。"""
+    while not event.wait(POLL_SECONDS):
+        checkpoint()
+
+
+def result(future):
+    """等待线程池任务的结果，期间定期检查取消；取消后不再等待仍卡在网络调用中的工作线程。"""
+    while not wait_futures([future], timeout=POLL_SECONDS).done:
+        checkpoint()
+    return future.result()
@@ -0,0 +1,175 @@
+# task_metrics.py (后台任务的阶段耗时、计数器、Prometheus 导出与可选的性能剖析)
+
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 当前线程正在执行的任务状态字典；子线程需要通过 submit()/run_in_context() 继承
+_current_task = contextvars.ContextVar('current_task', default=None)
+_lock = threading.Lock()
+
+
+def bind(task, kind):
+    """把任务状态字典绑定到当前执行上下文，之后 incr() 等调用都会记到这个任务上。"""
+    task['kind'] = kind
+    task.setdefault('counters', {})
+    task.setdefault('timings', {})
+    task.setdefault('spans', [])
+    task.setdefault('started_at', time.time())
+    _current_task.set(task)
+    return task
+
+
+def current_task():
+    return _current_task.get()
+
+
+def incr(name, amount=1):
+    """给当前任务的计数器加值 (API 调用次数、重试次数、翻页数、写出字节数、编码图片数等)。没有绑定任务时忽略。"""
+    task = _current_task.get()
+    if task is None or not amount:
+        return
+    with _lock:
+        counters = task.setdefault('counters', {})
+        counters[name] = counters.get(name, 0) + amount
+
+
+@contextmanager
+def timed_stage(task, stage):
+    """
+    记录一个阶段的耗时 (秒)，写入任务状态的 task['timings'][stage]，前端轮询 /status 时即可看到。
+    同时在 task['spans'] 中追加一条 {stage, offset, seconds}，offset 为相对任务开始的秒数，便于看出阶段间的重叠。
+    执行期间阶段登记在 task['active_stages'] 中 (阶段名 -> 开始时间)，task_control 据此检查阶段时限。
+    """
+    start = time.perf_counter()
+    started_at = time.time()
+    with _lock:
+        task.setdefault('active_stages', {})[stage] = started_at
+    try:
+        yield
+    finally:
+        elapsed = round(time.perf_counter() - start, 3)
+        with _lock:
+            task['active_stages'].pop(stage, None)
+            task.setdefault('timings', {})[stage] = elapsed
+            offset = round(started_at - task.get('started_at', started_at), 3)
+            task.setdefault('spans', []).append({'stage': stage, 'offset': offset, 'seconds': elapsed})
+
+
+def timed_call(task, stage, func, *args, **kwargs):
+    """timed_stage 的函数形式，便于直接提交到线程池。"""
+    with timed_stage(task, stage):
+        return func(*args, **kwargs)
+
+
+def submit(executor, func, *args, **kwargs):
+    """向线程池提交任务，并让子线程继承当前的任务上下文 (计数器仍记到同一个任务上)。"""
+    context = contextvars.copy_context()
+    return executor.submit(context.run, func, *args, **kwargs)
+
+
+def run_in_context(func):
+    """包装一个将在新线程中运行的函数，使其继承当前的任务上下文 (同一个 Context 不能被多个线程同时进入，每个线程单独包装一次)。"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+@contextmanager
+def profile_task(task, output_dir, name):
+    """
+    按需对任务做性能剖析 (task['profile'] 为真时)，结果保存到 output_dir：
+    安装了 pyinstrument 时输出 HTML 火焰图，否则使用 cProfile 输出 .prof 文件 (可用 snakeviz 查看)。
+    只采样执行任务的主线程。
+    """
+    if not task.get('profile'):
+        yield
+        return
+
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            filename = f"profile_{name}.html"
+            with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            task['profile_file'] = filename
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            filename = f"profile_{name}.prof"
+            profiler.dump_stats(os.path.join(output_dir, filename))
+            task['profile_file'] = filename
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def render_prometheus(task_list):
+    """把所有任务的状态汇总为 Prometheus 文本格式 (text/plain; version=0.0.4)。"""
+    tasks_total = defaultdict(int)
+    in_progress = defaultdict(int)
+    stage_seconds = defaultdict(float)
+    stage_runs = defaultdict(int)
+    events = defaultdict(int)
+
+    with _lock:
+        for task in task_list:
+            kind = task.get('kind', 'unknown')
+            result = task.get('result')
+            if result:
+                tasks_total[(kind, result)] += 1
+            else:
+                in_progress[kind] += 1
+            for stage, seconds in task.get('timings', {}).items():
+                stage_seconds[(kind, stage)] += seconds
+                stage_runs[(kind, stage)] += 1
+            for name, value in task.get('counters', {}).items():
+                events[(kind, name)] += value
+
+    lines = [
+        '# HELP workbench_tasks_total Finished background tasks by kind and result.',
+        '# TYPE workbench_tasks_total counter',
+    ]
+    lines += [f'workbench_tasks_total{_labels(kind=k, result=r)} {v}' for (k, r), v in sorted(tasks_total.items())]
+    lines += [
+        '# HELP workbench_tasks_in_progress Background tasks that have not finished yet.',
+        '# TYPE workbench_tasks_in_progress gauge',
+    ]
+    lines += [f'workbench_tasks_in_progress{_labels(kind=k)} {v}' for k, v in sorted(in_progress.items())]
+    lines += [
+        '# HELP workbench_stage_seconds_total Total seconds spent in each task stage.',
+        '# TYPE workbench_stage_seconds_total counter',
+    ]
+    lines += [f'workbench_stage_seconds_total{_labels(kind=k, stage=s)} {v:.3f}' for (k, s), v in sorted(stage_seconds.items())]
+    lines += [
+        '# HELP workbench_stage_runs_total Number of times each task stage has run.',
+        '# TYPE workbench_stage_runs_total counter',
+    ]
+    lines += [f'workbench_stage_runs_total{_labels(kind=k, stage=s)} {v}' for (k, s), v in sorted(stage_runs.items())]
+    lines += [
+        '# HELP workbench_events_total Task counters such as API calls, retries, pages fetched and bytes written.',
+        '# TYPE workbench_events_total counter',
+    ]
+    lines += [f'workbench_events_total{_labels(kind=k, name=n)} {v}' for (k, n), v in sorted(events.items())]
+    return '\n'.join(lines) + '\n'
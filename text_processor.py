@@ -2,6 +2,8 @@ import pandas as pd
 import io
 import re
 
+from frame_utils import compact_frame
+
 def parse_pasted_data(text_content):
     """
     解析从 Excel 粘贴的文本数据 (TSV格式)。
@@ -12,16 +14,16 @@ def parse_pasted_data(text_content):
 
     try:
         # 使用 pandas 的 read_csv 读取 tab 分隔符的数据
-        df = pd.read_csv(io.StringIO(text_content), sep='\t', dtype=str)
+        # keep_default_na=False: 空单元格直接读成空字符串，不必再 fillna('') 复制整表
+        df = pd.read_csv(io.StringIO(text_content), sep='\t', dtype=str, keep_default_na=False)
         
         # 清理列名（去除前后空格）
         df.columns = df.columns.str.strip()
         
-        # 清理数据（去除前后空格，替换 NaN 为空字符串）
-        df = df.fillna('')
-        for col in df.columns:
-            if df[col].dtype == 'object':
-                df[col] = df[col].str.strip()
+        # 清理数据（去除前后空格），重复度高的列转为 category
+        for position in range(df.shape[1]):
+            df.isetitem(position, df.iloc[:, position].str.strip())
+        compact_frame(df)
                 
         print(f"成功解析粘贴数据，共 {len(df)} 行，列名: {list(df.columns)}")
         return df
@@ -57,7 +59,7 @@ def process_local_data(df):
     if sku_col:
         print(f"识别到 SKU 列为: '{sku_col}'")
         # 统一重命名为内部使用的 'model_sku'
-        df = df.rename(columns={sku_col: 'model_sku'})
+        df.rename(columns={sku_col: 'model_sku'}, inplace=True)
     else:
         print("警告: 无法自动识别 SKU 列，后续图片匹配可能失败。请确保粘贴的数据包含 'SKU' 或 '商品SKU' 列。")
 
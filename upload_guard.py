@@ -0,0 +1,166 @@
+# upload_guard.py (上传文件的流式落盘、大小限制与 ZIP 炸弹防护)
+
+import os
+import stat
+import tempfile
+import zipfile
+
+CHUNK_SIZE = 1024 * 1024  # 1MB
+INCOMING_PREFIX = '.incoming_'
+
+
+class UploadRejected(ValueError):
+    """上传文件不符合限制时抛出，消息可直接展示给用户。"""
+
+
+def spool_file(upload_root):
+    """
+    供 Werkzeug 解析 multipart 时使用的落盘文件。
+    直接写在 uploads/ 下，保存时只需 os.replace 到任务目录，避免“临时文件 -> 目标文件”的二次拷贝。
+    """
+    os.makedirs(upload_root, exist_ok=True)
+    return tempfile.NamedTemporaryFile('wb+', dir=upload_root, prefix=INCOMING_PREFIX, delete=False)
+
+
+def save_upload_stream(file_storage, dest_path, max_bytes):
+    """
+    将上传文件保存到 dest_path，返回写入的字节数。
+    如果 Werkzeug 已经把它落盘到同一磁盘，则直接重命名；否则按块拷贝并在超限时立刻中止。
+    """
+    stream = file_storage.stream
+    spooled_path = getattr(stream, 'name', None)
+    if isinstance(spooled_path, str) and os.path.basename(spooled_path).startswith(INCOMING_PREFIX):
+        stream.flush()
+        size = os.fstat(stream.fileno()).st_size
+        stream.close()
+        if size > max_bytes:
+            os.remove(spooled_path)
+            raise UploadRejected(f"文件过大 ({size // 1024 // 1024}MB)，上限为 {max_bytes // 1024 // 1024}MB。")
+        os.replace(spooled_path, dest_path)
+        return size
+
+    written = 0
+    try:
+        with open(dest_path, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadRejected(f"文件过大，上限为 {max_bytes // 1024 // 1024}MB。")
+                out.write(chunk)
+    except UploadRejected:
+        os.remove(dest_path)
+        raise
+    return written
+
+
+def discard_spooled(files):
+    """请求结束时删除未被 save_upload_stream 认领的落盘文件 (例如表单校验失败提前返回的请求)。"""
+    for file_storage in files.values():
+        spooled_path = getattr(file_storage.stream, 'name', None)
+        if isinstance(spooled_path, str) and os.path.basename(spooled_path).startswith(INCOMING_PREFIX):
+            file_storage.stream.close()
+            if os.path.exists(spooled_path):
+                os.remove(spooled_path)
+
+
+def inspect_zip_archive(zip_path, max_entries, max_total_bytes, max_ratio):
+    """
+    只读取 ZIP 的中央目录 (不解压任何数据)，检查条目数、解压后总大小、单个条目的压缩比以及路径穿越。
+    返回 (条目数, 解压后总字节数)。
+    """
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as zf:
+            infos = zf.infolist()
+    except zipfile.BadZipFile:
+        raise UploadRejected("ZIP 文件已损坏或不是有效的 ZIP 格式。")
+
+    if len(infos) > max_entries:
+        raise UploadRejected(f"ZIP 内文件过多 ({len(infos)} 个)，上限为 {max_entries} 个。")
+
+    total = 0
+    for info in infos:
+        name = info.filename.replace('\\', '/')
+        if name.startswith('/') or ':' in name.split('/')[0] or '..' in name.split('/'):
+            raise UploadRejected(f"ZIP 内包含非法路径: {info.filename}")
+        if stat.S_ISLNK(info.external_attr >> 16):
+            raise UploadRejected(f"ZIP 内包含符号链接: {info.filename}")
+        total += info.file_size
+        if info.compress_size and info.file_size / info.compress_size > max_ratio:
+            raise UploadRejected(f"ZIP 内文件压缩比异常 ({info.filename})，疑似 ZIP 炸弹。")
+
+    if total > max_total_bytes:
+        raise UploadRejected(f"ZIP 解压后总大小 {total // 1024 // 1024}MB 超过上限 {max_total_bytes // 1024 // 1024}MB。")
+    return len(infos), total
+
+
+def inspect_workbook(path, required_sheets=(), required_columns=None, header_row=0):
+    """
+    以只读流式模式打开 .xlsx，只读取工作表目录和表头所在的那一行 (不加载数据)，检查项目配置要求的工作表与列。
+    header_row 为表头行号 (从 0 开始，同 pandas 的 header)，也可以是 {工作表名: 行号}。
+    .xls 无法流式读取，只检查扩展名；未安装 openpyxl 时跳过检查。返回工作簿中的工作表名列表 (跳过检查时为 None)。
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in ('.xlsx', '.xlsm', '.xls'):
+        raise UploadRejected(f"不支持的文件类型 '{extension or '无扩展名'}'，请上传 .xlsx 或 .xls 文件。")
+    if extension == '.xls':
+        return None
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        print("⚠️ 未安装 openpyxl，跳过工作簿预检。")
+        return None
+
+    workbook = None
+    try:
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        sheet_names = workbook.sheetnames
+        missing_sheets = [name for name in required_sheets if name not in sheet_names]
+        if missing_sheets:
+            raise UploadRejected(f"缺少工作表: {', '.join(missing_sheets)} (现有: {', '.join(sheet_names)})")
+
+        for sheet_name, columns in (required_columns or {}).items():
+            if sheet_name not in sheet_names:
+                raise UploadRejected(f"缺少工作表: {sheet_name}")
+            row_index = header_row.get(sheet_name, 0) if isinstance(header_row, dict) else header_row
+            header = next(workbook[sheet_name].iter_rows(min_row=row_index + 1, max_row=row_index + 1, values_only=True), ())
+            present = {str(cell).strip() for cell in header if cell is not None}
+            missing_columns = [column for column in columns if column not in present]
+            if missing_columns:
+                raise UploadRejected(f"工作表 '{sheet_name}' 第 {row_index + 1} 行缺少列: {', '.join(missing_columns)}")
+        return sheet_names
+    except UploadRejected:
+        raise
+    except Exception as e:
+        # 损坏的文件在 openpyxl 中可能抛出各种异常 (BadZipFile、KeyError、TypeError、IndexError、InvalidFileException……)，
+        # 打开和读取表头时出错都按无法读取处理，返回 400 而不是 500
+        raise UploadRejected(f"无法读取的Excel文件，文件可能已损坏或不是有效的 xlsx ({type(e).__name__})。")
+    finally:
+        if workbook is not None:
+            workbook.close()
+
+
+def safe_extract(zip_path, extract_dir, max_total_bytes):
+    """
+    逐个条目流式解压，并按实际写出的字节数再次限额 (中央目录中的大小字段可能被伪造)。
+    """
+    written = 0
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        for info in zf.infolist():
+            target = os.path.join(extract_dir, info.filename)
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with zf.open(info) as src, open(target, 'wb') as dst:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > max_total_bytes:
+                        raise UploadRejected("ZIP 实际解压大小超过上限，已中止解压。")
+                    dst.write(chunk)
+    return written